@@ -0,0 +1,34 @@
+import time
+
+
+def timed(func, repeat=5):
+    """Time a function.
+    :param func: Function to time.
+    :param repeat: Executions.
+    :return: Best and mean duration (seconds).
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        durations.append(time.time() - start)
+    return min(durations), sum(durations) / len(durations)
+
+
+def report(title, columns, rows):
+    """Print a result table.
+    :param title: Table title.
+    :param columns: Column names.
+    :param rows: Rows of values.
+    """
+    print(title)
+    print(' '.join('%14s' % c for c in columns))
+    for row in rows:
+        print(' '.join('%14s' % _format(v) for v in row))
+    print('')
+
+
+def _format(value):
+    if isinstance(value, float):
+        return '%.3f' % value
+    return str(value)
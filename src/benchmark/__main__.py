@@ -0,0 +1,30 @@
+import argparse
+import logging
+from benchmark import fleet, targets
+
+SUITES = {
+    'fleet': fleet.run,
+    'fleet-hysteresis': fleet.run_hysteresis,
+    'fleet-incremental': fleet.run_incremental,
+    'targets': targets.run,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Flotilla benchmarks.')
+    parser.add_argument('suites', nargs='*', metavar='suite',
+                        help='Suites to run: %s (default: all).' %
+                             ', '.join(sorted(SUITES.keys())))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.getLogger('flotilla').setLevel(logging.WARN)
+    for suite in args.suites or sorted(SUITES.keys()):
+        if suite not in SUITES:
+            parser.error('Unknown suite: %s' % suite)
+        SUITES[suite](repeat=args.repeat, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Fleet simulation: bootstrap, churn and recovery of a whole region."""
+from benchmark import report
+from benchmark.simulator import FleetSimulator
+
+# services, agents:
+SCENARIOS = ((20, 200), (100, 1000), (300, 3000))
+CHURN_TICKS = 10
+
+
+def summarize(name, results):
+    ticks = len(results)
+    loop_times = sorted(r.loop_time for r in results)
+    converged = [r for r in results if r.converged]
+    return (name, ticks,
+            results[-1].agents,
+            sum(loop_times) / ticks * 1000,
+            loop_times[-1] * 1000,
+            sum(r.reassigned for r in results),
+            sum(r.moved for r in results),
+            sum(r.avoided for r in results),
+            sum(r.skipped for r in results),
+            sum(r.scheduler_read for r in results) / ticks,
+            sum(r.assignment_read for r in results) / ticks,
+            sum(r.scheduler_write for r in results) / ticks,
+            'yes' if converged else 'no')
+
+
+def run(repeat=1, seed=0, scenarios=SCENARIOS, incremental=False,
+        target_tolerance=0):
+    rows = []
+    for services, agents in scenarios:
+        # Runs are repeated with the same seed, loop times are the best:
+        runs = [simulate(services, agents, seed, incremental,
+                         target_tolerance) for _ in range(max(repeat, 1))]
+        for phase_rows in zip(*runs):
+            row = list(phase_rows[0])
+            row[3] = min(r[3] for r in phase_rows)
+            row[4] = min(r[4] for r in phase_rows)
+            rows.append(tuple(row))
+    report('Fleet simulation (%s scheduling, target tolerance %d; best loop '
+           'ms of %d, capacity units/tick)' %
+           ('incremental' if incremental else 'full', target_tolerance,
+            repeat),
+           ('phase', 'ticks', 'agents', 'loop_mean', 'loop_max',
+            'reassigned', 'moved', 'avoided', 'skipped', 'sched_rcu',
+            'assign_rcu', 'sched_wcu', 'converged'),
+           rows)
+    return rows
+
+
+def simulate(services, agents, seed, incremental, target_tolerance):
+    """Boot a fleet, churn it, let it recover and settle.
+    :return: Summary rows by phase.
+    """
+    simulator = FleetSimulator(
+            services=services, agents=agents, seed=seed,
+            incremental=incremental,
+            scheduler_options={'target_tolerance': target_tolerance})
+    label = '%d/%d' % (services, agents)
+    bootstrap = simulator.run_until_converged()
+    churn = simulator.run(CHURN_TICKS, spawn_rate=0.01, kill_rate=0.01,
+                          fail_rate=0.005,
+                          weight_changes=max(1, services / 20))
+    rows = [summarize('%s boot' % label, bootstrap),
+            summarize('%s churn' % label, churn)]
+    recovery = simulator.run_until_converged()
+    rows.append(summarize('%s recover' % label, recovery))
+    steady = simulator.run(CHURN_TICKS)
+    rows.append(summarize('%s steady' % label, steady))
+    return rows
+
+
+def run_incremental(repeat=1, seed=0):
+    return run(repeat, seed, incremental=True)
+
+
+def run_hysteresis(repeat=1, seed=0):
+    return run(repeat, seed, target_tolerance=1)
@@ -0,0 +1,318 @@
+"""In-process fleet simulator.
+
+Runs a FlotillaScheduler and thousands of virtual FlotillaAgents against
+MemoryTables. Time is virtual: every tick stands for one health/assignment
+interval, dead agents stop heartbeating and expire once INSTANCE_EXPIRY has
+passed in virtual time. Expired items are deleted by the tables a tick later.
+"""
+import logging
+import random
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+import flotilla.agent.db
+import flotilla.model
+import flotilla.scheduler.db
+from flotilla.agent import FlotillaAgent, FlotillaAgentDynamo
+from flotilla.client import FlotillaClientDynamo
+from flotilla.db import DynamoDbLocks
+from flotilla.db.memory import MemoryTable
+from flotilla.db.tables import SCHEMAS, TTL_ATTRIBUTES
+from flotilla.model import FlotillaServiceRevision, FlotillaUnit
+from flotilla.scheduler import FlotillaReaper, FlotillaScheduler, \
+    FlotillaSchedulerDynamo, ServiceChanges
+
+logger = logging.getLogger('flotilla')
+
+TABLES = ('assignments', 'locks', 'regions', 'revisions', 'services',
+          'stacks', 'status', 'units', 'users')
+# Modules whose item times (heartbeats, expiry) follow the virtual clock:
+CLOCK_MODULES = (flotilla.agent.db, flotilla.model, flotilla.scheduler.db)
+
+
+class SimulatedClock(object):
+    """Stands in for the `time` module: wall time, advanced by ticks."""
+
+    def __init__(self):
+        self.offset = 0
+
+    def time(self):
+        return time.time() + self.offset
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+class SimulatedSystemd(object):
+    """Units "start" instantly and keep running."""
+
+    def __init__(self):
+        self._units = []
+        self._active_time = 0
+
+    def set_units(self, units, staged=()):
+        self._units = [unit for unit in units if unit.rev_hash not in staged]
+        self._active_time = time.time()
+
+    def get_unit_status(self):
+        return {unit.full_name: {
+            'load_state': 'loaded',
+            'active_state': 'active',
+            'sub_state': 'running',
+            'active_enter_time': int(self._active_time),
+            'active_exit_time': 0
+        } for unit in self._units}
+
+
+class SimulatedMessaging(object):
+    """Queues agent messages for delivery on the next tick."""
+
+    def __init__(self, simulator, service):
+        self._simulator = simulator
+        self._service = service
+
+    def reschedule(self):
+        self._simulator.messages.append(self._service)
+
+    def service_failure(self, target_rev):
+        self._simulator.failed_deploys += 1
+
+
+class VirtualAgent(object):
+    def __init__(self, simulator, service, instance_id):
+        self.service = service
+        self.instance_id = instance_id
+        tables = simulator.tables
+        db = FlotillaAgentDynamo(instance_id, service, tables['status'],
+                                 tables['assignments'], tables['revisions'],
+                                 tables['units'], None)
+        locks = DynamoDbLocks(instance_id, tables['locks'])
+        self.agent = FlotillaAgent(service, db, locks, SimulatedSystemd(),
+                                   SimulatedMessaging(simulator, service),
+                                   None)
+
+    @property
+    def assigned(self):
+        return bool(self.agent._assignments)
+
+
+class TickResult(object):
+    def __init__(self, tick):
+        self.tick = tick
+        self.agents = 0
+        self.loop_time = 0.0
+        self.reassigned = 0
+        self.moved = 0
+        self.avoided = 0
+        self.skipped = 0
+        self.unassigned = 0
+        self.scheduler_read = 0.0
+        self.scheduler_write = 0.0
+        self.reaped = 0
+        self.expired = 0
+        self.assignment_read = 0.0
+        self.agent_read = 0.0
+        self.agent_write = 0.0
+        self.disturbed = False
+
+    @property
+    def converged(self):
+        return not self.reassigned and not self.unassigned
+
+
+class FleetSimulator(object):
+    def __init__(self, services=100, agents=1000, revisions=2, seed=0,
+                 tick_seconds=15, incremental=False, scheduler_options=None):
+        """
+        :param services: Service count.
+        :param agents: Initial agent count (spread over services).
+        :param revisions: Revisions per service.
+        :param seed: Random seed.
+        :param tick_seconds: Virtual seconds per tick.
+        :param incremental: Feed table writes to the scheduler change feed.
+        :param scheduler_options: Extra FlotillaScheduler arguments.
+        """
+        self._rng = random.Random(seed)
+        self._clock = SimulatedClock()
+        self._tick_seconds = tick_seconds
+        self._tick = 0
+        self._instance_count = 0
+        self.messages = []
+        self.failed_deploys = 0
+        self.results = []
+
+        self.changes = ServiceChanges() if incremental else None
+        stream = self.changes and self.changes.record
+        self.tables = {
+            name: MemoryTable(name, SCHEMAS[name], stream=stream,
+                              ttl_attribute=TTL_ATTRIBUTES.get(name))
+            for name in TABLES}
+        self.client = FlotillaClientDynamo(
+                self.tables['assignments'], self.tables['regions'],
+                self.tables['revisions'], self.tables['services'],
+                self.tables['units'], self.tables['users'], None)
+        self.db = FlotillaSchedulerDynamo(
+                self.tables['assignments'], self.tables['regions'],
+                self.tables['services'], self.tables['stacks'],
+                self.tables['status'])
+        locks = DynamoDbLocks('scheduler', self.tables['locks'])
+        self.scheduler = FlotillaScheduler(self.db, locks,
+                                           changes=self.changes,
+                                           **(scheduler_options or {}))
+        self.scheduler.lock()
+        self.reaper = FlotillaReaper(self.scheduler, self.db,
+                                     interval=tick_seconds)
+
+        self.services = ['service-%03d' % i for i in range(services)]
+        self.revisions = defaultdict(list)
+        for service in self.services:
+            for _ in range(revisions):
+                self.add_revision(service)
+
+        self.agents = []
+        for _ in range(agents):
+            self.spawn()
+
+    def add_revision(self, service, weight=None):
+        revision_number = len(self.revisions[service])
+        unit = FlotillaUnit('%s.service' % service,
+                            'ExecStart=/bin/true %d' % revision_number)
+        revision = FlotillaServiceRevision(
+                label='%s-%d' % (service, revision_number),
+                weight=weight or self._rng.randint(1, 10),
+                units=[unit])
+        self.client.add_revision(service, revision)
+        self.revisions[service].append(revision.revision_hash)
+
+    def spawn(self, service=None):
+        service = service or self._rng.choice(self.services)
+        instance_id = 'i-%08d' % self._instance_count
+        self._instance_count += 1
+        self.agents.append(VirtualAgent(self, service, instance_id))
+
+    def kill(self):
+        if not self.agents:
+            return None
+        return self.agents.pop(self._rng.randrange(len(self.agents)))
+
+    def change_weight(self):
+        service = self._rng.choice(self.services)
+        rev = self._rng.choice(self.revisions[service])
+        self.client.set_revision_weight(service, rev,
+                                        self._rng.randint(1, 10))
+
+    def run(self, ticks, spawn_rate=0.0, kill_rate=0.0, fail_rate=0.0,
+            weight_changes=0):
+        """Run ticks with fleet disturbances.
+        :param ticks: Ticks to run.
+        :param spawn_rate: Agents booted per tick (fraction of fleet).
+        :param kill_rate: Agents terminated and replaced per tick (fraction).
+        :param fail_rate: Agents crashed per tick (fraction).
+        :param weight_changes: Revision weight changes per tick.
+        :return: Tick results.
+        """
+        results = []
+        for _ in range(ticks):
+            fleet = len(self.agents)
+            disturbed = False
+            for _ in range(self._count(fleet * spawn_rate)):
+                self.spawn()
+                disturbed = True
+            for _ in range(self._count(fleet * kill_rate)):
+                agent = self.kill()
+                if agent:
+                    self.spawn(agent.service)
+                    disturbed = True
+            for _ in range(self._count(fleet * fail_rate)):
+                disturbed = self.kill() is not None or disturbed
+            for _ in range(weight_changes):
+                self.change_weight()
+                disturbed = True
+            result = self.tick()
+            result.disturbed = disturbed
+            results.append(result)
+        return results
+
+    def run_until_converged(self, max_ticks=100):
+        results = []
+        for _ in range(max_ticks):
+            result = self.tick()
+            results.append(result)
+            if result.converged:
+                break
+        return results
+
+    def _count(self, expected):
+        """Round a fractional count randomly (keeps the expected value)."""
+        count = int(expected)
+        if self._rng.random() < expected - count:
+            count += 1
+        return count
+
+    def tick(self):
+        self._tick += 1
+        self._clock.offset = self._tick * self._tick_seconds
+        with self._virtual_time():
+            return self._tick_virtual()
+
+    @contextmanager
+    def _virtual_time(self):
+        """Run flotilla against the virtual clock."""
+        for module in CLOCK_MODULES:
+            module.time = self._clock
+        try:
+            yield
+        finally:
+            for module in CLOCK_MODULES:
+                module.time = time
+
+    def _tick_virtual(self):
+        result = TickResult(self._tick)
+        result.agents = len(self.agents)
+        # Dead agents stop heartbeating, DynamoDB deletes their items:
+        result.expired = sum(table.expire(now=self._clock.time())
+                             for table in self.tables.values())
+
+        for agent in self.agents:
+            agent.agent.health()
+
+        # Scheduler: messages, then the periodic loop:
+        self._reset_capacity()
+        stats = dict(self.scheduler.stats)
+        start = time.time()
+        messages, self.messages = self.messages, []
+        for service in sorted(set(messages)):
+            self.scheduler.schedule_service(service)
+        self.scheduler.loop()
+        result.loop_time = time.time() - start
+        reaped = self.reaper.stats['reaped']
+        self.reaper.reap()
+        result.reaped = self.reaper.stats['reaped'] - reaped
+        result.reassigned = (self.scheduler.stats['reassigned'] -
+                             stats.get('reassigned', 0))
+        result.moved = (self.scheduler.stats['churn'] -
+                        stats.get('churn', 0))
+        result.avoided = (self.scheduler.stats['churn_avoided'] -
+                          stats.get('churn_avoided', 0))
+        result.skipped = (self.scheduler.stats['fingerprint_hits'] -
+                          stats.get('fingerprint_hits', 0))
+        result.scheduler_read, result.scheduler_write = self._capacity()
+        result.assignment_read = self.tables['assignments'].consumed_read
+
+        self._reset_capacity()
+        for agent in self.agents:
+            agent.agent.assignment()
+        result.unassigned = len([a for a in self.agents if not a.assigned])
+        result.agent_read, result.agent_write = self._capacity()
+
+        self.results.append(result)
+        return result
+
+    def _reset_capacity(self):
+        for table in self.tables.values():
+            table.reset_capacity()
+
+    def _capacity(self):
+        read = sum(t.consumed_read for t in self.tables.values())
+        write = sum(t.consumed_write for t in self.tables.values())
+        return read, write
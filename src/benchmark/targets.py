@@ -0,0 +1,96 @@
+"""Apportionment and single-service scheduling cost by fleet size."""
+import random
+from collections import defaultdict
+from flotilla.scheduler.scheduler import FlotillaScheduler
+from benchmark import report, timed
+
+INSTANCES = (100, 1000, 10000)
+REVISIONS = (1, 10, 100)
+SERVICE = 'benchmark'
+
+
+class StaticAssignmentsDb(object):
+    """Serves a fixed assignment snapshot, discards writes."""
+
+    def __init__(self, assignments):
+        self._assignments = assignments
+        self.written = 0
+
+    def get_live_instances(self, service):
+        return [i['instance_id'] for instances in self._assignments.values()
+                for i in instances]
+
+    def get_standby(self, service):
+        return 0
+
+    def get_two_phase(self, service):
+        return False
+
+    def get_delivering(self, service):
+        return None
+
+    def get_generation(self, service):
+        return None
+
+    def get_instance_zones(self, instance_ids):
+        return {}
+
+    def get_instance_health(self, instance_ids):
+        return {}
+
+    def get_instance_assignments(self, service, live_instances=None,
+                                 generation=None):
+        assignments = defaultdict(list)
+        for rev, instances in self._assignments.items():
+            assignments[rev] = [dict(i) for i in instances]
+        return assignments
+
+    def get_service(self, service):
+        return None
+
+    def set_assignments(self, assignments):
+        self.written += len(assignments)
+
+
+def weights(revisions, rng):
+    return {'rev%03d' % i: rng.randint(1, 10) for i in range(revisions)}
+
+
+def snapshot(instances, revisions, rng):
+    """Assignments as left by an earlier (different) set of weights."""
+    assignments = defaultdict(list)
+    previous = weights(revisions, rng).keys() + [None]
+    for i in range(instances):
+        rev = rng.choice(previous)
+        assignments[rev].append({'instance_id': 'i-%08d' % i,
+                                 'assignment': rev})
+    return assignments
+
+
+def run(repeat=5, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for instances in INSTANCES:
+        for revisions in REVISIONS:
+            rev_weights = weights(revisions, rng)
+            db = StaticAssignmentsDb(snapshot(instances, revisions, rng))
+            scheduler = FlotillaScheduler(db, None)
+            scheduler.active = True
+
+            targets_best, _ = timed(
+                    lambda: scheduler._instance_targets(rev_weights,
+                                                        instances),
+                    repeat)
+            loop_best, loop_mean = timed(
+                    lambda: scheduler._schedule_service(SERVICE,
+                                                        rev_weights),
+                    repeat)
+            rows.append((instances, revisions, targets_best * 1000,
+                         loop_best * 1000, loop_mean * 1000,
+                         db.written / repeat,
+                         scheduler.stats['churn'] / repeat))
+    report('Instance targets / _schedule_service (ms)',
+           ('instances', 'revisions', 'targets', 'loop_best', 'loop_mean',
+            'reassigned', 'moved'),
+           rows)
+    return rows
@@ -1,4 +1,5 @@
 import logging
+import time
 
 logger = logging.getLogger('flotilla')
 
@@ -12,32 +13,86 @@ class FlotillaAgent(object):
         self._messaging = messaging
         self._elb = elb
         self._assignments = []
+        self._staged = []
+        self._prepared = []
+        self._packed = []
         self._first = True
 
     def assignment(self):
         """Check for active assignment and update if necessary."""
-        assignments = self._db.get_assignments()
-        if self._assignments != assignments:
-            logger.debug('Updated assignment: %s (was %s)', assignments,
-                         self._assignments)
-
-            units = self._db.get_units(assignments)
-
-            deploy_lock = '%s-deploy' % self._service
-            if self._locks.try_lock(deploy_lock):
-                try:
-                    if self._elb:
-                        self._elb.unregister()
-                    self._systemd.set_units(units)
-
-                    if not self._elb or self._elb.register():
-                        self._assignments = assignments
-                    else:
-                        for rev in assignments:
-                            self._messaging.service_failure(rev)
-                finally:
-                    self._locks.release_lock(deploy_lock)
-                    # else: setup for a "lock released" callback
+        assignments, staged, prepared, packed = \
+            self._db.get_assignment_state()
+        if self._assignments == assignments and self._staged == staged:
+            if self._packed != packed:
+                self._pack(assignments, staged, packed)
+            if self._prepared != prepared:
+                self._prepare(assignments, staged, prepared)
+            return
+        logger.debug('Updated assignment: %s (was %s), staged: %s',
+                     assignments, self._assignments, staged)
+
+        units = self._db.get_units(assignments + packed)
+
+        if staged:
+            self._stage(assignments, staged, packed, units)
+            return
+
+        deploy_lock = '%s-deploy' % self._service
+        if self._locks.try_lock(deploy_lock):
+            try:
+                deploy_start = time.time()
+                if self._elb:
+                    self._elb.unregister()
+                self._systemd.set_units(units)
+
+                if not self._elb or self._elb.register():
+                    self._db.set_deploy_time(time.time() - deploy_start)
+                    self._assignments = assignments
+                    self._staged = staged
+                    self._packed = packed
+                else:
+                    for rev in assignments:
+                        self._messaging.service_failure(rev)
+            finally:
+                self._locks.release_lock(deploy_lock)
+                # else: setup for a "lock released" callback
+
+    def _pack(self, assignments, staged, packed):
+        """Packing: revisions of other services placed on this instance are
+        deployed alongside its own. The own revisions keep serving, packed
+        changes take neither the deploy lock nor the load balancer."""
+        logger.debug('Updated packed revisions: %s (was %s)', packed,
+                     self._packed)
+        units = self._db.get_units(assignments + packed + self._prepared)
+        staged = staged + self._prepared
+        if staged:
+            self._systemd.set_units(units, staged=staged)
+        else:
+            self._systemd.set_units(units)
+        self._packed = packed
+
+    def _prepare(self, assignments, staged, prepared):
+        """Two-phase cutover: write units, decrypt environments and pull
+        images of the next revision while still serving, then acknowledge.
+        The scheduler commits the cutover once acknowledged, leaving only a
+        stop/start for the deploy."""
+        logger.debug('Preparing: %s', prepared)
+        units = self._db.get_units(assignments + self._packed + prepared)
+        self._systemd.set_units(units, staged=staged + prepared)
+        self._prepared = prepared
+        self._db.set_prepared(prepared)
+        self._db.store_status(self._systemd.get_unit_status())
+
+    def _stage(self, assignments, staged, packed, units):
+        """Standby: prepare staged revisions without serving them.
+        Staging does not take the deploy lock, serving instances are
+        unaffected."""
+        if self._elb:
+            self._elb.unregister()
+        self._systemd.set_units(units, staged=staged)
+        self._assignments = assignments
+        self._staged = staged
+        self._packed = packed
 
     def health(self):
         """Write health to systemd."""
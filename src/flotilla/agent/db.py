@@ -1,9 +1,12 @@
 import logging
 import json
 import time
+from decimal import Decimal
 from collections import defaultdict
+from boto.dynamodb2.exceptions import ConditionalCheckFailedException
 from flotilla.model import FlotillaServiceRevision, FlotillaUnit, \
-    GLOBAL_ASSIGNMENT, GLOBAL_ASSIGNMENT_SHARDS
+    ASSIGNMENT_EXPIRY, EXPIRES, FAILED_STATES, GLOBAL_ASSIGNMENT_SHARDS, \
+    INSTANCE_EXPIRY, expiry, global_assignment_id, global_shard
 from Crypto.Cipher import AES
 
 logger = logging.getLogger('flotilla')
@@ -17,6 +20,7 @@ class FlotillaAgentDynamo(object):
         -PutItem
     assignments:
         - BatchGetItem
+        - UpdateItem
     revisions:
         - BatchGetItem
     units:
@@ -24,16 +28,22 @@ class FlotillaAgentDynamo(object):
     """
 
     def __init__(self, instance_id, service_name, status_table,
-                 assignments_table, revisions_table, units_table, kms):
+                 assignments_table, revisions_table, units_table, kms,
+                 capacity=None, global_shards=GLOBAL_ASSIGNMENT_SHARDS,
+                 availability_zone=None):
         self._id = instance_id
-        global_shard = hash(instance_id) % GLOBAL_ASSIGNMENT_SHARDS
-        self._global_id = '%s_%d' % (GLOBAL_ASSIGNMENT, global_shard)
+        self._global_id = global_assignment_id(
+                global_shard(instance_id, global_shards))
         self._service = service_name
         self._status = status_table
         self._assignments = assignments_table
         self._revisions = revisions_table
         self._units = units_table
         self._kms = kms
+        self._capacity = capacity or {}
+        self._availability_zone = availability_zone
+        self._prepared = []
+        self._deploy_time = None
 
     def store_status(self, unit_status):
         """Store unit status.
@@ -41,20 +51,85 @@ class FlotillaAgentDynamo(object):
         """
         logger.debug('Storing status as %s...', self._id)
         data = dict(unit_status)
+        data.update(self._capacity)
+        if self._availability_zone:
+            data['availability_zone'] = self._availability_zone
+        if self._prepared:
+            data['prepared'] = self._prepared
+        if self._deploy_time is not None:
+            data['deploy_time'] = self._deploy_time
+        data['failed_units'] = len([
+            status for status in unit_status.values()
+            if status.get('active_state') in FAILED_STATES or
+            status.get('sub_state') in FAILED_STATES])
         data['service'] = self._service
         data['instance_id'] = self._id
         data['status_time'] = time.time()
+        data[EXPIRES] = expiry(INSTANCE_EXPIRY)
         self._status.put_item(data=data, overwrite=True)
         logger.info('Stored status of %s units as %s.', len(unit_status),
                     self._id)
 
+    def set_prepared(self, prepared_revisions):
+        """Acknowledge prepared revisions with the next status.
+        :param prepared_revisions: Revisions ready to be started.
+        """
+        self._prepared = list(prepared_revisions)
+
+    def set_deploy_time(self, deploy_time):
+        """Report the duration of the last deploy with the next status.
+        :param deploy_time: Seconds from unregistering to registering.
+        """
+        # Floats are stored only if exact, keep milliseconds:
+        self._deploy_time = Decimal('%.3f' % deploy_time)
+
     def get_assignments(self):
+        assignments, _, _, packed = self.get_assignment_state()
+        return sorted(assignments + packed)
+
+    def get_assignment_state(self):
+        """
+        Get assigned revisions, those only to be staged (standby), those
+        to prepare for a cutover and those of other services packed onto
+        this instance.
+        :return: Assigned revisions, staged revisions, prepared revisions,
+        packed revisions.
+        """
         assignments = self._assignments.batch_get([
             {'instance_id': self._id}, {'instance_id': self._global_id}])
 
-        assigned_revisions = [assignment['assignment'] for assignment in
-                              assignments]
-        return sorted(assigned_revisions)
+        assigned_revisions = []
+        staged_revisions = []
+        prepared_revisions = []
+        packed_revisions = []
+        for assignment in assignments:
+            if assignment.get('instance_id') == self._id:
+                self._refresh_expiry(assignment)
+            assigned_revisions.append(assignment['assignment'])
+            if assignment.get('staged'):
+                staged_revisions.append(assignment['assignment'])
+            if assignment.get('prepared'):
+                prepared_revisions.append(assignment['prepared'])
+            # Revisions of other services packed onto this instance:
+            packed_revisions += assignment.get('packed') or []
+        return (sorted(assigned_revisions), sorted(staged_revisions),
+                sorted(prepared_revisions), sorted(packed_revisions))
+
+    def _refresh_expiry(self, assignment):
+        """Extend the expiry of this instance's assignment once half of it
+        has passed, or set it on assignments stored without. Assignments
+        changed since they were loaded are left to the scheduler.
+        :param assignment: Assignment item.
+        """
+        expires = assignment.get(EXPIRES)
+        if expires is not None and \
+                int(expires) - time.time() > ASSIGNMENT_EXPIRY / 2:
+            return
+        assignment[EXPIRES] = expiry(ASSIGNMENT_EXPIRY)
+        try:
+            assignment.partial_save()
+        except ConditionalCheckFailedException:
+            logger.debug('Assignment of %s changed, not refreshing.', self._id)
 
     def get_units(self, assigned_revisions):
         """
@@ -102,7 +177,7 @@ class FlotillaAgentDynamo(object):
 
             for revision in unit_revisions[unit_hash]:
                 rev_unit = FlotillaUnit(unit_item['name'], unit_file,
-                                        unit_environment, rev_hash)
+                                        unit_environment, revision)
                 units.append(rev_unit)
                 revisions[revision].units.append(rev_unit)
 
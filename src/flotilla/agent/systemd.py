@@ -1,18 +1,22 @@
 import logging
 import os
+import re
+import subprocess
 from flotilla.model import UNIT_PREFIX
 
 logger = logging.getLogger('flotilla')
 
 SYSTEMD_DEPS = ('Before', 'After', 'BindsTo', 'Wants', 'Requires')
+DOCKER_PULL = re.compile(r'^ExecStartPre=-?\S*docker pull (\S+)\s*$')
 
 
 class SystemdUnits(object):
     def __init__(self, manager, unit_dir='/etc/systemd/system',
-                 env_dir='/etc/flotilla'):
+                 env_dir='/etc/flotilla', docker='/usr/bin/docker'):
         self._manager = manager
         self._unit_dir = unit_dir
         self._env_dir = env_dir
+        self._docker = docker
 
     def get_units(self):
         units = [unit for unit in self._manager.list_units() if
@@ -31,7 +35,12 @@ class SystemdUnits(object):
         for unit in self.get_units():
             unit.start('replace')
 
-    def set_units(self, units):
+    def set_units(self, units, staged=()):
+        """Deploy units.
+        :param units: Desired units.
+        :param staged: Revisions to stage: units are written and images
+        pulled, but not started.
+        """
         # Index units by deployed name:
         unit_names = {unit.full_name: unit for unit in units}
         logger.debug('Desired units: %s', unit_names.keys())
@@ -67,10 +76,10 @@ class SystemdUnits(object):
                     line_split = unit_line.split('=')
                     # Map systemd dependencies within the revision:
                     if len(line_split) == 2 and line_split[0] in SYSTEMD_DEPS:
-                        unit = unit_short_names.get(line_split[1])
-                        if unit:
-                            unit_lines[line_num] = '%s=%s' % (line_split[0],
-                                                              unit.full_name)
+                        dependency = unit_short_names.get(line_split[1])
+                        if dependency:
+                            unit_lines[line_num] = '%s=%s' % (
+                                line_split[0], dependency.full_name)
                 logger.debug('Writing unit file: %s', unit_path)
                 with open(unit_path, 'w') as unit_file:
                     unit_file.write('\n'.join(unit_lines))
@@ -93,13 +102,31 @@ class SystemdUnits(object):
                 logger.exception(e)
             loaded_unit = self._manager.load_unit(name)
             active_state = loaded_unit.properties.ActiveState
-            if active_state not in ['active', 'activating']:
+            if unit.rev_hash and unit.rev_hash in staged:
+                if active_state in ['active', 'activating']:
+                    logger.debug('Unit %s is staged, stopping.', name)
+                    loaded_unit.stop('replace')
+                self._pull_images(unit)
+            elif active_state not in ['active', 'activating']:
                 logger.debug('Unit %s is %s, starting...', name, active_state)
                 loaded_unit.start('replace')
             else:
                 sub_state = loaded_unit.properties.SubState
                 logger.debug('Unit %s already started: %s', name, sub_state)
 
+    def _pull_images(self, unit):
+        """Pull docker images a unit pulls before starting."""
+        for unit_line in unit.unit_file.split('\n'):
+            match = DOCKER_PULL.match(unit_line.strip())
+            if not match:
+                continue
+            image = match.group(1)
+            logger.debug('Pulling %s for %s.', image, unit.name)
+            try:
+                subprocess.check_call([self._docker, 'pull', image])
+            except (OSError, subprocess.CalledProcessError) as e:
+                logger.warn('Unable to pull %s: %s', image, e)
+
     def get_unit_status(self):
         unit_statuses = {}
         for unit in self.get_units():
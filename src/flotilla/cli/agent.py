@@ -5,8 +5,9 @@ import boto3
 import click
 import logging
 
-from main import get_instance_id
+from main import get_instance_id, get_availability_zone, get_capacity
 from flotilla.cli.options import REGIONS
+from flotilla.model import GLOBAL_ASSIGNMENT_SHARDS
 from flotilla.agent import *
 from flotilla.cli.utils import get_queue
 from flotilla.db import DynamoDbTables, DynamoDbLocks
@@ -42,10 +43,14 @@ def agent_cmd():  # pragma: no cover
 @click.option('--assignment-interval', type=click.INT,
               envvar='FLOTILLA_ASSIGNMENT_INTERVAL', default=15,
               help='Frequency of assignment reads (seconds).')
+@click.option('--global-shards', type=click.INT,
+              envvar='FLOTILLA_GLOBAL_SHARDS',
+              default=GLOBAL_ASSIGNMENT_SHARDS,
+              help='Global assignment shards.')
 def agent(service, environment, region, elb, health_interval,
-          assignment_interval):  # pragma: no cover
+          assignment_interval, global_shards):  # pragma: no cover
     start_agent(environment, service, region, elb, health_interval,
-                assignment_interval)
+                assignment_interval, global_shards)
 
 
 def get_elb(local_id, elb_name, elb_region):
@@ -57,7 +62,7 @@ def get_elb(local_id, elb_name, elb_region):
 
 
 def start_agent(environment, service, region, elb_name, health_interval,
-                assignment_interval):
+                assignment_interval, global_shards=GLOBAL_ASSIGNMENT_SHARDS):
     # Identity:
     instance_id = get_instance_id()
     logger.debug('Resolved id: %s', instance_id)
@@ -76,7 +81,9 @@ def start_agent(environment, service, region, elb_name, health_interval,
     tables.setup(['status', 'assignments', 'revisions', 'units', 'locks'])
     db = FlotillaAgentDynamo(instance_id, service, tables.status,
                              tables.assignments, tables.revisions,
-                             tables.units, kms)
+                             tables.units, kms, capacity=get_capacity(),
+                             global_shards=global_shards,
+                             availability_zone=get_availability_zone())
     locks = DynamoDbLocks(instance_id, tables.locks)
 
     # SQS:
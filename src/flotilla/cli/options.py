@@ -24,3 +24,4 @@ DEFAULT_INSTANCE_TYPE = 't2.nano'
 DEFAULT_CHANNEL = 'stable'
 DEFAULT_VERSION = 'current'
 DEFAULT_FLOTILLA_CONTAINER = 'pebbletech/flotilla'
+DEFAULT_TRACE_PORT = 7701
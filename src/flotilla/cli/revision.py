@@ -7,12 +7,25 @@ import boto.dynamodb2
 import boto.kms
 
 from flotilla.model import FlotillaUnit, FlotillaDockerService, \
-    FlotillaServiceRevision
+    FlotillaServiceRevision, GLOBAL_ASSIGNMENT_SHARDS
 from flotilla.cli.options import *
 from flotilla.db.tables import DynamoDbTables
 from flotilla.client.db import FlotillaClientDynamo
 
 
+def validate_steps(ctx, param, value):
+    if value is None:
+        return
+
+    try:
+        steps = [int(step) for step in value.split(',')]
+    except ValueError:
+        raise click.BadParameter('Must be percentages (5,25,100)')
+    if steps != sorted(set(steps)) or steps[0] < 1 or steps[-1] > 100:
+        raise click.BadParameter('Must be increasing percentages (5,25,100)')
+    return steps
+
+
 @click.group()
 def revision_cmd():  # pragma: no cover
     pass
@@ -26,15 +39,28 @@ def revision_cmd():  # pragma: no cover
               help='Regions (multiple allowed).')
 @click.option('--name', type=click.STRING, help='Service name.')
 @click.option('--label', type=click.STRING, help='Revision label.')
-def revision(environment, region, name, label):  # pragma: no cover
-    add_revision(environment, region, name, label, sys.stdin)
-
-
-def add_revision(environment, regions, service_name, label, stream_in):
+@click.option('--cpu', type=click.INT,
+              help='CPU request (millicores), for packed placement.')
+@click.option('--memory', type=click.INT,
+              help='Memory request (MB), for packed placement.')
+@click.option('--steps', type=click.STRING, callback=validate_steps,
+              help='Ramp the revision through percentages of the service, '
+                   'rolling back if unhealthy. e.g. 5,25,100')
+@click.option('--bake', type=click.IntRange(min=0), default=300,
+              help='Seconds each step must stay healthy.')
+def revision(environment, region, name, label, cpu, memory, steps,
+             bake):  # pragma: no cover
+    add_revision(environment, region, name, label, sys.stdin, cpu, memory,
+                 steps, bake)
+
+
+def add_revision(environment, regions, service_name, label, stream_in,
+                 cpu=None, memory=None, steps=None, bake=300):
     files = files_from_tar(stream_in)
     units = get_units(files)
 
-    service_revision = FlotillaServiceRevision(label, units=units)
+    service_revision = FlotillaServiceRevision(label, units=units, cpu=cpu,
+                                               memory=memory)
 
     for region in regions:
         kms = boto.kms.connect_to_region(region)
@@ -46,7 +72,43 @@ def add_revision(environment, regions, service_name, label, stream_in):
         db = FlotillaClientDynamo(None, None, tables.revisions, tables.services,
                                   tables.units, None, kms)
 
-        db.add_revision(service_name, service_revision)
+        db.add_revision(service_name, service_revision, steps, bake)
+
+
+@revision_cmd.command(name='global-revision',
+                      help='Add a revision to every instance.')
+@click.option('--environment', type=click.STRING, envvar='FLOTILLA_ENV',
+              default=DEFAULT_ENVIRONMENT, help='Environment name.')
+@click.option('--region', '-r', multiple=True, type=click.Choice(REGIONS),
+              envvar='FLOTILLA_REGION', default=DEFAULT_REGIONS,
+              help='Regions (multiple allowed).')
+@click.option('--label', type=click.STRING, help='Revision label.')
+@click.option('--shards', type=click.INT, envvar='FLOTILLA_GLOBAL_SHARDS',
+              default=GLOBAL_ASSIGNMENT_SHARDS,
+              help='Global assignment shards (as configured on agents).')
+@click.option('--staged/--immediate', default=True,
+              help='Roll out shard by shard, or to every shard at once.')
+def global_revision(environment, region, label, shards,
+                    staged):  # pragma: no cover
+    set_global_revision(environment, region, label, sys.stdin, shards, staged)
+
+
+def set_global_revision(environment, regions, label, stream_in, shards,
+                        staged):
+    files = files_from_tar(stream_in)
+    units = get_units(files)
+
+    global_revision = FlotillaServiceRevision(label, units=units)
+
+    for region in regions:
+        dynamo = boto.dynamodb2.connect_to_region(region)
+        tables = DynamoDbTables(dynamo, environment=environment)
+
+        tables.setup(['assignments', 'revisions', 'units'])
+        db = FlotillaClientDynamo(tables.assignments, None, tables.revisions,
+                                  None, tables.units, None, None)
+
+        db.set_global(global_revision, shards=shards, staged=staged)
 
 
 def files_from_tar(tar_in):
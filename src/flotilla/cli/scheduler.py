@@ -1,14 +1,19 @@
 import click
+import json
 import logging
+import urllib
+import urllib2
 import boto.dynamodb2
 import boto3
+from functools import partial
 
 from main import get_instance_id
 from flotilla.cli.options import *
 from flotilla.cli.utils import get_queue
 from flotilla.db import DynamoDbTables, DynamoDbLocks
 from flotilla.scheduler import *
-from flotilla.thread import RepeatingFunc
+from flotilla.scheduler.region import local_health
+from flotilla.thread import RepeatingFunc, wait_for_shutdown
 
 logger = logging.getLogger('flotilla')
 
@@ -34,55 +39,289 @@ def scheduler_cmd():  # pragma: no cover
 @click.option('--provision-interval', type=click.INT,
               envvar='FLOTILLA_PROVISION_INTERVAL', default=15,
               help='Frequency of provision loop (seconds).')
+@click.option('--reconcile-interval', type=click.INT,
+              envvar='FLOTILLA_RECONCILE_INTERVAL', default=300,
+              help='Frequency of full scheduling pass when change streams '
+                   'are available (seconds).')
+@click.option('--segments', type=click.INT, envvar='FLOTILLA_SEGMENTS',
+              default=1,
+              help='Segments of services shared between schedulers.')
+@click.option('--scheduler-threads', type=click.INT,
+              envvar='FLOTILLA_SCHEDULER_THREADS', default=4,
+              help='Services scheduled in parallel (per region).')
+@click.option('--lease-ttl', type=click.INT, envvar='FLOTILLA_LEASE_TTL',
+              default=10,
+              help='Lifetime of the active scheduler lease (seconds).')
+@click.option('--standby-interval', type=click.FLOAT,
+              envvar='FLOTILLA_STANDBY_INTERVAL', default=0.5,
+              help='Frequency of lease check by standby schedulers '
+                   '(seconds).')
+@click.option('--trace-port', type=click.INT, envvar='FLOTILLA_TRACE_PORT',
+              default=DEFAULT_TRACE_PORT,
+              help='Local port serving recent scheduling traces (0 to '
+                   'disable).')
+@click.option('--target-tolerance', type=click.IntRange(min=0),
+              envvar='FLOTILLA_TARGET_TOLERANCE', default=0,
+              help='Instances a revision may be off its weighted share '
+                   'before instances are moved (0 for exact shares).')
+@click.option('--reap-interval', type=click.INT,
+              envvar='FLOTILLA_REAP_INTERVAL', default=15,
+              help='Frequency of dead instance removal (seconds).')
+@click.option('--reap-write-units', type=click.IntRange(min=1),
+              envvar='FLOTILLA_REAP_WRITE_UNITS', default=10,
+              help='Write capacity (units/second) used to remove dead '
+                   'instances.')
+@click.option('--region-workers/--no-region-workers', default=None,
+              envvar='FLOTILLA_REGION_WORKERS',
+              help='Run each region in a worker process (default with '
+                   'multiple regions).')
 def scheduler(environment, domain, region, lock_interval, loop_interval,
-              provision_interval):  # pragma: no cover
-    start_scheduler(environment, domain, region, lock_interval, loop_interval,
-                    provision_interval)
+              provision_interval, reconcile_interval, segments,
+              scheduler_threads, lease_ttl, standby_interval, trace_port,
+              target_tolerance, reap_interval, reap_write_units,
+              region_workers):  # pragma: no cover
+    funcs, schedulers = start_scheduler(
+            environment, domain, region, lock_interval, loop_interval,
+            provision_interval, reconcile_interval, segments,
+            scheduler_threads, lease_ttl, standby_interval, trace_port,
+            target_tolerance, reap_interval, reap_write_units,
+            region_workers)
+    wait_for_shutdown()
+    stop_scheduler(funcs, schedulers)
+
+
+@scheduler_cmd.command(name='scheduler-traces',
+                       help='Show recent passes of the local scheduler.')
+@click.option('--trace-port', type=click.INT, envvar='FLOTILLA_TRACE_PORT',
+              default=DEFAULT_TRACE_PORT, help='Scheduler trace port.')
+@click.option('--service', help='Only passes that scheduled this service.')
+@click.option('--limit', type=click.INT, default=10, help='Maximum passes.')
+@click.option('--min-duration', type=click.FLOAT, default=0,
+              help='Only passes at least this slow (seconds).')
+def scheduler_traces(trace_port, service, limit,
+                     min_duration):  # pragma: no cover
+    traces = get_traces(trace_port, service, limit, min_duration)
+    for line in format_traces(traces):
+        click.echo(line)
+
+
+@scheduler_cmd.command(name='scheduler-health',
+                       help='Show loop lag of the local scheduler.')
+@click.option('--trace-port', type=click.INT, envvar='FLOTILLA_TRACE_PORT',
+              default=DEFAULT_TRACE_PORT, help='Scheduler trace port.')
+def scheduler_health(trace_port):  # pragma: no cover
+    health = get_health(trace_port)
+    for line in format_health(health):
+        click.echo(line)
+
+
+def get_health(port):
+    url = 'http://127.0.0.1:%d/health' % port
+    return json.load(urllib2.urlopen(url))
+
+
+def format_health(health):
+    """Summarize loop status by region."""
+    for region in sorted(health):
+        region_health = health[region]
+        line = '%s %s' % (region, 'healthy' if region_health['healthy']
+                          else 'UNHEALTHY')
+        if 'pid' in region_health:
+            line += ' (pid %s, reported %.1fs ago)' % (
+                region_health['pid'], region_health['reported'])
+        yield line
+        for name, loop in sorted(region_health['loops'].items()):
+            yield '  %s: lag %.3fs, ran %.1fs ago' % (name, loop['lag'],
+                                                      loop['age'])
+
+
+def get_traces(port, service=None, limit=10, min_duration=0):
+    params = {'limit': limit, 'min_duration': min_duration}
+    if service:
+        params['service'] = service
+    url = 'http://127.0.0.1:%d/traces?%s' % (port, urllib.urlencode(params))
+    return json.load(urllib2.urlopen(url))
+
+
+def _format_phases(phases):
+    return ' '.join('%s=%.3fs' % (name, duration)
+                    for name, duration in sorted(phases.items()))
+
+
+def format_traces(traces):
+    """Summarize traces by region: passes, services and moves."""
+    for region in sorted(traces):
+        for trace in traces[region]:
+            yield '%s %s pass: %.3fs, %d services, %d unchanged (%s)' % (
+                region, trace['kind'], trace['duration'],
+                len(trace['services']), trace['skipped'],
+                _format_phases(trace['phases']))
+            for service in trace['services']:
+                yield '  %s: %.3fs, %d instances, targets %s (%s)' % (
+                    service['service'], service['duration'],
+                    service['instances'], service['targets'],
+                    _format_phases(service['phases']))
+                for move in service['moves']:
+                    yield '    %s: %s -> %s (%s)' % (
+                        move['instance_id'], move['from'], move['to'],
+                        move['reason'])
+                for move in service['deferred']:
+                    yield '    %s: %s -> %s deferred (%s)' % (
+                        move['instance_id'], move['from'], move['to'],
+                        move['reason'])
+
+
+def get_changes(region, tables):
+    stream_arns = {}
+    for table_name in CHANGE_TABLES:
+        table = getattr(tables, table_name)
+        stream_arn = table.describe()['Table'].get('LatestStreamArn')
+        if stream_arn:
+            stream_arns[table_name] = stream_arn
+    if not stream_arns:
+        logger.info('No change streams found, scheduling full passes.')
+        return None
+    streams = boto3.client('dynamodbstreams', region)
+    return DynamoStreamChanges(streams, stream_arns)
 
 
 def start_scheduler(environment, domain, regions, lock_interval, loop_interval,
-                    provision_interval):
+                    provision_interval, reconcile_interval=300, segments=1,
+                    scheduler_threads=4, lease_ttl=10, standby_interval=0.5,
+                    trace_port=0, target_tolerance=0, reap_interval=15,
+                    reap_write_units=10, region_workers=None):
     instance_id = get_instance_id()
 
     coreos = CoreOsAmiIndex()
     cloudformation = FlotillaCloudFormation(environment, domain, coreos)
 
-    funcs = []
-    for region in regions:
-        # DynamoDB:
-        dynamo = boto.dynamodb2.connect_to_region(region)
-        tables = DynamoDbTables(dynamo, environment=environment)
-        tables.setup(['assignments', 'locks', 'regions', 'services', 'stacks',
-                      'status'])
-        db = FlotillaSchedulerDynamo(tables.assignments, tables.regions,
-                                     tables.services, tables.stacks,
-                                     tables.status)
-        locks = DynamoDbLocks(instance_id, tables.locks)
-
-        # Assemble into scheduler:
-        schedule = FlotillaScheduler(db, locks, lock_ttl=lock_interval * 3)
-        provisioner = FlotillaProvisioner(environment, region, schedule, db,
-                                          cloudformation)
-
-        funcs += [
-            RepeatingFunc('scheduler-lock-%s' % region, schedule.lock,
-                          lock_interval),
-            RepeatingFunc('scheduler-%s' % region, schedule.loop,
-                          loop_interval),
-            RepeatingFunc('provisioner-%s' % region, provisioner.provision,
-                          provision_interval)
-        ]
-
-        queue_name = 'flotilla-%s-scheduler' % environment
-        sqs = boto3.resource('sqs', region)
-        message_q = get_queue(sqs, queue_name)
-        if message_q:
-            elb = boto3.client('elb', region)
-            doctor = ServiceDoctor(db, elb)
-            messaging = FlotillaSchedulerMessaging(message_q, schedule, doctor)
-
-            funcs.append(RepeatingFunc('scheduler-message-%s' % region,
-                                       messaging.receive, 0))
+    if region_workers is None:
+        region_workers = len(regions) > 1
+
+    start = partial(start_region, environment, instance_id, cloudformation,
+                    lock_interval=lock_interval, loop_interval=loop_interval,
+                    provision_interval=provision_interval,
+                    reconcile_interval=reconcile_interval, segments=segments,
+                    scheduler_threads=scheduler_threads, lease_ttl=lease_ttl,
+                    standby_interval=standby_interval,
+                    target_tolerance=target_tolerance,
+                    reap_interval=reap_interval,
+                    reap_write_units=reap_write_units)
+    if region_workers:
+        # Isolate regions, a slow region does not hold up the others:
+        workers = [RegionWorker(region, partial(start, region),
+                                stop_scheduler) for region in regions]
+        supervisor = RegionSupervisor(workers)
+        supervisor.start()
+        funcs = [supervisor]
+        schedulers = []
+        traces = supervisor.traces
+        health = supervisor.health
+    else:
+        funcs = []
+        schedulers = []
+        region_funcs = {}
+        for region in regions:
+            region_funcs[region], region_schedulers = start(region)
+            funcs += region_funcs[region]
+            schedulers += region_schedulers
+        traces = {region: schedule.traces
+                  for region, schedule in zip(regions, schedulers)}
+        health = partial(local_health, region_funcs)
+
+    if trace_port:
+        trace_server = TraceServer(traces, trace_port, health=health)
+        trace_server.start()
+        funcs.append(trace_server)
+    return funcs, schedulers
+
+
+def start_region(environment, instance_id, cloudformation, region,
+                 lock_interval, loop_interval, provision_interval,
+                 reconcile_interval, segments, scheduler_threads, lease_ttl,
+                 standby_interval, target_tolerance, reap_interval,
+                 reap_write_units):
+    """Start the loops of a region.
+    :return: Loops, schedulers.
+    """
+    # DynamoDB:
+    dynamo = boto.dynamodb2.connect_to_region(region)
+    tables = DynamoDbTables(dynamo, environment=environment)
+    tables.setup(['assignments', 'locks', 'regions', 'revisions',
+                  'services', 'stacks', 'status'], ttl=True)
+    db = FlotillaSchedulerDynamo(tables.assignments, tables.regions,
+                                 tables.services, tables.stacks,
+                                 tables.status, tables.revisions,
+                                 snapshot_ttl=loop_interval)
+    locks = DynamoDbLocks(instance_id, tables.locks)
+
+    changes = get_changes(region, tables)
+    scheduler_segments = None
+    lock_ttl = lease_ttl
+    lock_check = standby_interval
+    if segments > 1:
+        lock_ttl = lock_interval * 3
+        lock_check = lock_interval
+        scheduler_segments = SchedulerSegments(locks, segments, ttl=lock_ttl)
+
+    workers = None
+    if scheduler_threads > 1:
+        workers = SchedulerWorkers(threads=scheduler_threads)
+
+    # Assemble into scheduler:
+    schedule = FlotillaScheduler(db, locks, lock_ttl=lock_ttl,
+                                 changes=changes,
+                                 reconcile_interval=reconcile_interval,
+                                 segments=scheduler_segments,
+                                 workers=workers,
+                                 target_tolerance=target_tolerance)
+    provisioner = FlotillaProvisioner(environment, region, schedule, db,
+                                      cloudformation)
+    packer = FlotillaPacker(schedule, db)
+    rollout = FlotillaGlobalRollout(schedule, db)
+    elb = boto3.client('elb', region)
+    delivery = FlotillaDelivery(schedule, db, elb)
+    reaper = FlotillaReaper(schedule, db, write_units=reap_write_units,
+                            interval=reap_interval)
+
+    # Secondary loops skip runs while scheduling is lagging:
+    schedule_loop = RepeatingFunc('scheduler-%s' % region, schedule.loop,
+                                  loop_interval)
+    funcs = [
+        RepeatingFunc('scheduler-lock-%s' % region, schedule.lock,
+                      lock_check),
+        schedule_loop,
+        RepeatingFunc('provisioner-%s' % region, provisioner.provision,
+                      provision_interval, yield_to=schedule_loop),
+        RepeatingFunc('packer-%s' % region, packer.pack, loop_interval,
+                      yield_to=schedule_loop),
+        RepeatingFunc('global-rollout-%s' % region, rollout.advance,
+                      loop_interval, yield_to=schedule_loop),
+        RepeatingFunc('delivery-%s' % region, delivery.advance,
+                      loop_interval, yield_to=schedule_loop),
+        RepeatingFunc('reaper-%s' % region, reaper.reap, reap_interval,
+                      yield_to=schedule_loop)
+    ]
+
+    queue_name = 'flotilla-%s-scheduler' % environment
+    sqs = boto3.resource('sqs', region)
+    message_q = get_queue(sqs, queue_name)
+    if message_q:
+        doctor = ServiceDoctor(db, elb)
+        messaging = FlotillaSchedulerMessaging(message_q, schedule, doctor,
+                                               rollout)
+
+        funcs.append(RepeatingFunc('scheduler-message-%s' % region,
+                                   messaging.receive, 0))
 
     # Start loops:
     map(RepeatingFunc.start, funcs)
+    return funcs, [schedule]
+
+
+def stop_scheduler(funcs, schedulers):
+    """Stop loops, then hand leases over to standby schedulers."""
+    for func in funcs:
+        func.stop()
+    for schedule in schedulers:
+        schedule.release()
@@ -15,6 +15,8 @@ ELB_SCHEMES = ('internal', 'internet-facing')
 
 HEALTH_CHECK_PROTOS = ('TCP', 'HTTP', 'HTTPS', 'SSL')
 
+PLACEMENTS = ('instance', 'packed')
+
 
 def validate_health_check(ctx, param, value):
     if value is None:
@@ -34,6 +36,19 @@ def validate_health_check(ctx, param, value):
     return value
 
 
+def validate_max_unavailable(ctx, param, value):
+    if value is None:
+        return
+
+    count = value[:-1] if value.endswith('%') else value
+    try:
+        if int(count) < 1:
+            raise ValueError()
+    except ValueError:
+        raise click.BadParameter('Must be a count or percentage (2, 25%)')
+    return value if value.endswith('%') else int(value)
+
+
 @click.group()
 def service_cmd():  # pragma: no cover
     pass
@@ -71,10 +86,23 @@ def service_cmd():  # pragma: no cover
               help='Public ports, exposed by ELB. e.g. 80-http, 6379-tcp', )
 @click.option('--private-ports', type=click.STRING, multiple=True,
               help='Private ports, exposed to peers. e.g. 9300-tcp, 9200-tcp')
+@click.option('--max-unavailable', type=click.STRING,
+              callback=validate_max_unavailable,
+              help='Instances redeployed at once. e.g. 2, 25%')
+@click.option('--placement', type=click.Choice(PLACEMENTS),
+              help='Run on own instances, or packed onto spare capacity '
+                   '(revision weights are replica counts).')
+@click.option('--standby', type=click.IntRange(min=0),
+              help='Instances kept staged (units and images ready, not '
+                   'started) for fast scale-up.')
+@click.option('--two-phase/--no-two-phase', default=None,
+              help='Instances prepare a new revision (units and images) '
+                   'before the scheduler moves them to it.')
 def service(environment, region, name, elb_scheme, dns_name, health_check,
             instance_type, provision, instance_min, instance_max, kms_key,
             coreos_channel, coreos_version, public_ports,
-            private_ports):  # pragma: no cover
+            private_ports, max_unavailable, placement, standby,
+            two_phase):  # pragma: no cover
     if not name:
         logger.warn('Service not specified')
         return
@@ -82,7 +110,8 @@ def service(environment, region, name, elb_scheme, dns_name, health_check,
     updates = get_updates(elb_scheme, dns_name, health_check, instance_type,
                           provision, instance_min, instance_max, kms_key,
                           coreos_channel, coreos_version, public_ports,
-                          private_ports)
+                          private_ports, max_unavailable, placement, standby,
+                          two_phase)
 
     if not updates:
         logger.warn('No updates to do!')
@@ -94,7 +123,9 @@ def service(environment, region, name, elb_scheme, dns_name, health_check,
 
 def get_updates(elb_scheme, dns, health_check, instance_type, provision,
                 instance_min, instance_max, kms_key, coreos_channel,
-                coreos_version, public_ports, private_ports):
+                coreos_version, public_ports, private_ports,
+                max_unavailable=None, placement=None, standby=None,
+                two_phase=None):
     updates = {}
     if elb_scheme:
         updates['elb_scheme'] = elb_scheme
@@ -116,6 +147,16 @@ def get_updates(elb_scheme, dns, health_check, instance_type, provision,
         updates['coreos_channel'] = coreos_channel
     if coreos_version:
         updates['coreos_version'] = coreos_version
+    if max_unavailable:
+        updates['max_unavailable'] = max_unavailable
+    if placement:
+        updates['placement'] = placement
+        if placement == 'packed':
+            updates.setdefault('provision', False)
+    if standby is not None:
+        updates['standby'] = standby
+    if two_phase is not None:
+        updates['two_phase'] = two_phase
 
     if public_ports:
         parsed_ports = {}
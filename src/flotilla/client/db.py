@@ -1,8 +1,9 @@
 import logging
+import time
 from boto.dynamodb2.exceptions import ItemNotFound
 from collections import defaultdict
 from flotilla.model import FlotillaServiceRevision, FlotillaUnit, \
-    GLOBAL_ASSIGNMENT, GLOBAL_ASSIGNMENT_SHARDS
+    GLOBAL_ASSIGNMENT_SHARDS, GLOBAL_ROLLOUT, global_assignment_id
 import json
 from Crypto.Cipher import AES
 from Crypto import Random
@@ -46,7 +47,14 @@ class FlotillaClientDynamo(object):
         self._users = users
         self._kms = kms
 
-    def add_revision(self, service, revision):
+    def add_revision(self, service, revision, steps=None, bake=300):
+        """Add a revision to a service.
+        :param service: Service name.
+        :param revision: Revision.
+        :param steps: Percentages of the service the scheduler ramps the
+        revision through, instead of its weight.
+        :param bake: Seconds each step must stay healthy.
+        """
         try:
             service_item = self._services.get_item(service_name=service)
         except ItemNotFound:
@@ -55,7 +63,18 @@ class FlotillaClientDynamo(object):
         key = service_item.get('kms_key')
         rev_hash = self._store_revision(revision, key)
 
-        service_item[rev_hash] = revision.weight
+        if steps:
+            service_item[rev_hash] = 0
+            service_item['delivery'] = {
+                'revision': rev_hash,
+                'steps': list(steps),
+                'bake': bake,
+                'step': -1,
+                'state': 'ramping',
+                'updated': time.time()
+            }
+        else:
+            service_item[rev_hash] = revision.weight
         service_item.partial_save()
 
     def _store_revision(self, revision, key):
@@ -85,6 +104,10 @@ class FlotillaClientDynamo(object):
             rev_item = self._revisions.new_item(rev_hash)
             rev_item['label'] = revision.label
             rev_item['units'] = [unit.unit_hash for unit in revision.units]
+            if revision.cpu:
+                rev_item['cpu'] = revision.cpu
+            if revision.memory:
+                rev_item['memory'] = revision.memory
             rev_item.save()
 
         return rev_hash
@@ -203,12 +226,45 @@ class FlotillaClientDynamo(object):
             missing.remove(user_item['username'])
         return missing
 
-    def set_global(self, revision):
+    def set_global(self, revision, shards=GLOBAL_ASSIGNMENT_SHARDS,
+                   staged=False):
+        """Assign a revision to every instance.
+        :param revision: Revision.
+        :param shards: Global assignment shards.
+        :param staged: Let the scheduler roll out shard by shard.
+        """
         rev_hash = self._store_revision(revision, None)
+        if staged:
+            self._stage_global(rev_hash, shards)
+            return
+
         with self._assignments.batch_write() as batch:
-            for i in range(GLOBAL_ASSIGNMENT_SHARDS):
-                assignment_id = '%s_%d' % (GLOBAL_ASSIGNMENT, i)
+            for i in range(shards):
                 batch.put_item({
-                    'instance_id': assignment_id,
+                    'instance_id': global_assignment_id(i),
                     'assignment': rev_hash
                 }, overwrite=True)
+
+    def _stage_global(self, rev_hash, shards):
+        try:
+            rollout = self._assignments.get_item(instance_id=GLOBAL_ROLLOUT,
+                                                 consistent=True)
+            if rollout['assignment'] == rev_hash:
+                # Resume a paused rollout where it stopped:
+                logger.info('Resuming global rollout of %s at shard %s.',
+                            rev_hash, rollout['shard'])
+                rollout['state'] = 'rolling'
+                rollout['updated'] = time.time()
+                rollout.partial_save()
+                return
+        except ItemNotFound:
+            pass
+
+        self._assignments.put_item(data={
+            'instance_id': GLOBAL_ROLLOUT,
+            'assignment': rev_hash,
+            'shard': 0,
+            'shards': shards,
+            'state': 'rolling',
+            'updated': time.time()
+        }, overwrite=True)
@@ -1,2 +1,3 @@
 from .tables import DynamoDbTables
 from .lock import DynamoDbLocks
+from .memory import MemoryTable
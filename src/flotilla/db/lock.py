@@ -1,3 +1,4 @@
+import json
 import logging
 
 logger = logging.getLogger('flotilla')
@@ -71,9 +72,34 @@ class DynamoDbLocks(object):
         except ItemNotFound:
             logger.debug('Lock %s not found to release', name)
 
-    def get_owner(self, name):
+    def get_state(self, name):
+        """Load state stored alongside a lock.
+        :param name: Lock name.
+        :return: State (empty if none was stored).
+        """
         try:
-            lock_item = self._locks.get_item(lock_name=name, consistent=True)
+            state_item = self._locks.get_item(lock_name='%s-state' % name,
+                                              consistent=True)
+            return json.loads(state_item['state'])
+        except ItemNotFound:
+            return {}
+
+    def set_state(self, name, state):
+        """Store state alongside a lock, for the next owner.
+        :param name: Lock name.
+        :param state: State (JSON serializable).
+        """
+        self._locks.put_item({
+            'lock_name': '%s-state' % name,
+            'owner': self._id,
+            'state': json.dumps(state),
+            'update_time': time.time()
+        }, overwrite=True)
+
+    def get_owner(self, name, consistent=True):
+        try:
+            lock_item = self._locks.get_item(lock_name=name,
+                                             consistent=consistent)
             return lock_item['owner'], float(lock_item['acquire_time'])
         except ItemNotFound:
             return None, None
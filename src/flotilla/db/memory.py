@@ -0,0 +1,317 @@
+import json
+import logging
+import math
+import threading
+import time
+import zlib
+from collections import defaultdict
+from copy import deepcopy
+from boto.dynamodb.types import Dynamizer
+from boto.dynamodb2.exceptions import ConditionalCheckFailedException, \
+    ItemNotFound
+from boto.dynamodb2.items import Item
+
+logger = logging.getLogger('flotilla')
+
+READ_UNIT = 4096
+WRITE_UNIT = 1024
+
+
+def _conditional_failed():
+    return ConditionalCheckFailedException(400, 'Bad Request', {
+        'message': 'The conditional request failed'})
+
+
+def _match(item, filter_key, expected):
+    """Evaluate a boto-style filter (`attribute__operator=value`)."""
+    attribute, operator = filter_key.rsplit('__', 1)
+    value = item.get(attribute)
+    if operator == 'null':
+        return (value is None) == bool(expected)
+    elif value is None:
+        return False
+    elif operator == 'eq':
+        return value == expected
+    elif operator == 'ne':
+        return value != expected
+    elif operator == 'lt':
+        return value < expected
+    elif operator == 'lte':
+        return value <= expected
+    elif operator == 'gt':
+        return value > expected
+    elif operator == 'gte':
+        return value >= expected
+    elif operator == 'beginswith':
+        return value.startswith(expected)
+    elif operator == 'contains':
+        return expected in value
+    raise ValueError('Unsupported filter: %s' % filter_key)
+
+
+def _matches(item, filters, conditional_operator=None):
+    """Evaluate boto-style filters, all of them unless the operator is OR."""
+    matched = [_match(item, filter_key, expected)
+               for filter_key, expected in filters.items()]
+    if conditional_operator == 'OR':
+        return not matched or any(matched)
+    return all(matched)
+
+
+class MemoryBatchTable(object):
+    """Batch writer for a MemoryTable."""
+
+    def __init__(self, table):
+        self._table = table
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def put_item(self, data, overwrite=False):
+        self._table.put_item(data=data, overwrite=True)
+
+    def delete_item(self, **kwargs):
+        self._table.delete_item(**kwargs)
+
+
+class MemoryTable(object):
+    """In-process stand-in for a boto DynamoDB table.
+
+    Implements the subset of `boto.dynamodb2.table.Table` used by flotilla,
+    returning real boto `Item`s. Consumed capacity is estimated from item
+    sizes so callers can be compared without AWS. Expired items are kept
+    until `expire` is called, as DynamoDB deletes them in the background.
+    """
+
+    def __init__(self, table_name, schema, stream=None, ttl_attribute=None):
+        """
+        :param table_name: Table name.
+        :param schema: Key fields (HashKey, RangeKey).
+        :param stream: Called with (table_name, keys, image, event) on every
+        write, like a DynamoDB stream record.
+        :param ttl_attribute: Expiry attribute (epoch seconds), if any.
+        """
+        self.table_name = table_name
+        self.schema = schema
+        self.ttl_attribute = ttl_attribute
+        self._dynamizer = Dynamizer()
+        self._stream = stream
+        self._items = {}
+        self._sizes = {}
+        self._partitions = defaultdict(set)
+        self._lock = threading.RLock()
+        self.consumed_read = 0.0
+        self.consumed_write = 0.0
+
+    def describe(self):
+        return {'Table': {
+            'TableName': self.table_name,
+            'TableStatus': 'ACTIVE',
+            'ItemCount': len(self._items)
+        }}
+
+    def get_key_fields(self):
+        return [field.name for field in self.schema]
+
+    def reset_capacity(self):
+        self.consumed_read = 0.0
+        self.consumed_write = 0.0
+
+    def _key(self, data):
+        return tuple(data[field] for field in self.get_key_fields())
+
+    def _size(self, data):
+        encoded = {k: self._dynamizer.encode(v) for k, v in data.items()}
+        return len(json.dumps(encoded))
+
+    def _read(self, size, consistent=False):
+        units = math.ceil(float(size) / READ_UNIT) or 1
+        self.consumed_read += units if consistent else units / 2
+
+    def _write(self, key, data, consumed=True):
+        old = self._items.get(key)
+        size = self._size(data) if data else 0
+        old_size = self._sizes.get(key, 0)
+        if consumed:
+            self.consumed_write += math.ceil(float(max(size, old_size)) /
+                                             WRITE_UNIT) or 1
+        if data is None:
+            if old is None:
+                return
+            del self._items[key]
+            del self._sizes[key]
+            self._partitions[key[0]].discard(key)
+        else:
+            self._items[key] = data
+            self._sizes[key] = size
+            self._partitions[key[0]].add(key)
+        if self._stream:
+            keys = dict(zip(self.get_key_fields(), key))
+            if old is None:
+                event = 'INSERT'
+            elif data is None:
+                event = 'REMOVE'
+            else:
+                event = 'MODIFY'
+            self._stream(self.table_name, keys, deepcopy(data or old), event)
+
+    def expire(self, now=None):
+        """Delete items whose expiry has passed, without consuming capacity.
+        :param now: Current time (epoch seconds).
+        :return: Count of deleted items.
+        """
+        if not self.ttl_attribute:
+            return 0
+        if now is None:
+            now = time.time()
+        with self._lock:
+            expired = [key for key, data in self._items.items()
+                       if data.get(self.ttl_attribute, now) < now]
+            for key in expired:
+                self._write(key, None, consumed=False)
+        return len(expired)
+
+    def _item(self, data, attributes=None):
+        if attributes:
+            data = {k: v for k, v in data.items() if k in attributes}
+        return Item(self, data=deepcopy(data), loaded=True)
+
+    def _check(self, existing, expects):
+        for attribute, expect in (expects or {}).items():
+            exists = existing is not None and attribute in existing
+            if 'Value' in expect:
+                value = self._dynamizer.decode(expect['Value'])
+                if not exists or existing[attribute] != value:
+                    raise _conditional_failed()
+            elif exists != expect.get('Exists', True):
+                raise _conditional_failed()
+
+    def new_item(self, *args):
+        data = {}
+        for field, arg in zip(self.schema, args):
+            data[field.name] = arg
+        return Item(self, data=data)
+
+    def put_item(self, data, overwrite=False):
+        item = Item(self, data=data)
+        return item.save(overwrite=overwrite)
+
+    def _put_item(self, item_data, expects=None):
+        data = {k: self._dynamizer.decode(v) for k, v in item_data.items()}
+        key = self._key(data)
+        with self._lock:
+            self._check(self._items.get(key), expects)
+            self._write(key, data)
+        return True
+
+    def _update_item(self, key, item_data, expects=None):
+        item_key = self._key(key)
+        with self._lock:
+            existing = self._items.get(item_key)
+            self._check(existing, expects)
+            data = deepcopy(existing) if existing else dict(key)
+            for attribute, update in item_data.items():
+                action = update.get('Action', 'PUT')
+                if action == 'DELETE':
+                    data.pop(attribute, None)
+                    continue
+                value = self._dynamizer.decode(update['Value'])
+                if action == 'ADD':
+                    value += data.get(attribute, 0)
+                data[attribute] = value
+            self._write(item_key, data)
+        return True
+
+    def delete_item(self, expected=None, conditional_operator=None,
+                    **kwargs):
+        key = self._key(kwargs)
+        with self._lock:
+            existing = self._items.get(key)
+            if expected and not _matches(existing or {}, expected,
+                                         conditional_operator):
+                return False
+            self._write(key, None)
+        return True
+
+    def get_item(self, consistent=False, attributes=None, **kwargs):
+        with self._lock:
+            data = self._items.get(self._key(kwargs))
+            if data is None:
+                self._read(0, consistent)
+                raise ItemNotFound('Item %s couldn\'t be found.' % kwargs)
+            self._read(self._sizes[self._key(kwargs)], consistent)
+            return self._item(data, attributes)
+
+    def has_item(self, **kwargs):
+        try:
+            self.get_item(**kwargs)
+            return True
+        except ItemNotFound:
+            return False
+
+    def batch_get(self, keys, consistent=False, attributes=None):
+        items = []
+        with self._lock:
+            for key in keys:
+                item_key = self._key(key)
+                data = self._items.get(item_key)
+                if data is None:
+                    continue
+                self._read(self._sizes[item_key], consistent)
+                items.append(self._item(data, attributes))
+        return iter(items)
+
+    def batch_write(self):
+        return MemoryBatchTable(self)
+
+    def query_2(self, limit=None, index=None, reverse=False,
+                consistent=False, attributes=None, max_page_size=None,
+                query_filter=None, conditional_operator=None,
+                **filter_kwargs):
+        # Only items matching key conditions are read:
+        key_fields = self.get_key_fields()
+        key_filters = {k: v for k, v in filter_kwargs.items()
+                       if k.rsplit('__', 1)[0] in key_fields}
+        filters = {k: v for k, v in filter_kwargs.items()
+                   if k not in key_filters}
+        filters.update(query_filter or {})
+        hash_key = filter_kwargs.get('%s__eq' % key_fields[0])
+        return self._select(filters, conditional_operator, attributes,
+                            consistent, limit,
+                            lambda key, data: _matches(data, key_filters),
+                            self._partitions.get(hash_key, ()))
+
+    def scan(self, limit=None, segment=None, total_segments=None,
+             max_page_size=None, attributes=None, conditional_operator=None,
+             **filter_kwargs):
+        def in_segment(key, data):
+            if not total_segments:
+                return True
+            hash_key = unicode(key[0]).encode('utf-8')
+            return zlib.crc32(hash_key) % total_segments == segment
+
+        return self._select(filter_kwargs, conditional_operator, attributes,
+                            False, limit, in_segment)
+
+    def _select(self, filters, conditional_operator, attributes, consistent,
+                limit, key_filter, keys=None):
+        items = []
+        read_size = 0
+        with self._lock:
+            if keys is None:
+                keys = self._items.keys()
+            for key in sorted(keys):
+                data = self._items[key]
+                if not key_filter(key, data):
+                    continue
+                read_size += self._sizes[key]
+                if not _matches(data, filters, conditional_operator):
+                    continue
+                items.append(self._item(data, attributes))
+                if limit and len(items) >= limit:
+                    break
+            self._read(read_size, consistent)
+        return iter(items)
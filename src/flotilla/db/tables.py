@@ -1,7 +1,9 @@
+import json
 import logging
 import time
 from boto.dynamodb2.table import Table
 from boto.dynamodb2.fields import HashKey, RangeKey
+from flotilla.model import EXPIRES
 
 logger = logging.getLogger('flotilla')
 
@@ -17,6 +19,12 @@ SCHEMAS = {
     'users': [HashKey('username')]
 }
 
+# Tables with items removed by DynamoDB once this attribute has passed:
+TTL_ATTRIBUTES = {
+    'assignments': EXPIRES,
+    'status': EXPIRES
+}
+
 
 class DynamoDbTables(object):
     def __init__(self, dynamo, environment=None, backoff=0.5):
@@ -35,7 +43,11 @@ class DynamoDbTables(object):
         self.users = None
         self.backoff = backoff
 
-    def setup(self, tables):
+    def setup(self, tables, ttl=False):
+        """Create (if necessary) and connect tables.
+        :param tables: Table names.
+        :param ttl: Enable expiry of items, left to the scheduler.
+        """
         tables = [t for t in tables if t in SCHEMAS]
         for table_name in tables:
             full_name = self._prefix + table_name
@@ -49,6 +61,13 @@ class DynamoDbTables(object):
                 time.sleep(self.backoff)
                 table_status = table.describe()['Table']['TableStatus']
 
+        if not ttl:
+            return
+        for table_name in tables:
+            ttl_attribute = TTL_ATTRIBUTES.get(table_name)
+            if ttl_attribute:
+                self._enable_ttl(self._prefix + table_name, ttl_attribute)
+
     def _table(self, name, schema, read, write):
         table = Table(name, connection=self._dynamo)
         try:
@@ -63,3 +82,29 @@ class DynamoDbTables(object):
                 'write': write
             }, connection=self._dynamo)
             return table
+
+    def _enable_ttl(self, name, attribute):
+        """Have DynamoDB delete items once an attribute has passed, unless
+        already enabled (including on tables created before expiry).
+        :param name: Table name.
+        :param attribute: Expiry attribute (epoch seconds).
+        """
+        # Not wrapped by boto 2, the raw requests are forward compatible:
+        try:
+            description = self._dynamo.make_request(
+                    'DescribeTimeToLive', json.dumps({'TableName': name}))
+            ttl_status = (description.get('TimeToLiveDescription') or
+                          {}).get('TimeToLiveStatus')
+            if ttl_status in ('ENABLED', 'ENABLING'):
+                return
+            logger.info('Enabling expiry of %s on %s', attribute, name)
+            self._dynamo.make_request('UpdateTimeToLive', json.dumps({
+                'TableName': name,
+                'TimeToLiveSpecification': {
+                    'AttributeName': attribute,
+                    'Enabled': True
+                }
+            }))
+        except Exception as e:
+            # Expired items are filtered anyway, and reaped if dead:
+            logger.warn('Unable to enable expiry on %s: %s', name, e)
@@ -1,10 +1,38 @@
 import hashlib
 import os
 import time
+import zlib
 
 UNIT_PREFIX = 'flotilla-'
 GLOBAL_ASSIGNMENT = 'global'
 GLOBAL_ASSIGNMENT_SHARDS = 16
+GLOBAL_ROLLOUT = 'global_rollout'
+ASSIGNMENT_GENERATION = 'generation'
+# Status and assignment items carry a TTL, refreshed while instances are live:
+EXPIRES = 'expires'
+INSTANCE_EXPIRY = 300
+ASSIGNMENT_EXPIRY = 3600
+# Unit states (active or sub) of crashed and crash-looping units:
+FAILED_STATES = ('failed', 'auto-restart')
+
+
+def global_shard(instance_id, shards=GLOBAL_ASSIGNMENT_SHARDS):
+    """Global assignment shard of an instance (stable across hosts)."""
+    return (zlib.crc32(instance_id) & 0xffffffff) % shards
+
+
+def global_assignment_id(shard):
+    return '%s_%d' % (GLOBAL_ASSIGNMENT, shard)
+
+
+def expiry(ttl):
+    """Expiry time (epoch seconds) of an item stored now."""
+    return int(time.time()) + ttl
+
+
+def assignment_generation_id(service):
+    """Item counting writes to the assignments of a service."""
+    return '%s_%s' % (ASSIGNMENT_GENERATION, service)
 
 
 class FlotillaUnit(object):
@@ -69,12 +97,19 @@ ExecStop=/usr/bin/docker stop %n
 
 
 class FlotillaServiceRevision(object):
-    """Weighted collection of units to be deployed together."""
+    """Weighted collection of units to be deployed together.
+
+    Revisions can request resources (cpu in millicores, memory in MB), these
+    are used when packing revisions onto shared instances.
+    """
 
-    def __init__(self, label=None, weight=1, units=None):
+    def __init__(self, label=None, weight=1, units=None, cpu=None,
+                 memory=None):
         self.label = label or 'rev-%d' % time.time()
         self.weight = weight
         self.units = units or []
+        self.cpu = cpu
+        self.memory = memory
 
     def __repr__(self):
         return 'Revision %s (%d): %d units' % (
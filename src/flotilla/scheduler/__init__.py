@@ -1,7 +1,16 @@
+from .changes import ServiceChanges, DynamoStreamChanges, CHANGE_TABLES
 from .cloudformation import FlotillaCloudFormation
 from .coreos import CoreOsAmiIndex
 from .db import FlotillaSchedulerDynamo
+from .delivery import FlotillaDelivery
 from .doctor import ServiceDoctor
 from .messaging import FlotillaSchedulerMessaging
+from .packer import FlotillaPacker
 from .provisioner import FlotillaProvisioner
+from .reaper import FlotillaReaper
+from .region import RegionSupervisor, RegionWorker
+from .rollout import FlotillaGlobalRollout
 from .scheduler import FlotillaScheduler
+from .segments import SchedulerSegments
+from .trace import SchedulerTraces, TraceServer
+from .workers import SchedulerWorkers
@@ -0,0 +1,210 @@
+import logging
+import threading
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger('flotilla')
+
+CHANGE_TABLES = ('assignments', 'services', 'status')
+
+
+class ServiceChanges(object):
+    """Tracks services with pending changes ("dirty" services).
+
+    This in-process feed is fed directly through `record`, subclasses fetch
+    change records from an external source in `poll`.
+    """
+
+    def __init__(self):
+        self._dirty = set()
+        self._created = set()
+        self._removed = set()
+        self._lock = threading.Lock()
+        self.stale = True
+
+    def poll(self):
+        pass
+
+    def checkpoint(self):
+        """Position of the feed, to resume from after a failover.
+        :return: Checkpoint (JSON serializable), None if not resumable.
+        """
+        return None
+
+    def restore(self, checkpoint):
+        """Resume the feed from a checkpoint.
+        :param checkpoint: Checkpoint.
+        :return: True if resumed, changes since the checkpoint are fed.
+        """
+        return False
+
+    def record(self, table, keys, image=None, event=None):
+        """Record a change to a table item.
+        :param table: Table name (see CHANGE_TABLES).
+        :param keys: Item keys.
+        :param image: Item attributes, if available.
+        :param event: Change type (INSERT, MODIFY or REMOVE), if available.
+        """
+        image = image or {}
+        if table == 'services':
+            service = keys.get('service_name')
+            if service and event == 'INSERT':
+                with self._lock:
+                    self._created.add(service)
+        elif table == 'status':
+            # Heartbeats don't matter, instances joining/leaving do:
+            if event == 'MODIFY':
+                return
+            service = keys.get('service')
+        elif table == 'assignments':
+            service = image.get('service')
+            # Deleted (e.g. expired) assignments must not be served cached:
+            instance_id = keys.get('instance_id')
+            if instance_id and event == 'REMOVE':
+                with self._lock:
+                    self._removed.add(instance_id)
+        else:
+            service = None
+
+        if service:
+            self.service_changed(service)
+
+    def service_changed(self, service):
+        with self._lock:
+            self._dirty.add(service)
+
+    def drain(self):
+        """Collect and reset dirty services.
+        :return: Services changed since the last drain.
+        """
+        with self._lock:
+            dirty = self._dirty
+            self._dirty = set()
+            self._created = set()
+            self.stale = False
+        return dirty
+
+    def drain_removed(self):
+        """Collect and reset instances whose assignment was deleted.
+        :return: Instance ids.
+        """
+        with self._lock:
+            removed = self._removed
+            self._removed = set()
+        return removed
+
+    def created(self):
+        """Services created since the last drain.
+        :return: Service names.
+        """
+        with self._lock:
+            return set(self._created)
+
+
+class DynamoStreamChanges(ServiceChanges):
+    """Change feed backed by DynamoDB Streams."""
+
+    def __init__(self, streams, stream_arns):
+        """
+        :param streams: DynamoDB Streams client.
+        :param stream_arns: Stream ARN by table name.
+        """
+        super(DynamoStreamChanges, self).__init__()
+        self._streams = streams
+        self._stream_arns = stream_arns
+        self._iterators = {}
+        self._described = set()
+        self._sequences = {}
+        self._resume = {}
+
+    def checkpoint(self):
+        return {'%s %s' % shard: sequence
+                for shard, sequence in self._sequences.items()}
+
+    def restore(self, checkpoint):
+        self._resume = {tuple(shard.split(' ', 1)): sequence
+                        for shard, sequence in checkpoint.items()}
+        self._sequences = dict(self._resume)
+        self._iterators = {}
+        # Shards not in the checkpoint are read in full:
+        self._described = set(self._stream_arns)
+        self.stale = False
+        return True
+
+    def poll(self):
+        try:
+            for table, stream_arn in self._stream_arns.items():
+                self._describe_shards(table, stream_arn)
+
+            for shard, iterator in self._iterators.items():
+                if not iterator:
+                    continue
+                table = shard[0]
+                records = self._streams.get_records(ShardIterator=iterator)
+                for record in records.get('Records', ()):
+                    change = record['dynamodb']
+                    self._sequences[shard] = change['SequenceNumber']
+                    image = change.get('NewImage') or change.get('OldImage')
+                    self.record(table, self._strings(change.get('Keys')),
+                                self._strings(image),
+                                record.get('eventName'))
+                self._iterators[shard] = records.get('NextShardIterator')
+        except ClientError as e:
+            logger.warn('Change feed interrupted, reconciling: %s', e)
+            self._iterators = {}
+            self._described = set()
+            self._sequences = {}
+            self._resume = {}
+            self.stale = True
+
+    def _describe_shards(self, table, stream_arn):
+        shards = self._list_shards(stream_arn)
+        # Shards found on startup are read from now, later shards in full:
+        if table in self._described:
+            iterator_type = 'TRIM_HORIZON'
+        else:
+            iterator_type = 'LATEST'
+            self._described.add(table)
+        shard_keys = set((table, shard['ShardId']) for shard in shards)
+        # Shards trimmed from the stream are forgotten, closed shards are
+        # kept (without iterator) until then:
+        for shard_key in self._sequences.keys() + self._iterators.keys():
+            if shard_key[0] == table and shard_key not in shard_keys:
+                self._sequences.pop(shard_key, None)
+                self._iterators.pop(shard_key, None)
+
+        for shard in shards:
+            shard_key = (table, shard['ShardId'])
+            if shard_key in self._iterators:
+                continue
+            position = {'ShardIteratorType': iterator_type}
+            sequence = self._resume.pop(shard_key, None)
+            if sequence:
+                position = {'ShardIteratorType': 'AFTER_SEQUENCE_NUMBER',
+                            'SequenceNumber': sequence}
+            iterator = self._streams.get_shard_iterator(
+                    StreamArn=stream_arn,
+                    ShardId=shard['ShardId'],
+                    **position)
+            self._iterators[shard_key] = iterator['ShardIterator']
+
+    def _list_shards(self, stream_arn):
+        """List all shards of a stream, following pages.
+        :param stream_arn: Stream ARN.
+        :return: Shard descriptions.
+        """
+        shards = []
+        describe_args = {'StreamArn': stream_arn}
+        while True:
+            stream = self._streams.describe_stream(**describe_args)
+            description = stream['StreamDescription']
+            shards += description['Shards']
+            last_shard = description.get('LastEvaluatedShardId')
+            if not last_shard:
+                return shards
+            describe_args['ExclusiveStartShardId'] = last_shard
+
+    @staticmethod
+    def _strings(image):
+        if not image:
+            return {}
+        return {k: v['S'] for k, v in image.items() if 'S' in v}
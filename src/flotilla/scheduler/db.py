@@ -1,26 +1,101 @@
 import logging
 import time
-from boto.dynamodb2.exceptions import ItemNotFound
+from copy import deepcopy
+from boto.dynamodb2.exceptions import ConditionalCheckFailedException, \
+    ItemNotFound
 from boto.dynamodb2.items import Item
 from collections import defaultdict
+from flotilla.model import EXPIRES, GLOBAL_ROLLOUT, INSTANCE_EXPIRY, \
+    assignment_generation_id, global_assignment_id, global_shard
 
 logger = logging.getLogger('flotilla')
 
-INSTANCE_EXPIRY = 300
 REV_LENGTH = 64
+# Packed services are rescanned this often (seconds), owned services are
+# updated as their weights are loaded:
+PACKED_SCAN_INTERVAL = 300
+ASSIGNMENT_ATTRIBUTES = ('instance_id', 'service', 'assignment', 'packed',
+                         'staged', 'prepared', EXPIRES)
+
+
+def _running(status, rev):
+    """Are all units of a revision active in an instance status?"""
+    rev_status = [unit_status for unit, unit_status in status.items()
+                  if rev in unit]
+    return bool(rev_status) and all(unit_status.get('active_state') == 'active'
+                                    for unit_status in rev_status)
+
+
+def _unexpired():
+    """Filter of items that have not expired, or predate expiry.
+    Must be combined with conditional_operator='OR'."""
+    return {EXPIRES + '__gt': int(time.time()), EXPIRES + '__null': True}
+
+
+def _ramping(service):
+    """Is a revision delivery of a service in progress?"""
+    return (service.get('delivery') or {}).get('state') == 'ramping'
+
+
+def _replicas(service):
+    """Replica counts of the weighted revisions of a packed service."""
+    return {k: int(v) for k, v in service.items()
+            if len(k) == REV_LENGTH and v > 0}
+
+
+def _cached(assignment):
+    """Attributes of an assignment item kept in the cache."""
+    return {attribute: assignment[attribute]
+            for attribute in ASSIGNMENT_ATTRIBUTES
+            if assignment.get(attribute) is not None}
 
 
 class FlotillaSchedulerDynamo(object):
-    def __init__(self, assignments, regions, services, stacks, status):
+    def __init__(self, assignments, regions, services, stacks, status,
+                 revisions=None, snapshot_ttl=0):
+        """
+        :param snapshot_ttl: Reuse a full scan of services for this long
+        (seconds), typically the scheduler loop interval.
+        """
         self._assignments = assignments
         self._regions = regions
         self._services = services
         self._stacks = stacks
         self._status = status
+        self._revisions = revisions
 
-        # TODO: shard scan for multiple schedulers
+        self._zones = {}
+        self._prepared = {}
+        self._health = {}
+        self._capacity = {}
+        self._standby = {}
+        self._two_phase = set()
+        # Revision being delivered by service, for services seen with a
+        # delivery ramping as of their last load:
+        self._ramping = {}
         self._segments = 1
-        self._segment = 0
+        self._scan_segments = [0]
+        # Services seen by the last scan of the owned segments:
+        self._segment_services = set()
+        # Pending instances of the global shard being rolled out, by
+        # (revision, shard, shards):
+        self._global_pending = {}
+        # Packed services (time of the last scan, revisions by service):
+        self._packed = (0, {})
+        # Last full scan of services, patched as services are loaded
+        # (time, item data by service):
+        self._snapshot_ttl = snapshot_ttl
+        self._snapshot = (0, {})
+
+        # Assignments by service (None if unassigned), valid while the
+        # generation of the service is unchanged:
+        self._assignment_cache = {}
+        self._assignment_services = {}
+        self._generations = {}
+        # Service by expired instance, until deleted:
+        self._dead = {}
+        # Live instances by service, as of the last load:
+        self._live = {}
 
     def get_all_revision_weights(self):
         """Load services, revisions and weights"""
@@ -28,6 +103,7 @@ class FlotillaSchedulerDynamo(object):
         rev_count = 0
         for service in self.services():
             name = service['service_name']
+            self._service_options(name, service)
 
             service_revs = {k: int(v) for k, v in service.items()
                             if len(k) == REV_LENGTH and v >= 0}
@@ -45,19 +121,149 @@ class FlotillaSchedulerDynamo(object):
         service = self.get_service(service_name)
         if not service:
             return {}
+        self._service_options(service_name, service)
         return {k: int(v) for k, v in service.items()
                 if len(k) == REV_LENGTH and v >= 0}
 
+    def _service_options(self, service_name, service):
+        self._standby[service_name] = int(service.get('standby') or 0)
+        if service.get('two_phase'):
+            self._two_phase.add(service_name)
+        else:
+            self._two_phase.discard(service_name)
+        if _ramping(service):
+            self._ramping[service_name] = service['delivery'].get('revision')
+        else:
+            self._ramping.pop(service_name, None)
+        packed = self._packed[1]
+        if service.get('placement') == 'packed':
+            packed[service_name] = _replicas(service)
+        else:
+            packed.pop(service_name, None)
+
     def get_service(self, service_name):
         try:
-            return self._services.get_item(service_name=service_name)
+            service = self._services.get_item(service_name=service_name)
         except ItemNotFound:
-            return None
+            service = None
+        snapshot_time, snapshot = self._snapshot
+        if snapshot_time and self.owns_service(service_name):
+            if service:
+                snapshot[service_name] = deepcopy(dict(service))
+            else:
+                snapshot.pop(service_name, None)
+        return service
+
+    def refresh_snapshot(self):
+        """Mark the last full scan of services current: every service
+        changed since was loaded again.
+        """
+        snapshot_time, snapshot = self._snapshot
+        if snapshot_time:
+            self._snapshot = (time.time(), snapshot)
+
+    def set_segments(self, segments, total_segments):
+        """Limit services to segments of the services table.
+        :param segments: Segments to scan.
+        :param total_segments: Total segments.
+        """
+        self._scan_segments = list(segments)
+        self._segments = total_segments
+        self._segment_services = set()
+        self._dead.clear()
+        self._snapshot = (0, {})
+
+    @property
+    def primary(self):
+        """Is this the scheduler of the first segment (region resources)?"""
+        return 0 in self._scan_segments
+
+    def owns_service(self, service_name):
+        """Is a service within the owned segments?
+        Services are attributed to segments when seen by a scan.
+        :param service_name: Service name.
+        """
+        if self._segments == 1:
+            return True
+        return service_name in self._segment_services
+
+    def services(self, attributes=None, shared=False):
+        """Scan services in the owned segments.
+        :param attributes: Attributes to load (all if None).
+        :param shared: Reuse the last full scan, if recent.
+        :return: Service items.
+        """
+        snapshot_time, snapshot = self._snapshot
+        if shared and time.time() - snapshot_time < self._snapshot_ttl:
+            return [self._service_item(data, attributes)
+                    for data in snapshot.values()]
+
+        # DynamoDB charges for whole items, projections only save transfer:
+        scan_time = time.time()
+        if self._segments == 1:
+            services = [s for s in self._services.scan(attributes=attributes)]
+        else:
+            services = []
+            for segment in self._scan_segments:
+                services += self._services.scan(
+                        segment=segment, total_segments=self._segments,
+                        attributes=attributes)
+            self._segment_services = set(service['service_name']
+                                         for service in services)
+        if attributes is None and self._snapshot_ttl:
+            self._snapshot = (scan_time,
+                              {service['service_name']:
+                               deepcopy(dict(service))
+                               for service in services})
+        return services
+
+    def _service_item(self, data, attributes=None):
+        if attributes:
+            data = {k: v for k, v in data.items() if k in attributes}
+        return Item(self._services, data=deepcopy(data), loaded=True)
+
+    def get_deliveries(self):
+        """Load owned services with a revision delivery in progress.
+        Deliveries are found as services are loaded by scheduling passes,
+        only those services are read.
+        :return: Service items.
+        """
+        deliveries = []
+        for service_name in sorted(self._ramping):
+            service = self.owns_service(service_name) and \
+                self.get_service(service_name)
+            if service and _ramping(service):
+                deliveries.append(service)
+            else:
+                self._ramping.pop(service_name, None)
+        return deliveries
+
+    def get_ramping(self):
+        """Get deliveries in progress, to hand over to the next leader.
+        :return: Delivered revision by service name.
+        """
+        return dict(self._ramping)
 
-    def services(self):
-        for service in self._services.scan(segment=self._segment,
-                                           total_segments=self._segments):
-            yield service
+    def restore_ramping(self, ramping):
+        """Resume deliveries found by a previous leader. Services that are
+        no longer ramping are dropped as deliveries are loaded.
+        :param ramping: Delivered revision by service name.
+        """
+        for service_name, revision in ramping.items():
+            self._ramping.setdefault(service_name, revision)
+
+    def set_delivery(self, service_item):
+        """Store delivery progress and weights, unless the service changed
+        since it was loaded.
+        :param service_item: Service item.
+        :return: True if stored.
+        """
+        try:
+            return service_item.partial_save()
+        except ConditionalCheckFailedException:
+            logger.info('Service %s changed, not updating delivery.',
+                        service_item['service_name'])
+            return False
 
     def get_stacks(self):
         return [s for s in self._stacks.scan()]
@@ -77,6 +283,17 @@ class FlotillaSchedulerDynamo(object):
             for service in services:
                 batch.put_item(service)
 
+    def set_service_outputs(self, services):
+        """Store stack outputs of services, loaded with any projection.
+        :param services: Service items.
+        """
+        for service in services:
+            try:
+                service.partial_save()
+            except ConditionalCheckFailedException:
+                logger.info('Service %s changed, not storing outputs.',
+                            service['service_name'])
+
     def set_assignment(self, service, machine, assignment):
         self._assignments.put_item(data={
             'service_name': service,
@@ -85,67 +302,461 @@ class FlotillaSchedulerDynamo(object):
         }, overwrite=True)
 
     def set_assignments(self, assignments):
-        """Store assignments in a batch.
-        :param assignments: Assignments to store.
+        """Store changed attributes of assignments, unless another scheduler
+        changed them since they were loaded.
+        :param assignments: Assignment items.
+        :return: Instance ids of assignments that were not stored.
+        Expiry is left to agents, set once they refresh their assignment.
         """
-        with self._assignments.batch_write() as batch:
-            for assignment in assignments:
-                batch.put_item(assignment)
+        stored = []
+        conflicts = []
+        for assignment in assignments:
+            try:
+                assignment.partial_save()
+                stored.append(assignment)
+            except ConditionalCheckFailedException:
+                conflicts.append(assignment['instance_id'])
+        self._cache_assignments(stored)
+        if conflicts:
+            logger.info('%d assignments changed since they were loaded.',
+                        len(conflicts))
+            self.forget_assignments(conflicts)
+        return conflicts
 
-    def get_instance_assignments(self, service):
-        """Get instances and assignments for a service
-        :param service:  Service name.
-        :return: Map of instances of assignments (None if unassigned).
+    def clear_assignments(self):
+        """Drop all cached assignments, to be loaded again."""
+        self._assignment_cache.clear()
+        self._assignment_services.clear()
+
+    def forget_assignments(self, instance_ids):
+        """Drop cached assignments, to be loaded again.
+        :param instance_ids: Instance ids.
+        """
+        for instance_id in instance_ids:
+            service = self._assignment_services.pop(instance_id, None)
+            cached = self._assignment_cache.get(service)
+            if cached:
+                cached[1].pop(instance_id, None)
+
+    def _cache_assignments(self, assignments):
+        """Update cached assignments after a write, and the generation of
+        their services.
+        :param assignments: Stored assignment items.
+        """
+        services = set()
+        for assignment in assignments:
+            instance_id = assignment['instance_id']
+            service = self._assignment_services.get(instance_id)
+            cached = self._assignment_cache.get(service)
+            if cached is None:
+                continue
+            cached[1][instance_id] = _cached(assignment)
+            services.add(service)
+        for service in services:
+            self._next_generation(service)
+
+    def get_generation(self, service):
+        """Load the generation of a service's assignments, bumped by every
+        scheduler write.
+        :param service: Service name.
+        :return: Generation.
+        """
+        return self._load_generation(service)
+
+    def _load_generation(self, service):
+        try:
+            generation = self._assignments.get_item(
+                    instance_id=assignment_generation_id(service),
+                    consistent=True)
+        except ItemNotFound:
+            generation = Item(self._assignments, data={
+                'instance_id': assignment_generation_id(service),
+                'generation': 0
+            })
+        self._generations[service] = generation
+        return int(generation['generation'])
+
+    def _next_generation(self, service):
+        """Count a write to the assignments of a service, unless another
+        scheduler wrote since they were loaded.
+        """
+        generation = self._generations[service]
+        generation['generation'] = int(generation['generation']) + 1
+        try:
+            generation.partial_save()
+            self._assignment_cache[service] = (
+                generation['generation'], self._assignment_cache[service][1])
+        except ConditionalCheckFailedException:
+            logger.info('Assignments of %s changed, reloading.', service)
+            self._assignment_cache.pop(service, None)
+            self._generations.pop(service, None)
+
+    def get_live_instances(self, service):
+        """Get live instances of a service. Expired instances are filtered
+        by DynamoDB, dead instances stored without expiry are left for the
+        reaper.
+        :param service: Service name.
+        :return: Live instance ids.
         """
         live_instances = []
         dead_instances = []
         dead_cutoff = time.time() - INSTANCE_EXPIRY
-        for instance_status in self._status.query_2(service__eq=service,
-                                                    attributes=('instance_id',
-                                                                'status_time')):
+        for instance_status in self._status.query_2(
+                service__eq=service,
+                attributes=('instance_id', 'status_time',
+                            'availability_zone', 'prepared', 'failed_units',
+                            'deploy_time', 'cpu', 'memory'),
+                query_filter=_unexpired(), conditional_operator='OR'):
             instance_id = instance_status['instance_id']
             if instance_status['status_time'] < dead_cutoff:
                 dead_instances.append(instance_id)
             else:
                 live_instances.append(instance_id)
+                self._dead.pop(instance_id, None)
+                zone = instance_status.get('availability_zone')
+                if zone:
+                    self._zones[instance_id] = zone
+                prepared = instance_status.get('prepared')
+                if prepared:
+                    self._prepared[instance_id] = frozenset(prepared)
+                else:
+                    self._prepared.pop(instance_id, None)
+                self._health[instance_id] = (
+                    int(instance_status.get('failed_units') or 0),
+                    float(instance_status.get('deploy_time') or 0))
+                if 'cpu' in instance_status:
+                    self._capacity[instance_id] = (
+                        int(instance_status['cpu']),
+                        int(instance_status.get('memory', 0)))
 
         if dead_instances:
-            logger.debug('Removing %d dead instances.', len(dead_instances))
-            with self._status.batch_write() as status_batch:
-                for dead_instance in dead_instances:
-                    status_batch.delete_item(service=service,
-                                             instance_id=dead_instance)
+            logger.debug('Found %d dead instances.', len(dead_instances))
+            for dead_instance in dead_instances:
+                self._dead[dead_instance] = service
+
+        # Forget instances that died or expired since the last load:
+        live = set(live_instances)
+        gone = self._live.get(service, set()) - live
+        gone.update(dead_instances)
+        self._live[service] = live
+        for instance_id in gone:
+            self._zones.pop(instance_id, None)
+            self._prepared.pop(instance_id, None)
+            self._health.pop(instance_id, None)
+            self._capacity.pop(instance_id, None)
+        self.forget_assignments(gone)
+        return live_instances
+
+    def get_dead_instances(self, limit=None):
+        """Get dead instances found while loading live instances.
+        :param limit: Maximum instances.
+        :return: (service, instance id) of instances not yet deleted.
+        """
+        dead = [(service, instance_id)
+                for instance_id, service in self._dead.items()]
+        return sorted(dead)[:limit]
+
+    def delete_instances(self, instances):
+        """Delete status and assignments of dead instances. Instances that
+        reported status since they were found dead are kept.
+        :param instances: (service, instance id) of dead instances.
+        :return: Instances deleted.
+        """
+        if not instances:
+            return 0
+        cutoff = time.time() - INSTANCE_EXPIRY
+        deleted = []
+        for service, instance_id in instances:
+            self._dead.pop(instance_id, None)
+            if self._status.delete_item(
+                    expected={'status_time__lt': cutoff,
+                              'status_time__null': True},
+                    conditional_operator='OR',
+                    service=service, instance_id=instance_id):
+                deleted.append(instance_id)
+            else:
+                logger.debug('Instance %s reported again, not deleted.',
+                             instance_id)
+        if deleted:
             with self._assignments.batch_write() as assignment_batch:
-                for dead_instance in dead_instances:
-                    assignment_batch.delete_item(instance_id=dead_instance)
+                for instance_id in deleted:
+                    assignment_batch.delete_item(instance_id=instance_id)
+        return len(deleted)
+
+    def clear_dead_instances(self):
+        """Forget dead instances, another scheduler finds them again."""
+        self._dead.clear()
+
+    def get_standby(self, service_name):
+        """Get the standby pool size of a service.
+        :param service_name: Service name.
+        :return: Standby instance count (as of the last weight load).
+        """
+        return self._standby.get(service_name, 0)
+
+    def get_delivering(self, service_name):
+        """Get the revision being delivered to a service.
+        :param service_name: Service name.
+        :return: Revision, None if no delivery is ramping (as of the last
+        weight load).
+        """
+        return self._ramping.get(service_name)
+
+    def get_two_phase(self, service_name):
+        """Check whether a service cuts over in two phases.
+        :param service_name: Service name.
+        :return: True if instances prepare revisions before moving (as of
+        the last weight load).
+        """
+        return service_name in self._two_phase
+
+    def get_prepared(self, instance_ids):
+        """Get revisions live instances acknowledge as prepared.
+        :param instance_ids: Instance ids (from get_live_instances).
+        :return: Prepared revisions by instance id, for instances that
+        report any.
+        """
+        return {instance_id: self._prepared[instance_id]
+                for instance_id in instance_ids
+                if instance_id in self._prepared}
+
+    def get_instance_health(self, instance_ids):
+        """Get health of live instances.
+        :param instance_ids: Instance ids (from get_live_instances).
+        :return: Failed unit count and last deploy time (seconds) by
+        instance id.
+        """
+        return {instance_id: self._health[instance_id]
+                for instance_id in instance_ids
+                if instance_id in self._health}
+
+    def get_instance_zones(self, instance_ids):
+        """Get availability zones of live instances.
+        :param instance_ids: Instance ids (from get_live_instances).
+        :return: Availability zone by instance id, for instances that report
+        one.
+        """
+        return {instance_id: self._zones[instance_id]
+                for instance_id in instance_ids
+                if instance_id in self._zones}
+
+    def get_instance_assignments(self, service, live_instances=None,
+                                 generation=None):
+        """Get instances and assignments for a service
+        :param service:  Service name.
+        :param live_instances: Live instances, if already known.
+        :param generation: Generation of the assignments, if already loaded.
+        :return: Map of instances of assignments (None if unassigned).
+        """
+        if live_instances is None:
+            live_instances = self.get_live_instances(service)
 
         assignments = defaultdict(list)
         if not live_instances:
             return assignments
 
-        unassigned = set(live_instances)
-        keys = [{'instance_id': i} for i in live_instances]
-        for assignment in self._assignments.batch_get(keys=keys, attributes=(
-                'instance_id', 'assignment')):
-            assigned = assignment['assignment']
-            instance_id = assignment['instance_id']
-            unassigned.remove(instance_id)
-            assignments[assigned].append(assignment)
-
-        assignments[None] = [Item(self._assignments, data={
-            'instance_id': instance_id,
-            'service': service
-        }) for instance_id in unassigned]
+        # Only load instances unknown to the cache, all if another scheduler
+        # wrote since the cache was loaded:
+        if generation is None:
+            generation = self._load_generation(service)
+        cached_generation, cached = self._assignment_cache.get(service,
+                                                               (None, {}))
+        if cached_generation != generation:
+            if cached_generation is not None:
+                logger.info('Assignments of %s changed, reloading.', service)
+            cached = {}
+            self._assignment_cache[service] = (generation, cached)
+        unknown = [i for i in live_instances if i not in cached]
+        if unknown:
+            for instance_id in unknown:
+                cached[instance_id] = None
+                self._assignment_services[instance_id] = service
+            keys = [{'instance_id': i} for i in unknown]
+            for assignment in self._assignments.batch_get(
+                    keys=keys, attributes=ASSIGNMENT_ATTRIBUTES):
+                cached[assignment['instance_id']] = _cached(assignment)
 
+        for instance_id in live_instances:
+            assignment = cached[instance_id]
+            if assignment:
+                assignments[assignment['assignment']].append(Item(
+                        self._assignments, data=dict(assignment),
+                        loaded=True))
+            else:
+                assignments[None].append(Item(self._assignments, data={
+                    'instance_id': instance_id,
+                    'service': service
+                }))
         return assignments
 
+    def get_deploying_instances(self, service, assignments):
+        """Get instances that are not yet running their assignment.
+        :param service: Service name.
+        :param assignments: Assigned revision by instance id.
+        :return: Instance ids.
+        """
+        deploying = set()
+        for status in self._status.query_2(service__eq=service,
+                                           query_filter=_unexpired(),
+                                           conditional_operator='OR'):
+            instance_id = status['instance_id']
+            rev = assignments.get(instance_id)
+            if rev and not _running(status, rev):
+                deploying.add(instance_id)
+        return deploying
+
+    def get_packed_services(self):
+        """Get revision replica counts of services packed onto instances.
+        :return: Replica count by revision, by service name.
+        """
+        scan_time, packed = self._packed
+        if time.time() - scan_time > PACKED_SCAN_INTERVAL:
+            scan_time = time.time()
+            packed = {service['service_name']: _replicas(service)
+                      for service in self._services.scan(
+                          placement__eq='packed')}
+            self._packed = (scan_time, packed)
+        return dict(packed)
+
+    def get_instance_capacity(self):
+        """Get resources reported by live instances, as of their last load.
+        :return: (cpu, memory) by instance id.
+        """
+        return dict(self._capacity)
+
+    def get_assignment_items(self, instance_ids):
+        """Load assignments of instances, from the assignment cache if the
+        instance's service was scheduled since its generation last changed.
+        :param instance_ids: Instance ids.
+        :return: Assignment item by instance id.
+        """
+        items = {}
+        unknown = []
+        for instance_id in instance_ids:
+            service = self._assignment_services.get(instance_id)
+            cached = self._assignment_cache.get(service, (None, {}))[1]
+            if instance_id not in cached:
+                unknown.append(instance_id)
+            elif cached[instance_id]:
+                items[instance_id] = Item(self._assignments,
+                                          data=dict(cached[instance_id]),
+                                          loaded=True)
+        if unknown:
+            keys = [{'instance_id': i} for i in unknown]
+            for assignment in self._assignments.batch_get(
+                    keys=keys, attributes=ASSIGNMENT_ATTRIBUTES):
+                items[assignment['instance_id']] = assignment
+        return items
+
+    def get_revision_requests(self, revs):
+        """Load resource requests of revisions.
+        :param revs: Revision hashes.
+        :return: (cpu, memory) by revision.
+        """
+        if not revs:
+            return {}
+        keys = [{'rev_hash': rev} for rev in revs]
+        return {revision['rev_hash']: (int(revision.get('cpu', 0)),
+                                       int(revision.get('memory', 0)))
+                for revision in self._revisions.batch_get(
+                keys=keys, attributes=('rev_hash', 'cpu', 'memory'))}
+
+    def set_packed(self, assignments):
+        """Store changed packed revisions of assignments.
+        Assignments modified since they were loaded are skipped.
+        :param assignments: Assignment items.
+        :return: Assignments stored.
+        """
+        stored = []
+        conflicts = []
+        for assignment in assignments:
+            try:
+                assignment.partial_save()
+                stored.append(assignment)
+            except ConditionalCheckFailedException:
+                logger.debug('Assignment of %s changed, not packing.',
+                             assignment['instance_id'])
+                conflicts.append(assignment['instance_id'])
+        self._cache_assignments(stored)
+        self.forget_assignments(conflicts)
+        return len(stored)
+
+    def get_global_rollout(self):
+        """Load the staged global rollout.
+        :return: Rollout item, None if there is none.
+        """
+        try:
+            return self._assignments.get_item(instance_id=GLOBAL_ROLLOUT,
+                                              consistent=True)
+        except ItemNotFound:
+            return None
+
+    def set_global_rollout(self, rollout):
+        """Store rollout progress, unless changed since it was loaded.
+        :param rollout: Rollout item.
+        :return: True if stored.
+        """
+        try:
+            return rollout.partial_save()
+        except ConditionalCheckFailedException:
+            logger.info('Global rollout changed, not updating.')
+            return False
+
+    def set_global_assignment(self, shard, rev):
+        """Assign a revision to a global assignment shard.
+        :param shard: Shard.
+        :param rev: Revision.
+        """
+        self._assignments.put_item(data={
+            'instance_id': global_assignment_id(shard),
+            'assignment': rev
+        }, overwrite=True)
+
+    def get_global_pending(self, rev, shard, shards):
+        """Get live instances of a shard not yet running a revision.
+        The shard is scanned once, then only its pending instances are read
+        until they run the revision or die.
+        :param rev: Revision.
+        :param shard: Shard.
+        :param shards: Global assignment shards.
+        :return: Instance ids.
+        """
+        key = (rev, shard, shards)
+        pending = self._global_pending.get(key)
+        if pending is None:
+            statuses = self._status.scan(conditional_operator='OR',
+                                         **_unexpired())
+        elif pending:
+            statuses = self._status.batch_get(keys=[
+                {'service': service, 'instance_id': instance_id}
+                for instance_id, service in pending.items()])
+        else:
+            return set()
+
+        pending = {}
+        now = time.time()
+        cutoff = now - INSTANCE_EXPIRY
+        for status in statuses:
+            instance_id = status['instance_id']
+            expires = status.get(EXPIRES)
+            if status['status_time'] < cutoff or \
+                    (expires and int(expires) <= now) or \
+                    global_shard(instance_id, shards) != shard:
+                continue
+            if not _running(status, rev):
+                pending[instance_id] = status['service']
+        self._global_pending = {key: pending}
+        return set(pending)
+
     def get_region_params(self, region):
         region_item = self._regions.get_item(region_name=region)
         return dict(region_item)
 
     def get_service_status(self, service, rev, instance=None):
         cutoff = time.time() - INSTANCE_EXPIRY
-        for status in self._status.query_2(service__eq=service):
+        for status in self._status.query_2(service__eq=service,
+                                           query_filter=_unexpired(),
+                                           conditional_operator='OR'):
             instance_id = status['instance_id']
             if instance_id == instance or status['status_time'] < cutoff:
                 continue
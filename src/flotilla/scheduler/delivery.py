@@ -0,0 +1,162 @@
+import logging
+import time
+from flotilla.model import FAILED_STATES
+from flotilla.scheduler.db import REV_LENGTH
+
+logger = logging.getLogger('flotilla')
+
+DELIVERY_RAMPING = 'ramping'
+DELIVERY_COMPLETE = 'complete'
+DELIVERY_ROLLED_BACK = 'rolled_back'
+
+# A step that is not healthy within this many bake periods is rolled back:
+STEP_TIMEOUT_BAKES = 3
+
+HEALTH_RED = 'red'
+HEALTH_PENDING = 'pending'
+HEALTH_GREEN = 'green'
+
+
+def step_weights(rev, percent, baseline):
+    """Weights giving a revision a share of the service.
+    :param rev: Revision being delivered.
+    :param percent: Share of the revision (1-100).
+    :param baseline: Weights of the other revisions before the delivery.
+    :return: Weight by revision.
+    """
+    weights = {rev: percent}
+    total = float(sum(baseline.values()))
+    for other_rev, weight in baseline.items():
+        weights[other_rev] = int(round(float(weight) * (100 - percent) /
+                                       total))
+    return weights
+
+
+class FlotillaDelivery(object):
+    """Ramps the weight of a revision through percentage steps.
+
+    A step is held until agents run the revision without failed units and
+    the ELB reports its instances in service, for a bake period. A failed
+    unit, a revision disabled by the ServiceDoctor or a step that does not
+    turn healthy rolls the service back to its weights before the delivery.
+    """
+
+    def __init__(self, scheduler, db, elb):
+        self._scheduler = scheduler
+        self._db = db
+        self._elb = elb
+
+    def advance(self):
+        if not self._scheduler.active:
+            return
+
+        for service_item in self._db.get_deliveries():
+            try:
+                self._advance(service_item)
+            except Exception as e:
+                logger.exception(e)
+
+    def _advance(self, service_item):
+        service = service_item['service_name']
+        delivery = service_item['delivery']
+        rev = delivery['revision']
+        weight = service_item.get(rev)
+        if weight is None or weight < 0:
+            logger.warn('Revision %s of %s was removed or disabled.', rev,
+                        service)
+            self._rollback(service_item)
+            return
+
+        step = int(delivery['step'])
+        now = time.time()
+        if step < 0:
+            delivery['baseline'] = {
+                r: int(w) for r, w in service_item.items()
+                if len(r) == REV_LENGTH and r != rev and w > 0}
+            self._step(service_item, 0)
+            return
+
+        health = self._health(service_item, rev)
+        # Numbers are loaded as Decimal:
+        bake = int(delivery['bake'])
+        healthy_since = float(delivery.get('healthy_since') or 0)
+        if health == HEALTH_RED:
+            self._rollback(service_item)
+        elif health == HEALTH_PENDING:
+            step_age = now - float(delivery['step_time'])
+            if step_age > bake * STEP_TIMEOUT_BAKES:
+                logger.warn('Step %d of %s in %s is not healthy.', step, rev,
+                            service)
+                self._rollback(service_item)
+            elif healthy_since:
+                delivery['healthy_since'] = 0
+                self._db.set_delivery(service_item)
+        elif not healthy_since:
+            delivery['healthy_since'] = now
+            self._db.set_delivery(service_item)
+        elif now - healthy_since >= bake:
+            if step + 1 < len(delivery['steps']):
+                self._step(service_item, step + 1)
+            else:
+                logger.info('Delivery of %s to %s complete.', rev, service)
+                delivery['state'] = DELIVERY_COMPLETE
+                self._db.set_delivery(service_item)
+
+    def _step(self, service_item, step):
+        delivery = service_item['delivery']
+        rev = delivery['revision']
+        percent = int(delivery['steps'][step])
+        logger.info('Delivering %s to %d%% of %s.', rev, percent,
+                    service_item['service_name'])
+        weights = step_weights(rev, percent, delivery['baseline'])
+        for weight_rev, weight in weights.items():
+            service_item[weight_rev] = weight
+        delivery['step'] = step
+        delivery['step_time'] = time.time()
+        delivery['healthy_since'] = 0
+        self._db.set_delivery(service_item)
+
+    def _rollback(self, service_item):
+        delivery = service_item['delivery']
+        rev = delivery['revision']
+        logger.warn('Rolling back delivery of %s to %s.', rev,
+                    service_item['service_name'])
+        for baseline_rev, weight in delivery.get('baseline', {}).items():
+            service_item[baseline_rev] = weight
+        if rev in service_item:
+            service_item[rev] = -abs(service_item[rev] or 1)
+        delivery['state'] = DELIVERY_ROLLED_BACK
+        self._db.set_delivery(service_item)
+
+    def _health(self, service_item, rev):
+        """
+        Health of a revision across the instances running it.
+        :param service_item: Service item.
+        :param rev: Revision.
+        :return: HEALTH_RED if a unit failed, HEALTH_PENDING until instances
+        run the revision and are in service.
+        """
+        running = set()
+        for instance_id, units_status in self._db.get_service_status(
+                service_item['service_name'], rev):
+            for status in units_status.values():
+                if status.get('active_state') in FAILED_STATES or \
+                        status.get('sub_state') in FAILED_STATES:
+                    logger.info('Unit of %s failed on %s.', rev, instance_id)
+                    return HEALTH_RED
+            if all(status.get('sub_state') == 'running'
+                   for status in units_status.values()):
+                running.add(instance_id)
+        if not running:
+            return HEALTH_PENDING
+
+        service_elb = (service_item.get('cf_outputs') or {}).get('Elb')
+        if service_elb:
+            elb_health = self._elb.describe_instance_health(
+                    LoadBalancerName=service_elb,
+                    Instances=[{'InstanceId': instance_id}
+                               for instance_id in running])
+            for instance_state in elb_health.get('InstanceStates', []):
+                if instance_state['State'] != 'InService':
+                    return HEALTH_PENDING
+        return HEALTH_GREEN
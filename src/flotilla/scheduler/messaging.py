@@ -1,5 +1,6 @@
 import json
 import logging
+import time
 
 logger = logging.getLogger('flotilla')
 
@@ -8,12 +9,18 @@ MESSAGE_SERVICE_FAILURE = 'ServiceDidNotStart'
 
 
 class FlotillaSchedulerMessaging(object):
-    def __init__(self, messages_q, scheduler, doctor):
+    def __init__(self, messages_q, scheduler, doctor, rollout=None):
         self._q = messages_q
         self._scheduler = scheduler
         self._doctor = doctor
+        self._rollout = rollout
 
     def receive(self):
+        # Leave messages for the active scheduler:
+        if not self._scheduler.active:
+            time.sleep(1)
+            return
+
         for msg in self._q.receive_messages(WaitTimeSeconds=20):
             try:
                 payload = json.loads(msg.body)
@@ -26,12 +33,17 @@ class FlotillaSchedulerMessaging(object):
             if msg_type == MESSAGE_RESCHEDULE:
                 service = payload['service']
                 logger.debug('Service reschedule: %s', service)
-                self._scheduler.schedule_service(service)
+                if not self._scheduler.schedule_service(service):
+                    # The owner's pass picks the change up:
+                    logger.debug('Not scheduling %s, owned by another '
+                                 'segment.', service)
             elif msg_type == MESSAGE_SERVICE_FAILURE:
                 service = payload['service']
                 rev = payload['revision']
                 instance = payload['instance']
                 self._doctor.failed_revision(service, rev, instance)
+                if self._rollout:
+                    self._rollout.failed_revision(rev, instance)
             else:
                 logger.warn('Unknown message: %s', msg_type)
             msg.delete()
@@ -0,0 +1,127 @@
+import logging
+from collections import Counter, defaultdict
+
+logger = logging.getLogger('flotilla')
+
+NO_REQUEST = (0, 0)
+
+
+def _fits(free, request):
+    return free[0] >= request[0] and free[1] >= request[1]
+
+
+def pack(hosts, replicas, requests, current=None):
+    """Place revision replicas on hosts, first-fit decreasing.
+
+    Current placements are kept while they are wanted and fit; remaining
+    replicas are placed largest first on the first host with room. Replicas
+    of a revision are spread over distinct hosts.
+    :param hosts: Free (cpu, memory) by instance id.
+    :param replicas: Replica count by revision.
+    :param requests: Requested (cpu, memory) by revision.
+    :param current: Packed revisions by instance id.
+    :return: Packed revisions by instance id, unplaced replica count.
+    """
+    free = {instance_id: list(host) for instance_id, host in hosts.items()}
+    wanted = Counter(replicas)
+    packed = defaultdict(set)
+
+    def place(instance_id, rev):
+        request = requests.get(rev, NO_REQUEST)
+        free[instance_id][0] -= request[0]
+        free[instance_id][1] -= request[1]
+        packed[instance_id].add(rev)
+        wanted[rev] -= 1
+
+    # Keep placements that are still valid:
+    for instance_id in sorted(current or {}):
+        if instance_id not in free:
+            continue
+        for rev in sorted(current[instance_id]):
+            if wanted[rev] > 0 and _fits(free[instance_id],
+                                         requests.get(rev, NO_REQUEST)):
+                place(instance_id, rev)
+
+    # Place remaining replicas by dominant share of the largest host:
+    max_cpu = max([host[0] for host in hosts.values()] + [1])
+    max_memory = max([host[1] for host in hosts.values()] + [1])
+
+    def size(rev):
+        cpu, memory = requests.get(rev, NO_REQUEST)
+        return max(float(cpu) / max_cpu, float(memory) / max_memory), rev
+
+    pending = [rev for rev, count in wanted.items() for _ in range(count)]
+    unplaced = 0
+    instance_ids = sorted(free)
+    for rev in sorted(pending, key=size, reverse=True):
+        request = requests.get(rev, NO_REQUEST)
+        for instance_id in instance_ids:
+            if rev not in packed[instance_id] and _fits(free[instance_id],
+                                                        request):
+                place(instance_id, rev)
+                break
+        else:
+            unplaced += 1
+    return packed, unplaced
+
+
+class FlotillaPacker(object):
+    """Packs revisions of services with `packed` placement onto the spare
+    capacity of instances, stored as `packed` revisions on their
+    assignment."""
+
+    def __init__(self, scheduler, db):
+        self._scheduler = scheduler
+        self._db = db
+        self.stats = Counter()
+
+    def pack(self):
+        if not self._scheduler.active or not self._db.primary:
+            return
+
+        replicas = {}
+        for revisions in self._db.get_packed_services().values():
+            replicas.update(revisions)
+        if not replicas:
+            logger.debug('No revisions to be packed.')
+            return
+
+        # Spare capacity of assigned instances:
+        capacity = self._db.get_instance_capacity()
+        assignments = self._db.get_assignment_items(capacity.keys())
+        requests = self._db.get_revision_requests(
+                set(replicas) | set(a['assignment']
+                                    for a in assignments.values()))
+        hosts = {}
+        current = {}
+        for instance_id, assignment in assignments.items():
+            current[instance_id] = set(assignment.get('packed') or [])
+            # Standby instances run nothing:
+            if assignment.get('staged'):
+                continue
+            cpu, memory = capacity[instance_id]
+            used = requests.get(assignment['assignment'], NO_REQUEST)
+            hosts[instance_id] = (cpu - used[0], memory - used[1])
+
+        packed, unplaced = pack(hosts, replicas, requests, current)
+        if unplaced:
+            logger.warn('Unable to place %d packed replicas.', unplaced)
+
+        changed = []
+        for instance_id, assignment in assignments.items():
+            instance_packed = packed.get(instance_id, set())
+            if instance_packed == current[instance_id]:
+                continue
+            if instance_packed:
+                assignment['packed'] = sorted(instance_packed)
+            else:
+                del assignment['packed']
+            changed.append(assignment)
+
+        if changed:
+            logger.info('Storing packed revisions of %d instances.',
+                        len(changed))
+            self._db.set_packed(changed)
+        self.stats['packed'] = sum(len(p) for p in packed.values())
+        self.stats['unplaced'] = unplaced
+        self.stats['repacked'] += len(changed)
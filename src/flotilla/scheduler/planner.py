@@ -0,0 +1,375 @@
+import hashlib
+import logging
+from collections import Counter, defaultdict
+
+logger = logging.getLogger('flotilla')
+
+# Deploy times within a bucket rank equally (seconds):
+DEPLOY_TIME_BUCKET = 10
+
+
+def rendezvous(instance_id, rev):
+    """Rendezvous (highest random weight) score of an instance for a rev."""
+    return hashlib.md5('%s:%s' % (instance_id, rev)).hexdigest()
+
+
+def health_rank(health):
+    """Rank of an instance for new work, lower is better: healthy before
+    failing, then by deploy time.
+    :param health: Failed unit count, last deploy time (seconds).
+    :return: Sort key.
+    """
+    failed_units, deploy_time = health
+    return failed_units > 0, int(deploy_time // DEPLOY_TIME_BUCKET)
+
+
+def spread(candidates, count, rev, zone_of, placed, release=False,
+           rank=None):
+    """Pick instances for (or from) a revision, balanced across zones.
+
+    Each pick takes the preferred instance of the zone with the fewest
+    instances of the revision (the most, when releasing).
+    :param candidates: Assignment items to pick from.
+    :param count: Instances to pick.
+    :param rev: Revision.
+    :param zone_of: Zone of an assignment item.
+    :param placed: Instance count of the revision by zone, updated.
+    :param release: Pick instances to release from the revision.
+    :param rank: Rank of an assignment item, lower ranks are picked first.
+    :return: Picked assignment items.
+    """
+    by_zone = defaultdict(list)
+    for candidate in candidates:
+        by_zone[zone_of(candidate)].append(candidate)
+    for zone_candidates in by_zone.values():
+        zone_candidates.sort(key=lambda a: rendezvous(a['instance_id'], rev),
+                             reverse=not release)
+        if rank:
+            zone_candidates.sort(key=rank)
+
+    picked = []
+    while len(picked) < count and by_zone:
+        if release:
+            zone = min(by_zone, key=lambda z: (-placed[z], z))
+            placed[zone] -= 1
+        else:
+            zone = min(by_zone, key=lambda z: (placed[z], z))
+            placed[zone] += 1
+        zone_candidates = by_zone[zone]
+        picked.append(zone_candidates.pop(0))
+        if not zone_candidates:
+            del by_zone[zone]
+    return picked
+
+
+def rollout_limit(max_unavailable, instance_count):
+    """Instances of a service that may be redeploying at once.
+    :param max_unavailable: Instance count, or percentage of instances (25%).
+    :param instance_count: Instances in the service.
+    :return: Limit (at least 1), None if unlimited.
+    """
+    if max_unavailable is None:
+        return None
+    value = str(max_unavailable).strip()
+    if value.endswith('%'):
+        limit = int(float(value[:-1]) * instance_count / 100)
+    else:
+        limit = int(value)
+    return max(limit, 1)
+
+
+def hold_targets(targets, current, weights, tolerance):
+    """Keep current instance counts that are within a dead-band of their
+    exact weighted share, so rounding shifts do not move healthy instances.
+
+    A count is held while it is within `tolerance` instances of the share,
+    and within half the share, so small revisions are never skewed (a 3:1
+    service on 4 instances does not hold 2/2). Revisions outside the band,
+    unweighted or without instances converge to their target. Instances
+    gained or lost go to (come from) the revisions furthest from their
+    target.
+    :param targets: Exact instance count by revision.
+    :param current: Current instance count by revision.
+    :param weights: Revision weights.
+    :param tolerance: Instances a count may differ from its share.
+    :return: Held instance count by revision, moves avoided.
+    """
+    instances = sum(targets.values())
+    total_weight = sum(weights.get(rev, 0) for rev in targets)
+    held = {}
+    for rev, target in targets.items():
+        count = current.get(rev, 0)
+        weight = weights.get(rev) or 0
+        # Distance from the share (weight * instances / total), scaled by
+        # total weight:
+        share = weight * instances
+        error = abs(count * total_weight - share)
+        if count and weight and error <= tolerance * total_weight and \
+                2 * error <= share:
+            held[rev] = count
+        else:
+            held[rev] = target
+
+    # Keep the total, moving the furthest revisions towards their target:
+    leftover = sum(targets.values()) - sum(held.values())
+    direction = 1 if leftover > 0 else -1
+    for rev in sorted(held, key=lambda r: (direction * (held[r] - targets[r]),
+                                           r)):
+        if not leftover:
+            break
+        step = direction * min(abs(leftover),
+                               max(direction * (targets[rev] - held[rev]), 0))
+        held[rev] += step
+        leftover -= step
+
+    avoided = sum(max(target - held[rev], 0)
+                  for rev, target in targets.items())
+    return held, avoided
+
+
+def _unstage(assignment_item):
+    if assignment_item.get('staged'):
+        del assignment_item['staged']
+
+
+class AssignmentPlan(object):
+    """Assignment changes for a service."""
+
+    def __init__(self):
+        self.reassigned = []
+        self.moves = []
+        self.deferred = []
+        self.zones = {}
+        self.promoted = 0
+        self.staged = 0
+        # Instances that were standby before the plan:
+        self.standby = set()
+        # Two-phase cutover: moves waiting on preparation, and the assignment
+        # items whose prepared revision changed:
+        self.preparing = []
+        self.prepared = []
+
+    @property
+    def churn(self):
+        """Serving instances moved away from their assignment."""
+        return len([m for m in self.moves
+                    if m[1] and m[0] not in self.standby])
+
+    def move(self, assignment_item, rev):
+        """Assign a serving instance to a revision."""
+        self._record(assignment_item, rev)
+        _unstage(assignment_item)
+
+    def stage(self, assignment_item, rev):
+        """Assign a standby instance, it prepares the revision but does not
+        start it."""
+        self._record(assignment_item, rev)
+        assignment_item['staged'] = True
+        self.staged += 1
+
+    def promote(self, assignment_item):
+        """Start the revision a standby instance has prepared."""
+        self._record(assignment_item, assignment_item['assignment'])
+        _unstage(assignment_item)
+        self.promoted += 1
+
+    def _record(self, assignment_item, rev):
+        instance_id = assignment_item['instance_id']
+        if assignment_item.get('staged'):
+            self.standby.add(instance_id)
+        self.moves.append((instance_id, assignment_item.get('assignment'),
+                           rev))
+        assignment_item['assignment'] = rev
+        self.reassigned.append(assignment_item)
+
+    def prepare(self, assignment_items, acknowledged):
+        """Hold moves of serving instances until they acknowledge having
+        prepared the new revision. Unassigned and standby instances are not
+        serving, they move directly.
+        :param assignment_items: Assignment items of the service.
+        :param acknowledged: Prepared revisions by instance id.
+        :return: Moves waiting on preparation.
+        """
+        moves = []
+        reassigned = []
+        moving = set()
+        for move, assignment_item in zip(self.moves, self.reassigned):
+            instance_id, previous, rev = move
+            moving.add(instance_id)
+            if not previous or instance_id in self.standby or \
+                    assignment_item.get('staged'):
+                pass
+            elif assignment_item.get('prepared') == rev and \
+                    rev in acknowledged.get(instance_id, ()):
+                del assignment_item['prepared']
+            else:
+                assignment_item['assignment'] = previous
+                self.preparing.append(move)
+                if assignment_item.get('prepared') != rev:
+                    assignment_item['prepared'] = rev
+                    self.prepared.append(assignment_item)
+                continue
+            moves.append(move)
+            reassigned.append(assignment_item)
+        self.moves = moves
+        self.reassigned = reassigned
+
+        # Preparations that are no longer wanted:
+        for assignment_item in assignment_items:
+            if assignment_item.get('prepared') and \
+                    assignment_item['instance_id'] not in moving:
+                del assignment_item['prepared']
+                self.prepared.append(assignment_item)
+        return len(self.preparing)
+
+    def limit(self, budget, unavailable=()):
+        """Defer moves of serving instances beyond a budget.
+        Moves of unassigned, standby or already unavailable instances are
+        free.
+        :param budget: Serving instances that may be moved.
+        :param unavailable: Instances that are not serving.
+        :return: Deferred move count.
+        """
+        moves = []
+        reassigned = []
+        for move, assignment_item in zip(self.moves, self.reassigned):
+            instance_id, previous, _ = move
+            if previous and instance_id not in unavailable and \
+                    instance_id not in self.standby:
+                if budget <= 0:
+                    assignment_item['assignment'] = previous
+                    _unstage(assignment_item)
+                    self.deferred.append(move)
+                    continue
+                budget -= 1
+            moves.append(move)
+            reassigned.append(assignment_item)
+        self.moves = moves
+        self.reassigned = reassigned
+        return len(self.deferred)
+
+
+class AssignmentPlanner(object):
+    """Plans minimal, stable reassignments towards target counts.
+
+    Only surplus instances are moved. Which instances leave or join a
+    revision is decided by rendezvous hashing of instance and revision, so
+    repeated weight changes move the same instances back and forth instead
+    of arbitrary ones. Instances join and leave a revision so that it is
+    spread evenly across availability zones; an existing imbalance alone
+    does not move instances.
+
+    Standby instances are staged with the revision of the largest target;
+    they fill deficits before any other instance.
+
+    Within a zone, healthy instances with fast deploys take new work first.
+    """
+
+    def plan(self, service, current_assignments, target_counts, zones=None,
+             standby=0, health=None):
+        """Plan reassignments.
+        :param service: Service name.
+        :param current_assignments: Assignment items by revision (None for
+        unassigned).
+        :param target_counts: Target instance count by revision.
+        :param zones: Availability zone by instance id.
+        :param standby: Standby instances to keep staged.
+        :param health: Failed unit count and deploy time by instance id.
+        :return: AssignmentPlan.
+        """
+        plan = AssignmentPlan()
+        zones = zones or {}
+        rank = None
+        if health:
+            def rank(assignment_item):
+                return health_rank(health.get(assignment_item['instance_id'],
+                                              (0, 0)))
+
+        def zone_of(assignment_item):
+            return zones.get(assignment_item['instance_id'])
+
+        # Staged instances are not serving their revision:
+        serving = defaultdict(list)
+        staged = []
+        for rev, assigned_instances in current_assignments.items():
+            for assignment_item in assigned_instances:
+                if rev and assignment_item.get('staged'):
+                    staged.append(assignment_item)
+                else:
+                    serving[rev].append(assignment_item)
+
+        placed = defaultdict(Counter)
+        for rev, assigned_instances in serving.items():
+            if rev:
+                placed[rev].update(zone_of(a) for a in assigned_instances)
+
+        # Instances without an assignment can be scheduled:
+        assignable = list(serving.get(None, []))
+
+        # Release instances from removed and over-provisioned revs:
+        for rev, assigned_instances in serving.items():
+            if not rev:
+                continue
+            target = target_counts.get(rev, 0)
+            surplus = len(assigned_instances) - target
+            if surplus <= 0:
+                continue
+            logger.debug('Unassigning %d instances from %s.', surplus, rev)
+            assignable += spread(assigned_instances, surplus, rev, zone_of,
+                                 placed[rev], release=True)
+        logger.debug('Found %s assignable instances.', len(assignable))
+        deficits = {rev: target - len(serving.get(rev, []))
+                    for rev, target in target_counts.items()}
+
+        # Promote standby instances staged with under-provisioned revs:
+        for rev in sorted(target_counts.keys()):
+            rev_staged = [a for a in staged if a['assignment'] == rev]
+            if deficits[rev] <= 0 or not rev_staged:
+                continue
+            promoted = spread(rev_staged, deficits[rev], rev, zone_of,
+                              placed[rev], rank=rank)
+            logger.debug('Promoting %d standby instances to %s.',
+                         len(promoted), rev)
+            for assignment_item in promoted:
+                plan.promote(assignment_item)
+                staged.remove(assignment_item)
+            deficits[rev] -= len(promoted)
+
+        # Add preferred instances to under-provisioned revs:
+        for rev in sorted(target_counts.keys()):
+            deficit = deficits[rev]
+            if deficit <= 0 or not (assignable or staged):
+                continue
+            logger.debug('Scheduling %d instances to %s.', deficit, rev)
+            scheduled = spread(assignable, deficit, rev, zone_of, placed[rev],
+                               rank=rank)
+            # Standby instances of other revisions, as a last resort:
+            scheduled += spread(staged, deficit - len(scheduled), rev,
+                                zone_of, placed[rev], rank=rank)
+            scheduled_ids = set(id(a) for a in scheduled)
+            assignable = [a for a in assignable if id(a) not in scheduled_ids]
+            staged = [a for a in staged if id(a) not in scheduled_ids]
+            for assignment_item in scheduled:
+                plan.move(assignment_item, rev)
+                assignment_item['service'] = service
+
+        # Keep the standby pool staged with the largest revision:
+        if standby and target_counts:
+            stage_rev = max(target_counts,
+                            key=lambda r: (target_counts[r], r))
+            pool_placed = Counter(zone_of(a) for a in staged)
+            added = spread(assignable, standby - len(staged), stage_rev,
+                           zone_of, pool_placed, rank=rank)
+            for assignment_item in added:
+                plan.stage(assignment_item, stage_rev)
+                assignment_item['service'] = service
+            for assignment_item in staged:
+                if assignment_item['assignment'] != stage_rev:
+                    plan.stage(assignment_item, stage_rev)
+
+        if zones:
+            plan.zones = {rev: {zone: count
+                                for zone, count in rev_zones.items() if count}
+                          for rev, rev_zones in placed.items()
+                          if rev in target_counts}
+        return plan
@@ -1,8 +1,14 @@
 import logging
 from collections import defaultdict
+from flotilla.scheduler.cloudformation import SERVICE_KEYS_ITERABLE, \
+    SERVICE_KEYS_STRINGS
 
 logger = logging.getLogger('flotilla')
 
+# Service attributes read and written by provisioning:
+STACK_ATTRIBUTES = (('service_name', 'provision', 'cf_outputs') +
+                    SERVICE_KEYS_STRINGS + SERVICE_KEYS_ITERABLE)
+
 
 class FlotillaProvisioner(object):
     def __init__(self, environment, region, scheduler, db, cloudformation):
@@ -19,7 +25,8 @@ class FlotillaProvisioner(object):
         # Index services that desire stacks:
         services = {}
         service_stacks = {}
-        for service in self._db.services():
+        for service in self._db.services(attributes=STACK_ATTRIBUTES,
+                                         shared=True):
             name = service['service_name']
             services[name] = service
             if service.get('provision', True):
@@ -44,12 +51,13 @@ class FlotillaProvisioner(object):
 
         changed_stacks = []
 
-        # Create/update VPC in this region:
+        # Create/update VPC in this region (one scheduler per region):
         region_item = self._db.get_region_params(self._region)
-        vpc_stack = self._cloudformation.vpc(region_item, region_stack)
-        if vpc_stack:
-            changed_stacks.append(vpc_stack)
-            region_stack = vpc_stack
+        if self._db.primary:
+            vpc_stack = self._cloudformation.vpc(region_item, region_stack)
+            if vpc_stack:
+                changed_stacks.append(vpc_stack)
+                region_stack = vpc_stack
 
         # Exit if VPC stack hasn't completed:
         region_outputs = region_stack and region_stack.get('outputs')
@@ -73,5 +81,5 @@ class FlotillaProvisioner(object):
                 if service_outputs:
                     service['cf_outputs'] = service_outputs
                     changed_services.append(service)
-        self._db.set_services(changed_services)
+        self._db.set_service_outputs(changed_services)
         self._db.set_stacks(changed_stacks)
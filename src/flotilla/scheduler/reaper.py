@@ -0,0 +1,44 @@
+import logging
+from collections import Counter
+
+logger = logging.getLogger('flotilla')
+
+DEFAULT_WRITE_UNITS = 10
+DEFAULT_REAP_INTERVAL = 15
+# Status and assignment item:
+WRITES_PER_INSTANCE = 2
+
+
+class FlotillaReaper(object):
+    """Deletes the status and assignment of dead instances, in batches
+    across services. Items with an expiry are left to DynamoDB, instances
+    that report again are kept.
+
+    The scheduler only finds dead instances while loading live ones; deletes
+    are paced to a share of the tables' write capacity so a burst of
+    terminated instances does not slow scheduling passes.
+    """
+
+    def __init__(self, scheduler, db, write_units=DEFAULT_WRITE_UNITS,
+                 interval=DEFAULT_REAP_INTERVAL):
+        """
+        :param scheduler: Scheduler.
+        :param db: Scheduler DB.
+        :param write_units: Write capacity units per second for deletes.
+        :param interval: Frequency of reap (seconds).
+        """
+        self._scheduler = scheduler
+        self._db = db
+        self._batch = max(1, int(write_units * interval) /
+                          WRITES_PER_INSTANCE)
+        self.stats = Counter()
+
+    def reap(self):
+        if not self._scheduler.active:
+            return
+
+        dead = self._db.get_dead_instances(self._batch)
+        if not dead:
+            return
+        logger.info('Removing %d dead instances.', len(dead))
+        self.stats['reaped'] += self._db.delete_instances(dead)
@@ -0,0 +1,198 @@
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from Queue import Empty, Full
+from flotilla.scheduler.trace import SchedulerTraces
+from flotilla.thread import RepeatingFunc, loop_status
+
+logger = logging.getLogger('flotilla')
+
+DEFAULT_REPORT_INTERVAL = 5
+# A worker that has not reported for this many intervals is restarted:
+STALE_REPORTS = 12
+# A loop that has not completed for this many intervals is unhealthy:
+STALE_LOOPS = 3
+
+
+def loops_healthy(loops):
+    """Whether loops are keeping up with their interval.
+    :param loops: Loop status by name.
+    :return: True if every loop completed recently.
+    """
+    for status in loops.values():
+        allowed = max(status['interval'], DEFAULT_REPORT_INTERVAL)
+        if status['age'] > allowed * STALE_LOOPS:
+            return False
+    return True
+
+
+def local_health(funcs):
+    """Loop status by region, for loops running in this process.
+    :param funcs: Loops by region.
+    """
+    health = {}
+    for region, region_funcs in funcs.items():
+        loops = loop_status(region_funcs)
+        health[region] = {'healthy': loops_healthy(loops), 'loops': loops}
+    return health
+
+
+class RegionWorker(multiprocessing.Process):
+    """Runs the loops of a region in a worker process.
+
+    The worker reports the status of its loops, and new scheduler traces, to
+    the parent process.
+    """
+
+    def __init__(self, region, start, stop, traces=None,
+                 report_interval=DEFAULT_REPORT_INTERVAL):
+        """
+        :param region: Region.
+        :param start: Called in the worker, starts loops and returns
+        (loops, schedulers).
+        :param stop: Called in the worker with (loops, schedulers).
+        :param traces: SchedulerTraces storing reported passes.
+        :param report_interval: Frequency of reports (seconds).
+        """
+        super(RegionWorker, self).__init__(name='region-%s' % region)
+        self.daemon = True
+        self.region = region
+        self.traces = traces or SchedulerTraces()
+        self.loops = {}
+        self.reported = time.time()
+        self._start_loops = start
+        self._stop_loops = stop
+        self._report_interval = report_interval
+        self._stopping = multiprocessing.Event()
+        self._terminated = False
+        self._reports = multiprocessing.Queue(maxsize=100)
+
+    def run(self):
+        # Interrupts are handled by the parent, SIGTERM stops loops:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, self._terminate)
+        self._reports.cancel_join_thread()
+
+        self._report({}, [])
+        funcs, schedulers = self._start_loops()
+        recorded = [0] * len(schedulers)
+        while not self._terminated and not self._stopping.is_set():
+            traces = []
+            for index, schedule in enumerate(schedulers):
+                recorded[index], new_traces = schedule.traces.since(
+                        recorded[index])
+                traces += new_traces
+            self._report(loop_status(funcs), traces)
+            self._stopping.wait(self._report_interval)
+        self._stop_loops(funcs, schedulers)
+
+    def _terminate(self, signum, frame):
+        # Locks may be held by the interrupted thread, only set a flag:
+        self._terminated = True
+
+    def _report(self, loops, traces):
+        try:
+            self._reports.put_nowait({'loops': loops, 'traces': traces})
+        except Full:
+            logger.warn('Region %s reports are not being read.', self.region)
+
+    def poll(self):
+        """Read reports from the worker."""
+        while True:
+            try:
+                report = self._reports.get_nowait()
+            except Empty:
+                return
+            self.reported = time.time()
+            self.loops = report['loops']
+            for trace in report['traces']:
+                self.traces.add(trace)
+
+    @property
+    def stale(self):
+        """Whether the worker stopped or stopped reporting."""
+        if not self.is_alive():
+            return True
+        age = time.time() - self.reported
+        return age > self._report_interval * STALE_REPORTS
+
+    def health(self):
+        return {
+            'healthy': not self.stale and loops_healthy(self.loops),
+            'reported': time.time() - self.reported,
+            'pid': self.pid,
+            'loops': self.loops
+        }
+
+    def restart(self):
+        """Replace a worker with a new process.
+        :return: New worker (started).
+        """
+        self._kill()
+        worker = RegionWorker(self.region, self._start_loops,
+                              self._stop_loops, self.traces,
+                              self._report_interval)
+        worker.start()
+        return worker
+
+    def stop(self, timeout=30):
+        self._stopping.set()
+        self.join(timeout)
+        if self.is_alive():
+            logger.warn('Region %s did not stop, killing.', self.region)
+            self._kill()
+
+    def _kill(self):
+        if self.is_alive():
+            os.kill(self.pid, signal.SIGKILL)
+            self.join()
+
+
+class RegionSupervisor(RepeatingFunc):
+    """Starts a worker process per region, and restarts workers that exit
+    or stop reporting."""
+
+    def __init__(self, workers, interval=1):
+        """
+        :param workers: RegionWorkers.
+        :param interval: Frequency of checks (seconds).
+        """
+        super(RegionSupervisor, self).__init__('region-supervisor',
+                                               self.check, interval)
+        self.workers = {worker.region: worker for worker in workers}
+        self._lock = threading.Lock()
+
+    @property
+    def traces(self):
+        return {region: worker.traces
+                for region, worker in self.workers.items()}
+
+    def start(self):
+        for worker in self.workers.values():
+            worker.start()
+        super(RegionSupervisor, self).start()
+
+    def check(self):
+        with self._lock:
+            if not self._live:
+                return
+            for region, worker in self.workers.items():
+                worker.poll()
+                if worker.stale:
+                    logger.error('Region %s stopped (exit code %s), '
+                                 'restarting.', region, worker.exitcode)
+                    self.workers[region] = worker.restart()
+
+    def health(self):
+        """Loop status by region."""
+        return {region: worker.health()
+                for region, worker in self.workers.items()}
+
+    def stop(self):
+        with self._lock:
+            super(RegionSupervisor, self).stop()
+        for worker in self.workers.values():
+            worker.stop()
@@ -0,0 +1,71 @@
+import logging
+import time
+
+logger = logging.getLogger('flotilla')
+
+ROLLOUT_ROLLING = 'rolling'
+ROLLOUT_PAUSED = 'paused'
+ROLLOUT_COMPLETE = 'complete'
+
+
+class FlotillaGlobalRollout(object):
+    """Advances a staged global rollout one shard at a time.
+
+    A shard is assigned the revision once every live instance of the
+    previous shard runs it. A failure report for the revision pauses the
+    rollout; staging the same revision again resumes it.
+    """
+
+    def __init__(self, scheduler, db):
+        self._scheduler = scheduler
+        self._db = db
+
+    def advance(self):
+        if not self._scheduler.active or not self._db.primary:
+            return
+
+        rollout = self._db.get_global_rollout()
+        if not rollout or rollout['state'] != ROLLOUT_ROLLING:
+            return
+
+        rev = rollout['assignment']
+        shard = int(rollout['shard'])
+        shards = int(rollout['shards'])
+        if shard > 0:
+            pending = self._db.get_global_pending(rev, shard - 1, shards)
+            if pending:
+                logger.debug('Waiting on %d instances of global shard %d.',
+                             len(pending), shard - 1)
+                return
+
+        if shard >= shards:
+            logger.info('Global rollout of %s complete.', rev)
+            self._update(rollout, state=ROLLOUT_COMPLETE)
+            return
+
+        # Assign before recording progress, an interrupted step is repeated:
+        logger.info('Rolling %s out to global shard %d/%d.', rev, shard + 1,
+                    shards)
+        self._db.set_global_assignment(shard, rev)
+        self._update(rollout, shard=shard + 1)
+
+    def failed_revision(self, rev, instance):
+        """
+        Callback when an instance reports it failed to deploy a revision.
+        :param rev: Failing revision.
+        :param instance: Failing instance.
+        """
+        rollout = self._db.get_global_rollout()
+        if not rollout or rollout['state'] != ROLLOUT_ROLLING or \
+                rollout['assignment'] != rev:
+            return
+
+        logger.warn('Pausing global rollout of %s at shard %s, failed on '
+                    '%s.', rev, rollout['shard'], instance)
+        self._update(rollout, state=ROLLOUT_PAUSED)
+
+    def _update(self, rollout, **updates):
+        for key, value in updates.items():
+            rollout[key] = value
+        rollout['updated'] = time.time()
+        return self._db.set_global_rollout(rollout)
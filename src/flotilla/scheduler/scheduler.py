@@ -1,124 +1,640 @@
 import logging
 import thread
+import time
+from collections import Counter, defaultdict
+from flotilla.scheduler.planner import AssignmentPlanner, hold_targets, \
+    rollout_limit
+from flotilla.scheduler.trace import SchedulerTraces, ServiceTrace, \
+    TRACE_CHANGES, TRACE_FULL, TRACE_MESSAGE
+from flotilla.scheduler.workers import PRIORITY_MESSAGE, PRIORITY_IDLE, \
+    PRIORITY_NEW_REVISION, PRIORITY_SWEEP
 
 logger = logging.getLogger('flotilla')
 
+SCHEDULER_LOCK = 'scheduler'
+
 
 class FlotillaScheduler(object):
-    def __init__(self, db, locks, lock_ttl=30):
+    def __init__(self, db, locks, lock_ttl=30, changes=None,
+                 reconcile_interval=300, segments=None, workers=None,
+                 traces=None, target_tolerance=0):
         self._db = db
         self._locks = locks
         self._lock_ttl = lock_ttl
+        self._segments = segments
+        self._owned_segments = []
+        self._resegmented = False
+        self._changes = changes
+        self._reconcile_interval = reconcile_interval
+        self._reconcile_time = 0
+        self._lease_time = 0
+        self._checkpoint = None
+        self._released = False
+        self._saved_state = None
+        self._workers = workers
+        self._target_tolerance = target_tolerance
+        self._planner = AssignmentPlanner()
+        self._fingerprints = {}
+        self._fingerprint_time = time.time()
+        self._rollouts = set()
+        self.zones = {}
+        self.traces = traces or SchedulerTraces()
+        self.stats = Counter()
         self.active = False
         self.__loop = thread.allocate_lock()
+        self.__services = thread.allocate_lock()
+        # Guards stats and memos shared with worker threads:
+        self.__state = thread.allocate_lock()
+        self._service_locks = defaultdict(thread.allocate_lock)
 
     def loop(self):
         if not self.active:
             return
 
         with self.__loop:
+            if self._resegmented:
+                # Segments changed hands, services must be reconciled:
+                self._resegmented = False
+                self._reconcile_time = 0
+            full = self._changes is None or self._reconcile_due()
+            with self.traces.record(TRACE_FULL if full else TRACE_CHANGES) \
+                    as trace:
+                if full:
+                    self._loop_full(trace)
+                else:
+                    self._loop_changes(trace)
+            # Without a change feed the next leader reconciles anyway:
+            if self.active and self._changes and not self._segments:
+                self._save_state()
+
+    def _reconcile_due(self):
+        if self._changes.stale:
+            return True
+        reconcile_age = time.time() - self._reconcile_time
+        return reconcile_age > self._reconcile_interval
+
+    def _loop_full(self, trace):
+        trace.kind = TRACE_FULL
+        if self._changes:
+            # Open the feed before the scan, changes from here on are picked
+            # up by the next incremental pass:
+            with trace.phase('poll'):
+                self._changes.poll()
+            self._checkpoint = self._changes.checkpoint()
+            self._changes.drain()
+            self._forget_removed()
+            logger.debug('Reconciling all services.')
+
+        # Periodically verify services even if inputs are unchanged, and
+        # reload assignments deleted without a generation change (expiry):
+        if time.time() - self._fingerprint_time > self._reconcile_interval:
+            with self.__state:
+                self._fingerprints.clear()
+            self._db.clear_assignments()
+            self._fingerprint_time = time.time()
+
+        with trace.phase('scan'):
             all_services = self._db.get_all_revision_weights()
-            for service, revisions in all_services.items():
-                self._schedule_service(service, revisions)
+        self._schedule_urgent(all_services.items(), trace)
+        self._reconcile_time = time.time()
+
+    def _loop_changes(self, trace):
+        with trace.phase('poll'):
+            self._changes.poll()
+        if self._changes.stale or self._unattributed():
+            self._loop_full(trace)
+            return
+
+        # Status changes are not fed, services mid-rollout are polled:
+        self._checkpoint = self._changes.checkpoint()
+        with self.__state:
+            rollouts = set(self._rollouts)
+        changed = self._changes.drain() | rollouts
+        self._forget_removed()
+        dirty = [service for service in changed
+                 if self._db.owns_service(service)]
+        logger.debug('Found %d changed services.', len(dirty))
+        with self.__state:
+            for service in dirty:
+                self._fingerprints.pop(service, None)
+        self._schedule_urgent([(service, None) for service in sorted(dirty)],
+                              trace)
+        # Changed services were reloaded into the last full scan:
+        self._db.refresh_snapshot()
+
+    def _forget_removed(self):
+        """Drop cached assignments that were deleted, the generation of
+        their service is not bumped by expiry."""
+        removed = self._changes.drain_removed()
+        if removed:
+            logger.debug('Forgetting %d deleted assignments.', len(removed))
+            self._db.forget_assignments(removed)
+
+    def _unattributed(self):
+        """Were services created that no scan attributed to a segment?
+        Any of them may be owned, the owned segments are scanned again.
+        """
+        if not self._segments:
+            return False
+        return any(not self._db.owns_service(service)
+                   for service in self._changes.created())
 
     def schedule_service(self, service):
-        if not self.active:
+        if not self.active or not self._db.owns_service(service):
             return False
 
-        with self.__loop:
+        if self._workers:
+            self._workers.submit(PRIORITY_MESSAGE, self._schedule_current,
+                                 service)
+        else:
+            self._schedule_current(service)
+        return self.active
+
+    def _schedule_urgent(self, services, trace):
+        """Schedule services, most urgent first.
+        :param services: Service names and revision weights (None to load).
+        :param trace: Pass trace.
+        """
+        classified = []
+        with trace.phase('classify'):
+            self._run(self._classify,
+                      [(PRIORITY_SWEEP, (service, revisions, classified,
+                                         trace.service(service)))
+                       for service, revisions in services])
+
+        urgency = Counter(task[0] for task in classified)
+        logger.debug('Scheduling %d idle, %d new revision, %d routine '
+                     'services.', urgency[PRIORITY_IDLE],
+                     urgency[PRIORITY_NEW_REVISION], urgency[PRIORITY_SWEEP])
+        self._count('urgent_idle', urgency[PRIORITY_IDLE])
+        self._count('urgent_new_revision', urgency[PRIORITY_NEW_REVISION])
+        with trace.phase('schedule'):
+            self._run(self._schedule_locked, sorted(classified))
+
+    def _classify(self, service, revisions, classified, trace=None):
+        """Determine how urgently a service needs scheduling.
+        :param service: Service name.
+        :param revisions: Revision weights (None to load).
+        :param classified: List to append the prioritized task to.
+        :param trace: Service trace.
+        """
+        if not self.active:
+            return
+        trace = trace or ServiceTrace(service)
+        if revisions is None:
+            with trace.phase('weights'):
+                revisions = self._db.get_revision_weights(service)
+        if not revisions:
+            trace.skipped = True
+            return
+
+        with trace.phase('status'):
+            live_instances = self._db.get_live_instances(service)
+        # Unchanged services are skipped before loading assignments, loaded
+        # assignments are passed on to the scheduling pass:
+        generation = None
+        assignments = None
+        if live_instances:
+            with self._service_lock(service):
+                generation = self._db.get_generation(service)
+                fingerprint = self._service_fingerprint(
+                        service, revisions, live_instances, generation)
+                if self._unchanged(service, fingerprint, trace):
+                    return
+                with trace.phase('batch_get'):
+                    assignments = self._db.get_instance_assignments(
+                            service, live_instances, generation)
+        loaded = assignments or {}
+        weighted = [rev for rev, weight in revisions.items() if weight > 0]
+        if weighted and loaded.get(None):
+            # Unassigned instances are sitting idle:
+            priority = PRIORITY_IDLE
+        elif [rev for rev in weighted if live_instances and
+              not loaded.get(rev)]:
+            priority = PRIORITY_NEW_REVISION
+        else:
+            priority = PRIORITY_SWEEP
+        classified.append((priority, (service, revisions, live_instances,
+                                      trace, generation, assignments)))
+
+    def _run(self, func, tasks):
+        """Execute tasks, in parallel if workers are available.
+        :param func: Task function.
+        :param tasks: Task priorities and arguments.
+        """
+        if not self._workers:
+            for _, args in tasks:
+                func(*args)
+            return
+
+        pending = [self._workers.submit(priority, func, *args)
+                   for priority, args in tasks]
+        for done in pending:
+            done.wait()
+
+    def _service_lock(self, service):
+        with self.__services:
+            return self._service_locks[service]
+
+    def _schedule_current(self, service):
+        if not self.active:
+            return
+        with self._service_lock(service):
             revisions = self._db.get_revision_weights(service)
             self._schedule_service(service, revisions)
-            return self.active
 
-    def _schedule_service(self, service, revisions):
+    def _schedule_locked(self, service, revisions, live_instances=None,
+                         trace=None, generation=None, assignments=None):
+        if not self.active:
+            return
+        with self._service_lock(service):
+            self._schedule_service(service, revisions, live_instances,
+                                   trace, generation=generation,
+                                   assignments=assignments)
+
+    def _schedule_service(self, service, revisions, live_instances=None,
+                          trace=None, retry=True, generation=None,
+                          assignments=None):
+        if trace is None:
+            with self.traces.record(TRACE_MESSAGE) as pass_trace:
+                return self._schedule_service(service, revisions,
+                                              live_instances,
+                                              pass_trace.service(service),
+                                              retry, generation, assignments)
+
         logger.debug('Balancing assignments: %s (%s revisions).', service,
                      len(revisions))
         if len(revisions) == 0:
+            trace.skipped = True
             return
 
+        # Skip services where no input changed since the last pass:
+        if live_instances is None:
+            with trace.phase('status'):
+                live_instances = self._db.get_live_instances(service)
+        # Writes by any scheduler bump the stored generation:
+        if generation is None and live_instances:
+            generation = self._db.get_generation(service)
+        fingerprint = self._service_fingerprint(service, revisions,
+                                                live_instances, generation)
+        # Assignments are only passed in once the fingerprint missed:
+        if assignments is None and self._unchanged(service, fingerprint,
+                                                   trace):
+            return
+        standby = self._db.get_standby(service)
+        acknowledged = {}
+        if self._db.get_two_phase(service):
+            acknowledged = self._db.get_prepared(live_instances)
+
         # Get all instances in the service (assigned or not):
-        current_assignments = self._db.get_instance_assignments(service)
+        current_assignments = assignments
+        if current_assignments is None:
+            with trace.phase('batch_get'):
+                current_assignments = self._db.get_instance_assignments(
+                        service, live_instances, generation)
         if not current_assignments:
             logger.debug('No instances, can not assign %s.', service)
+            self._fingerprint(service, fingerprint)
             return
         instance_count = sum(
                 [len(rev_assignments) for rev_assignments in
                  current_assignments.values()])
         logger.debug("Found %s assignable instances.", instance_count)
+        trace.instances = instance_count
 
-        # Determine ideal distribution of instances:
-        target_counts = self._instance_targets(revisions,
-                                               instance_count)
-        logger.debug('Target instance counts: %s', target_counts)
-
-        # Instances without an assignment can be scheduled:
-        assignable = current_assignments.get(None, [])
-        unassigned = len(assignable)
-        logger.debug("Found %s unassigned instances.", unassigned)
-
-        # Remove instances from no longer provisioned revs:
-        for rev, assigned_instances in current_assignments.items():
-            if not rev:
-                continue
-            if rev not in target_counts:
-                logger.debug('Unassigning %d instances from %s.',
-                             len(assigned_instances), rev)
-                assignable += assigned_instances
-
-        # Remove instances from over-provisioned revs:
-        for rev, instance_count in target_counts.items():
-            current_assignment = current_assignments.get(rev, [])
-            to_unschedule = len(current_assignment) - instance_count
-            if to_unschedule > 0:
-                logger.debug('Unassigning %d instances from %s.',
-                             to_unschedule, rev)
-                assignable += current_assignments[rev][
-                              to_unschedule * -1:]
-        logger.debug('Found %s assignable instances (%s unassigned).',
-                     len(assignable), unassigned)
-
-        # Add instances to under-provisioned revs:
-        reassigned = []
-        for rev, instance_count in target_counts.items():
-            current_assignment = current_assignments[rev]
-            to_schedule = instance_count - len(current_assignment)
-            if to_schedule > 0:
-                logger.debug('Scheduling %d instances to %s.',
-                             to_schedule, rev)
-                scheduled = assignable[:to_schedule]
-                for assignment_item in scheduled:
-                    assignment_item['assignment'] = rev
-                    reassigned.append(assignment_item)
-                assignable = assignable[to_schedule:]
+        with trace.phase('targets'):
+            # Determine ideal distribution of instances. The standby pool is
+            # filled by new instances, serving instances are never demoted:
+            if standby:
+                spare = len([a for rev, rev_assignments
+                             in current_assignments.items()
+                             for a in rev_assignments
+                             if not rev or a.get('staged')])
+                standby = min(standby, spare, instance_count - 1)
+            target_counts = self._instance_targets(revisions,
+                                                   instance_count - standby)
+            delivering = self._db.get_delivering(service)
+            if delivering:
+                target_counts = self._delivery_targets(
+                        target_counts, revisions, delivering)
+            if self._target_tolerance:
+                target_counts = self._hold_targets(
+                        service, revisions, target_counts,
+                        current_assignments)
+            logger.debug('Target instance counts: %s (%d standby)',
+                         target_counts, standby)
+            trace.targets = target_counts
+
+            # Move the fewest, most stable instances towards targets:
+            zones = self._db.get_instance_zones(live_instances)
+            health = self._db.get_instance_health(live_instances)
+            plan = self._planner.plan(service, current_assignments,
+                                      target_counts, zones, standby, health)
+        if plan.promoted:
+            logger.info('Promoting %d standby instances of %s.',
+                        plan.promoted, service)
+        if plan.zones:
+            self._record_zones(service, plan.zones, set(zones.values()))
+        if self._db.get_two_phase(service):
+            preparing = plan.prepare(
+                    [a for rev_assignments in current_assignments.values()
+                     for a in rev_assignments], acknowledged)
+            if preparing:
+                logger.info('Waiting on %d instances of %s to prepare.',
+                            preparing, service)
+        if plan.churn:
+            with trace.phase('rollout'):
+                self._limit_rollout(service, plan, current_assignments,
+                                    instance_count)
+        trace.planned(plan)
+        with self.__state:
+            if plan.deferred or plan.preparing:
+                self._rollouts.add(service)
+            else:
+                self._rollouts.discard(service)
+        self._count('reassigned', len(plan.reassigned))
+        self._count('churn', plan.churn)
+        self._count('deferred', len(plan.deferred))
+        self._count('promoted', plan.promoted)
+        self._count('staged', plan.staged)
+        self._count('preparing', len(plan.preparing))
 
         # Store assignment updates:
-        if reassigned and self.active:
-            logger.debug('Storing %d reassignments.', len(reassigned))
-            self._db.set_assignments(reassigned)
+        updates = plan.reassigned + plan.prepared
+        if updates and self.active:
+            logger.info('Storing %d reassignments for %s (%d moved).',
+                        len(updates), service, plan.churn)
+            with trace.phase('write'):
+                conflicts = self._db.set_assignments(updates)
+            if conflicts:
+                # Replan with the instances another scheduler changed:
+                self._count('conflicts', len(conflicts))
+                if retry:
+                    logger.info('Retrying %d assignments of %s.',
+                                len(conflicts), service)
+                    return self._schedule_service(service, revisions,
+                                                  live_instances, trace,
+                                                  retry=False)
+                with self.__state:
+                    self._rollouts.add(service)
+        elif not updates and not plan.deferred and not plan.preparing:
+            self._fingerprint(service, fingerprint)
+        return plan
+
+    def _hold_targets(self, service, revisions, target_counts,
+                      current_assignments):
+        """Leave serving counts within the target tolerance alone.
+        :param service: Service name.
+        :param revisions: Revision weights.
+        :param target_counts: Exact instance count by revision.
+        :param current_assignments: Assignments before the plan.
+        :return: Instance count by revision.
+        """
+        current = {rev: len([a for a in rev_assignments
+                             if not a.get('staged')])
+                   for rev, rev_assignments in current_assignments.items()
+                   if rev}
+        held, avoided = hold_targets(target_counts, current, revisions,
+                                     self._target_tolerance)
+        if avoided:
+            logger.debug('Holding %s within %d of %s, %d moves avoided.',
+                         service, self._target_tolerance, target_counts,
+                         avoided)
+            self._count('churn_avoided', avoided)
+        return held
+
+    def _limit_rollout(self, service, plan, current_assignments,
+                       instance_count):
+        """Limit moves to the service's max_unavailable, in waves.
+        :param service: Service name.
+        :param plan: Planned reassignments.
+        :param current_assignments: Assignments before the plan.
+        :param instance_count: Instances in the service.
+        """
+        service_item = self._db.get_service(service)
+        max_unavailable = service_item and service_item.get('max_unavailable')
+        try:
+            limit = rollout_limit(max_unavailable, instance_count)
+        except ValueError:
+            logger.warn('Invalid max_unavailable for %s: %s', service,
+                        max_unavailable)
+            return
+        if limit is None:
+            return
+
+        # Standby instances are not serving, they are not deploying:
+        assigned = {assignment['instance_id']: rev
+                    for rev, rev_assignments in current_assignments.items()
+                    if rev for assignment in rev_assignments
+                    if not assignment.get('staged') and
+                    assignment['instance_id'] not in plan.standby}
+        deploying = self._db.get_deploying_instances(service, assigned)
+        deferred = plan.limit(limit - len(deploying), deploying)
+        if deferred:
+            logger.info('Deferring %d moves for %s (%d/%d deploying).',
+                        deferred, service, len(deploying), limit)
+
+    def _record_zones(self, service, rev_zones, all_zones):
+        """Log and count instances of each revision by availability zone.
+        :param service: Service name.
+        :param rev_zones: Instance count by zone, by revision.
+        :param all_zones: Zones of the service's instances.
+        """
+        self.zones[service] = rev_zones
+        for rev, zone_counts in sorted(rev_zones.items()):
+            logger.debug('Zones of %s in %s: %s', rev, service,
+                         ', '.join('%s=%d' % zone_count
+                                   for zone_count in sorted(
+                                         zone_counts.items())))
+            counts = [zone_counts.get(zone, 0) for zone in all_zones]
+            if max(counts) - min(counts) > 1:
+                self._count('zone_skewed')
+
+    def _service_fingerprint(self, service, revisions, live_instances,
+                             generation):
+        """Summarize the inputs to scheduling a service.
+        :param service: Service name.
+        :param revisions: Revision weights.
+        :param live_instances: Live instance ids.
+        :param generation: Assignment generation.
+        :return: Fingerprint, equal while no input changes.
+        """
+        acknowledged = {}
+        if self._db.get_two_phase(service):
+            acknowledged = self._db.get_prepared(live_instances)
+        return (frozenset(revisions.items()),
+                frozenset(live_instances),
+                generation,
+                self._db.get_standby(service),
+                frozenset(acknowledged.items()))
+
+    def _unchanged(self, service, fingerprint, trace):
+        """Check a service against its last scheduled fingerprint.
+        :param service: Service name.
+        :param fingerprint: Current fingerprint.
+        :param trace: Service trace.
+        :return: True if the service can be skipped.
+        """
+        with self.__state:
+            unchanged = self._fingerprints.get(service) == fingerprint
+        if unchanged:
+            logger.debug('No changes to %s, skipping.', service)
+            self._count('fingerprint_hits')
+            trace.skipped = True
+            return True
+        self._count('fingerprint_misses')
+        return False
+
+    def _fingerprint(self, service, fingerprint):
+        """Record the inputs of a service that needs no changes."""
+        with self.__state:
+            self._fingerprints[service] = fingerprint
+
+    def _count(self, stat, count=1):
+        """Increment a scheduler stat."""
+        with self.__state:
+            self.stats[stat] += count
 
     def lock(self):
-        if self._locks.try_lock('scheduler', ttl=self._lock_ttl, refresh=True):
+        if self._released:
+            return
+        if self._segments:
+            self._lock_segments()
+            return
+
+        # Standbys poll often, the leader only renews its lease:
+        if self.active and \
+                time.time() - self._lease_time < self._lock_ttl / 3.0:
+            return
+        # Standbys watch with cheap reads, leaving capacity to the leader:
+        if not self.active and self._leased():
+            return
+
+        lease_time = time.time()
+        if self._locks.try_lock(SCHEDULER_LOCK, ttl=self._lock_ttl,
+                                refresh=True):
+            self._lease_time = lease_time
             if not self.active:
                 logger.info('Became active scheduler')
+                self._restore()
+                # The loop thread starts scheduling on its next run:
                 self.active = True
-                self.loop()
+        elif self.active:
+            logger.info('No longer active scheduler')
+            self.active = False
+            self._reconcile_time = 0
+            self._db.clear_dead_instances()
+
+    def _leased(self):
+        """Is the lease held by a live scheduler (eventually consistent)?"""
+        owner, acquire_time = self._locks.get_owner(SCHEDULER_LOCK,
+                                                    consistent=False)
+        return bool(owner) and time.time() - acquire_time <= self._lock_ttl
+
+    def release(self):
+        """Stop scheduling and hand the lease over to a standby."""
+        self._released = True
+        with self.__loop:
+            was_active = self.active
+            self.active = False
+        self._db.clear_dead_instances()
+        if self._segments:
+            self._segments.release()
+            return
+        if was_active:
+            self._save_state()
+            self._locks.release_lock(SCHEDULER_LOCK)
+            logger.info('Released active scheduler lease')
+
+    def _save_state(self):
+        """Persist state for the next leader."""
+        with self.__state:
+            rollouts = sorted(self._rollouts)
+        state = {
+            'reconcile_time': self._reconcile_time,
+            'rollouts': rollouts,
+            'deliveries': self._db.get_ramping()
+        }
+        if self._checkpoint:
+            state['changes'] = self._checkpoint
+        if state != self._saved_state:
+            self._locks.set_state(SCHEDULER_LOCK, state)
+            self._saved_state = state
+
+    def _restore(self):
+        """Resume from the state of the previous leader."""
+        state = self._locks.get_state(SCHEDULER_LOCK)
+        self._rollouts = set(state.get('rollouts', ()))
+        # Deliveries keep ramping before the first pass finds them:
+        self._db.restore_ramping(state.get('deliveries', {}))
+        self._checkpoint = state.get('changes')
+        if self._changes and self._checkpoint and \
+                self._changes.restore(self._checkpoint):
+            self._reconcile_time = state.get('reconcile_time', 0)
+            logger.info('Resumed from previous scheduler, %d rollouts.',
+                        len(self._rollouts))
+        else:
+            self._reconcile_time = 0
+
+    def _lock_segments(self):
+        segments = self._segments.refresh()
+        if segments == self._owned_segments:
+            return
+        self._owned_segments = segments
+
+        # Leases are renewed without waiting for a pass, the next pass
+        # reconciles:
+        self._db.set_segments(segments, self._segments.total_segments)
+        self._resegmented = True
+        if segments:
+            if not self.active:
+                logger.info('Became active scheduler')
+            self.active = True
         elif self.active:
             logger.info('No longer active scheduler')
             self.active = False
 
+    @staticmethod
+    def _delivery_targets(target_counts, revisions, rev):
+        """Run a revision being delivered on at least one instance, so a
+        small step on a small service can turn healthy.
+        :param target_counts: Instance count by revision.
+        :param revisions: Revision weights.
+        :param rev: Revision being delivered.
+        :return: Instance count by revision.
+        """
+        if revisions.get(rev, 0) <= 0 or target_counts.get(rev):
+            return target_counts
+        donors = [(count, other_rev) for other_rev, count
+                  in target_counts.items() if count]
+        if not donors:
+            return target_counts
+        _, donor = max(donors)
+        target_counts = dict(target_counts)
+        target_counts[donor] -= 1
+        target_counts[rev] = 1
+        return target_counts
+
     @staticmethod
     def _instance_targets(revisions, instance_count):
+        """Apportion instances to revisions by weight (largest remainder).
+        :param revisions: Revision weights.
+        :param instance_count: Instances to apportion.
+        :return: Instance count by revision.
+        """
         total_weight = sum(revisions.values())
+        if not total_weight:
+            return {rev: 0 for rev in revisions}
+
         instance_targets = {}
+        remainders = []
         for rev, weight in revisions.items():
-            rev_pct = float(weight) / total_weight
-            instance_targets[rev] = int(round(rev_pct * instance_count))
-
-        # Detect rounding error, trim from the largest group:
-        while sum(instance_targets.values()) != instance_count:
-            max_value = max(instance_targets.values())
-            for rev, value in instance_targets.items():
-                if value == max_value:
-                    instance_targets[rev] -= 1
-                    break
+            share = weight * instance_count
+            instance_targets[rev] = share // total_weight
+            remainders.append((-(share % total_weight), -weight, rev))
+
+        # Hand leftover instances to the largest remainders (then weights):
+        leftover = instance_count - sum(instance_targets.values())
+        for _, _, rev in sorted(remainders)[:leftover]:
+            instance_targets[rev] += 1
         return instance_targets
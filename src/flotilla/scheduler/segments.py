@@ -0,0 +1,87 @@
+import logging
+import time
+
+logger = logging.getLogger('flotilla')
+
+MEMBER_LOCK = 'scheduler-member-%d'
+SEGMENT_LOCK = 'scheduler-segment-%d'
+
+
+class SchedulerSegments(object):
+    """Distributes segments of the services table between schedulers.
+
+    Each scheduler holds a member slot; segments are dealt round-robin to
+    live members in slot order, so every join/death rebalances segments.
+    """
+
+    def __init__(self, locks, total_segments, ttl=45):
+        self._locks = locks
+        self.total_segments = total_segments
+        self._ttl = ttl
+        self._member = None
+        self.segments = []
+
+    def refresh(self):
+        """Renew membership, then acquire/release segments to match share.
+        :return: Owned segments.
+        """
+        if not self._join():
+            self._release(self.segments)
+            self.segments = []
+            return self.segments
+
+        members = self._members()
+        rank = members.index(self._member)
+        wanted = [s for s in range(self.total_segments)
+                  if s % len(members) == rank]
+
+        self._release([s for s in self.segments if s not in wanted])
+        segments = [s for s in wanted
+                    if self._locks.try_lock(SEGMENT_LOCK % s, ttl=self._ttl,
+                                            refresh=True)]
+        if segments != self.segments:
+            logger.info('Scheduling segments %s of %d (%d schedulers).',
+                        segments, self.total_segments, len(members))
+        self.segments = segments
+        return segments
+
+    def release(self):
+        """Leave, releasing segments and membership."""
+        self._release(self.segments)
+        self.segments = []
+        if self._member is not None:
+            self._locks.release_lock(MEMBER_LOCK % self._member)
+            self._member = None
+
+    def _join(self):
+        if self._member is not None:
+            if self._locks.try_lock(MEMBER_LOCK % self._member, ttl=self._ttl,
+                                    refresh=True):
+                return True
+            logger.info('Lost scheduler slot %d.', self._member)
+            self._member = None
+
+        for member in range(self.total_segments):
+            if self._locks.try_lock(MEMBER_LOCK % member, ttl=self._ttl):
+                logger.info('Joined as scheduler slot %d.', member)
+                self._member = member
+                return True
+        logger.debug('No free scheduler slots.')
+        return False
+
+    def _members(self):
+        cutoff = time.time() - self._ttl
+        members = []
+        for member in range(self.total_segments):
+            if member == self._member:
+                members.append(member)
+                continue
+            owner, acquire_time = self._locks.get_owner(MEMBER_LOCK % member)
+            if owner and acquire_time >= cutoff:
+                members.append(member)
+        return members
+
+    def _release(self, segments):
+        for segment in segments:
+            logger.debug('Releasing segment %d.', segment)
+            self._locks.release_lock(SEGMENT_LOCK % segment)
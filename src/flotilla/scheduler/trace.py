@@ -0,0 +1,276 @@
+import json
+import logging
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from collections import deque
+from contextlib import contextmanager
+from urlparse import parse_qs, urlparse
+
+logger = logging.getLogger('flotilla')
+
+TRACE_FULL = 'full'
+TRACE_CHANGES = 'changes'
+TRACE_MESSAGE = 'message'
+
+DEFAULT_TRACES = 100
+
+
+class _Timed(object):
+    def __init__(self):
+        self.start = time.time()
+        self.duration = 0.0
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        """Time a phase, repeated phases add up."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.phases[name] = (self.phases.get(name, 0.0) +
+                                 time.time() - start)
+
+    def finish(self):
+        self.duration = time.time() - self.start
+
+
+def _reason(move, assignment_item, standby):
+    instance_id, previous, rev = move
+    if assignment_item.get('staged'):
+        return 'standby'
+    if instance_id in standby:
+        return 'promoted'
+    if not previous:
+        return 'unassigned'
+    return 'rebalanced'
+
+
+class ServiceTrace(_Timed):
+    """Phases and decisions of scheduling one service. Its duration is the
+    time spent in phases, not waiting for a worker."""
+
+    def __init__(self, service):
+        super(ServiceTrace, self).__init__()
+        self.service = service
+        self.skipped = False
+        self.instances = 0
+        self.targets = {}
+        self.moves = []
+        self.deferred = []
+
+    def planned(self, plan):
+        """Record instances moved (and deferred) by a plan, with reasons."""
+        for move, assignment_item in zip(plan.moves, plan.reassigned):
+            self.moves.append(move + (_reason(move, assignment_item,
+                                              plan.standby),))
+        for move in plan.deferred:
+            self.deferred.append(move + ('max_unavailable',))
+        for move in plan.preparing:
+            self.deferred.append(move + ('preparing',))
+
+    def finish(self):
+        self.duration = sum(self.phases.values())
+
+    def to_dict(self):
+        return {
+            'service': self.service,
+            'start': self.start,
+            'duration': self.duration,
+            'phases': self.phases,
+            'skipped': self.skipped,
+            'instances': self.instances,
+            'targets': self.targets,
+            'moves': [_move_dict(move) for move in self.moves],
+            'deferred': [_move_dict(move) for move in self.deferred]
+        }
+
+
+def _move_dict(move):
+    instance_id, previous, rev, reason = move
+    return {'instance_id': instance_id, 'from': previous, 'to': rev,
+            'reason': reason}
+
+
+class PassTrace(_Timed):
+    """Phases of a scheduling pass, and the services it scheduled.
+    Services skipped as unchanged are only counted."""
+
+    def __init__(self, kind):
+        super(PassTrace, self).__init__()
+        self.kind = kind
+        self.skipped = 0
+        self._services = {}
+        self._lock = threading.Lock()
+
+    def service(self, service):
+        with self._lock:
+            service_trace = self._services.get(service)
+            if not service_trace:
+                service_trace = ServiceTrace(service)
+                self._services[service] = service_trace
+            return service_trace
+
+    def finish(self):
+        super(PassTrace, self).finish()
+        with self._lock:
+            for service, service_trace in self._services.items():
+                service_trace.finish()
+                if service_trace.skipped:
+                    self.skipped += 1
+                    del self._services[service]
+
+    def to_dict(self, service=None):
+        services = sorted(self._services.values(),
+                          key=lambda s: s.duration, reverse=True)
+        return {
+            'kind': self.kind,
+            'start': self.start,
+            'duration': self.duration,
+            'phases': self.phases,
+            'skipped': self.skipped,
+            'services': [s.to_dict() for s in services
+                         if not service or s.service == service]
+        }
+
+
+class _ReportedPass(object):
+    """Pass traced by another process."""
+
+    def __init__(self, trace):
+        self._trace = trace
+        self.duration = trace['duration']
+
+    def to_dict(self, service=None):
+        trace = dict(self._trace)
+        trace['services'] = [s for s in trace['services']
+                             if not service or s['service'] == service]
+        return trace
+
+
+class SchedulerTraces(object):
+    """Bounded buffer of recent scheduling passes."""
+
+    def __init__(self, size=DEFAULT_TRACES):
+        self._passes = deque(maxlen=size)
+        self._recorded = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def record(self, kind):
+        """Trace a pass, stored once it completes."""
+        pass_trace = PassTrace(kind)
+        try:
+            yield pass_trace
+        finally:
+            pass_trace.finish()
+            self._add(pass_trace)
+
+    def _add(self, pass_trace):
+        with self._lock:
+            self._passes.append(pass_trace)
+            self._recorded += 1
+
+    def add(self, trace):
+        """Store a pass traced by another process.
+        :param trace: Pass trace (as dict).
+        """
+        self._add(_ReportedPass(trace))
+
+    def since(self, recorded):
+        """Passes stored after a previous call, oldest first.
+        :param recorded: Count returned by the previous call (0 for all).
+        :return: Count of stored passes, new pass traces (as dicts).
+        """
+        with self._lock:
+            new = min(self._recorded - recorded, len(self._passes))
+            passes = list(self._passes)[len(self._passes) - new:]
+            recorded = self._recorded
+        return recorded, [pass_trace.to_dict() for pass_trace in passes]
+
+    def recent(self, limit=None, service=None, min_duration=0.0):
+        """Recent passes, newest first.
+        :param limit: Maximum passes.
+        :param service: Only passes that scheduled this service.
+        :param min_duration: Only passes at least this slow (seconds).
+        :return: Pass traces (as dicts).
+        """
+        with self._lock:
+            passes = list(self._passes)
+        traces = []
+        for pass_trace in reversed(passes):
+            if pass_trace.duration < min_duration:
+                continue
+            trace = pass_trace.to_dict(service)
+            if service and not trace['services']:
+                continue
+            traces.append(trace)
+            if limit and len(traces) >= limit:
+                break
+        return traces
+
+
+class TraceServer(threading.Thread):
+    """Serves recent traces as JSON on localhost: GET /traces?service=x
+    and the loop status of regions: GET /health"""
+
+    def __init__(self, traces, port, host='127.0.0.1', health=None):
+        """
+        :param traces: SchedulerTraces by region.
+        :param port: Port.
+        :param host: Address to bind.
+        :param health: Returns loop status by region.
+        """
+        super(TraceServer, self).__init__(name='scheduler-traces')
+        self.daemon = True
+        self._server = HTTPServer((host, port), self._handler(traces,
+                                                               health))
+
+    @staticmethod
+    def _handler(traces, health):
+        class TraceHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == '/health' and health:
+                    self._send(json.dumps(health()))
+                    return
+                if url.path != '/traces':
+                    self.send_error(404)
+                    return
+                try:
+                    params = {k: v[-1] for k, v in
+                              parse_qs(url.query).items()}
+                    limit = int(params.get('limit', 0))
+                    min_duration = float(params.get('min_duration', 0))
+                except ValueError:
+                    self.send_error(400)
+                    return
+                body = json.dumps({
+                    region: region_traces.recent(limit,
+                                                 params.get('service'),
+                                                 min_duration)
+                    for region, region_traces in traces.items()})
+                self._send(body)
+
+            def _send(self, body):
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug('Trace request: ' + format, *args)
+
+        return TraceHandler
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def run(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
@@ -0,0 +1,62 @@
+import itertools
+import logging
+import threading
+import Queue
+
+logger = logging.getLogger('flotilla')
+
+PRIORITY_MESSAGE = 0
+PRIORITY_IDLE = 1
+PRIORITY_NEW_REVISION = 2
+PRIORITY_SWEEP = 3
+
+
+class SchedulerWorkers(object):
+    """Bounded pool of threads executing prioritized scheduling tasks.
+
+    Lower priorities run first; tasks of equal priority run in order.
+    Submitting blocks while the queue is full.
+    """
+
+    def __init__(self, threads=4, queue_size=1000):
+        self._queue = Queue.PriorityQueue(maxsize=queue_size)
+        self._thread_count = threads
+        self._threads = []
+        self._order = itertools.count()
+        self._start_lock = threading.Lock()
+
+    def submit(self, priority, func, *args):
+        """Queue a task.
+        :param priority: Task priority (PRIORITY_*).
+        :param func: Function to execute.
+        :param args: Function arguments.
+        :return: Event set once the task completes.
+        """
+        self._start()
+        done = threading.Event()
+        self._queue.put((priority, next(self._order), func, args, done))
+        return done
+
+    def _start(self):
+        if self._threads:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self._thread_count):
+                worker = threading.Thread(name='scheduler-worker-%d' % i,
+                                          target=self._work)
+                worker.daemon = True
+                worker.start()
+                self._threads.append(worker)
+
+    def _work(self):
+        while True:
+            _, _, func, args, done = self._queue.get()
+            try:
+                func(*args)
+            except Exception as e:
+                logger.exception(e)
+            finally:
+                done.set()
+                self._queue.task_done()
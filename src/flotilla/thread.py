@@ -1,4 +1,5 @@
 import logging
+import signal
 import threading
 import time
 
@@ -8,23 +9,40 @@ logger = logging.getLogger('flotilla')
 class RepeatingFunc(threading.Thread):
     """Executes a function with fixed frequency."""
 
-    def __init__(self, name, func, interval):
+    def __init__(self, name, func, interval, yield_to=None):
+        """
+        :param name: Thread name.
+        :param func: Function.
+        :param interval: Frequency (seconds, 0 to repeat immediately).
+        :param yield_to: Loop that has priority, calls are skipped while it
+        is lagging.
+        """
         super(RepeatingFunc, self).__init__()
         self.name = name
         self._func = func
         self._interval = interval
+        self._yield_to = yield_to
         self._live = True
+        self.lag = 0.0
+        self.last_run = time.time()
 
     def run(self):
+        self.last_run = time.time()
         while self._live:
             start = time.time()
-            try:
-                self._func()
-            except Exception as e:
-                logger.exception(e)
+            if self._yield_to and self._yield_to.lag:
+                logger.debug('Skipping %s, %s is lagging.', self.name,
+                             self._yield_to.name)
+            else:
+                try:
+                    self._func()
+                except Exception as e:
+                    logger.exception(e)
 
-            duration = time.time() - start
+            self.last_run = time.time()
+            duration = self.last_run - start
             interval = self._interval
+            self.lag = max(duration - interval, 0.0) if interval else 0.0
             if not interval:
                 logger.debug('Function took %f, repeating.', duration)
                 continue
@@ -41,3 +59,29 @@ class RepeatingFunc(threading.Thread):
 
     def stop(self):
         self._live = False
+
+    def status(self):
+        """Lag of the last run and seconds since it completed."""
+        return {'lag': self.lag, 'age': time.time() - self.last_run,
+                'interval': self._interval}
+
+
+def loop_status(funcs):
+    """Status of repeating functions by name."""
+    return {func.name: func.status() for func in funcs
+            if isinstance(func, RepeatingFunc)}
+
+
+def wait_for_shutdown():
+    """Block until the process is asked to stop (SIGTERM/SIGINT)."""
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        logger.info('Received signal %d, shutting down.', signum)
+        stopping.set()
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, stop)
+    # Sleep in the main thread, signals are not delivered to a blocked join:
+    while not stopping.is_set():
+        time.sleep(1)
@@ -1,4 +1,5 @@
 import logging
+import multiprocessing
 import time
 import boto.utils
 
@@ -17,3 +18,29 @@ def get_instance_id():
         return metadata['instance-id']
     except:
         return 'i-%s' % str(time.time()).replace('.', '')
+
+
+def get_availability_zone():
+    """Availability zone of this instance, None if unknown."""
+    try:
+        metadata = boto.utils.get_instance_metadata(timeout=2, num_retries=2)
+        return metadata['placement']['availability-zone']
+    except:
+        return None
+
+
+def get_capacity():
+    """Resources of this instance (cpu in millicores, memory in MB)."""
+    capacity = {}
+    try:
+        capacity['cpu'] = multiprocessing.cpu_count() * 1000
+    except NotImplementedError:
+        pass
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemTotal:'):
+                    capacity['memory'] = int(line.split()[1]) / 1024
+    except IOError:
+        pass
+    return capacity
@@ -5,12 +5,15 @@ from flotilla.db import DynamoDbLocks
 
 SERVICE = 'mock-service'
 ASSIGNED_REVISION = '00000000000000000000000000000000'
+PREPARED_REVISION = '11111111111111111111111111111111'
+PACKED_REVISION = '22222222222222222222222222222222'
 
 
 class TestFlotillaAgent(unittest.TestCase):
     def setUp(self):
         self.db = MagicMock(spec=FlotillaAgentDynamo)
-        self.db.get_assignments.return_value = [ASSIGNED_REVISION]
+        self.db.get_assignment_state.return_value = ([ASSIGNED_REVISION], [],
+                                                     [], [])
         self.locks = MagicMock(spec=DynamoDbLocks)
         self.systemd = MagicMock(spec=SystemdUnits)
         self.systemd.get_unit_status.return_value = {}
@@ -30,7 +33,7 @@ class TestFlotillaAgent(unittest.TestCase):
         self.assertEquals(self.messaging.reschedule.call_count, 1)
 
     def test_assignment_noop(self):
-        self.db.get_assignments.return_value = []
+        self.db.get_assignment_state.return_value = ([], [], [], [])
 
         self.agent.assignment()
 
@@ -46,11 +49,39 @@ class TestFlotillaAgent(unittest.TestCase):
         self.locks.release_lock.assert_called_with('mock-service-deploy')
         self.systemd.set_units.assert_called_with(ANY)
         self.messaging.service_failure.assert_not_called()
+        self.db.set_deploy_time.assert_called_with(ANY)
+
+    def test_assignment_staged(self):
+        self.db.get_assignment_state.return_value = ([ASSIGNED_REVISION],
+                                                     [ASSIGNED_REVISION], [],
+                                                     [])
+
+        self.agent.assignment()
+
+        self.systemd.set_units.assert_called_with(
+                ANY, staged=[ASSIGNED_REVISION])
+        self.elb.unregister.assert_called_with()
+        self.elb.register.assert_not_called()
+        self.locks.try_lock.assert_not_called()
+
+    def test_assignment_promoted(self):
+        self.db.get_assignment_state.return_value = ([ASSIGNED_REVISION],
+                                                     [ASSIGNED_REVISION], [],
+                                                     [])
+        self.agent.assignment()
+        self.db.get_assignment_state.return_value = ([ASSIGNED_REVISION], [],
+                                                     [], [])
+
+        self.agent.assignment()
+
+        self.systemd.set_units.assert_called_with(ANY)
+        self.elb.register.assert_called_with()
 
     def test_assignment_failure(self):
         self.elb.register.return_value = False
         self.agent.assignment()
         self.messaging.service_failure.assert_called_with(ASSIGNED_REVISION)
+        self.db.set_deploy_time.assert_not_called()
 
     def test_assignment_elb_safe(self):
         self.agent = FlotillaAgent(SERVICE, self.db, self.locks, self.systemd,
@@ -60,3 +91,100 @@ class TestFlotillaAgent(unittest.TestCase):
 
         self.elb.unregister.assert_not_called()
         self.elb.register.assert_not_called()
+
+    def test_assignment_prepare(self):
+        self.agent.assignment()
+        self.locks.try_lock.reset_mock()
+        self.db.get_assignment_state.return_value = ([ASSIGNED_REVISION], [],
+                                                     [PREPARED_REVISION], [])
+
+        self.agent.assignment()
+
+        self.db.get_units.assert_called_with([ASSIGNED_REVISION,
+                                              PREPARED_REVISION])
+        self.systemd.set_units.assert_called_with(
+                ANY, staged=[PREPARED_REVISION])
+        self.db.set_prepared.assert_called_with([PREPARED_REVISION])
+        self.db.store_status.assert_called_with({})
+        self.locks.try_lock.assert_not_called()
+        self.assertEqual(1, self.elb.unregister.call_count)
+
+    def test_assignment_prepared_noop(self):
+        self.db.get_assignment_state.return_value = ([ASSIGNED_REVISION], [],
+                                                     [PREPARED_REVISION], [])
+        self.agent.assignment()
+        self.agent.assignment()
+        self.systemd.set_units.reset_mock()
+
+        self.agent.assignment()
+
+        self.systemd.set_units.assert_not_called()
+
+    def test_assignment_commit(self):
+        self.db.get_assignment_state.return_value = ([ASSIGNED_REVISION], [],
+                                                     [PREPARED_REVISION], [])
+        self.agent.assignment()
+        self.agent.assignment()
+        self.db.get_assignment_state.return_value = ([PREPARED_REVISION], [],
+                                                     [], [])
+
+        self.agent.assignment()
+
+        self.db.get_units.assert_called_with([PREPARED_REVISION])
+        self.systemd.set_units.assert_called_with(ANY)
+        self.locks.try_lock.assert_called_with('mock-service-deploy')
+
+    def test_assignment_packed(self):
+        self.agent.assignment()
+        self.locks.try_lock.reset_mock()
+        self.elb.reset_mock()
+        self.db.get_assignment_state.return_value = ([ASSIGNED_REVISION], [],
+                                                     [], [PACKED_REVISION])
+
+        self.agent.assignment()
+
+        self.db.get_units.assert_called_with([ASSIGNED_REVISION,
+                                              PACKED_REVISION])
+        self.systemd.set_units.assert_called_with(ANY)
+        self.locks.try_lock.assert_not_called()
+        self.elb.unregister.assert_not_called()
+        self.elb.register.assert_not_called()
+
+    def test_assignment_packed_noop(self):
+        self.db.get_assignment_state.return_value = ([ASSIGNED_REVISION], [],
+                                                     [], [PACKED_REVISION])
+        self.agent.assignment()
+        self.systemd.set_units.reset_mock()
+
+        self.agent.assignment()
+
+        self.systemd.set_units.assert_not_called()
+
+    def test_assignment_packed_preparing(self):
+        self.db.get_assignment_state.return_value = ([ASSIGNED_REVISION], [],
+                                                     [PREPARED_REVISION], [])
+        self.agent.assignment()
+        self.agent.assignment()
+        self.db.get_assignment_state.return_value = ([ASSIGNED_REVISION], [],
+                                                     [PREPARED_REVISION],
+                                                     [PACKED_REVISION])
+
+        self.agent.assignment()
+
+        self.db.get_units.assert_called_with([ASSIGNED_REVISION,
+                                              PACKED_REVISION,
+                                              PREPARED_REVISION])
+        self.systemd.set_units.assert_called_with(
+                ANY, staged=[PREPARED_REVISION])
+
+    def test_assignment_failure_packed(self):
+        self.db.get_assignment_state.return_value = ([ASSIGNED_REVISION], [],
+                                                     [], [PACKED_REVISION])
+        self.elb.register.return_value = False
+
+        self.agent.assignment()
+
+        self.db.get_units.assert_called_with([ASSIGNED_REVISION,
+                                              PACKED_REVISION])
+        self.messaging.service_failure.assert_called_once_with(
+                ASSIGNED_REVISION)
@@ -1,7 +1,11 @@
+import time
 import unittest
+from decimal import Decimal
 from mock import MagicMock, ANY
 from boto.kms.layer1 import KMSConnection
-from boto.dynamodb2.exceptions import ItemNotFound
+from boto.dynamodb2.exceptions import ConditionalCheckFailedException, \
+    ItemNotFound
+from boto.dynamodb2.items import Item
 from boto.dynamodb2.table import Table
 from flotilla.agent.db import FlotillaAgentDynamo
 
@@ -62,6 +66,152 @@ class TestFlotillaAgentDynamo(unittest.TestCase):
 
         ])
 
+    def test_store_status_capacity(self):
+        self.db = FlotillaAgentDynamo(self.instance_id, self.service,
+                                      self.status, self.assignments,
+                                      self.revisions, self.units, self.kms,
+                                      capacity={'cpu': 2000, 'memory': 3840})
+
+        self.db.store_status({})
+
+        data = self.status.put_item.call_args[1]['data']
+        self.assertEqual(2000, data['cpu'])
+        self.assertEqual(3840, data['memory'])
+
+    def test_store_status_availability_zone(self):
+        self.db = FlotillaAgentDynamo(self.instance_id, self.service,
+                                      self.status, self.assignments,
+                                      self.revisions, self.units, self.kms,
+                                      availability_zone='us-east-1a')
+
+        self.db.store_status({})
+
+        data = self.status.put_item.call_args[1]['data']
+        self.assertEqual('us-east-1a', data['availability_zone'])
+
+    def test_get_assignments_packed(self):
+        packed = ASSIGNED[::-1]
+        self.assignments.batch_get.return_value = [
+            {'assignment': ASSIGNED, 'packed': [packed]}
+        ]
+
+        assignment = self.db.get_assignments()
+
+        self.assertEqual(sorted([ASSIGNED, packed]), assignment)
+
+    def test_get_assignment_state_packed(self):
+        packed = ASSIGNED[::-1]
+        self.assignments.batch_get.return_value = [
+            {'assignment': ASSIGNED, 'packed': [packed]}
+        ]
+
+        assignments, _, _, packed_revisions = self.db.get_assignment_state()
+
+        self.assertEqual([ASSIGNED], assignments)
+        self.assertEqual([packed], packed_revisions)
+
+    def test_get_assignment_state_staged(self):
+        self.assignments.batch_get.return_value = [
+            {'assignment': ASSIGNED, 'staged': True},
+            {'assignment': ASSIGNED[::-1]}
+        ]
+
+        assignments, staged, prepared, _ = self.db.get_assignment_state()
+
+        self.assertEqual(sorted([ASSIGNED, ASSIGNED[::-1]]), assignments)
+        self.assertEqual([ASSIGNED], staged)
+        self.assertEqual([], prepared)
+
+    def test_get_assignment_state_prepared(self):
+        self.assignments.batch_get.return_value = [
+            {'assignment': ASSIGNED, 'prepared': ASSIGNED[::-1]}
+        ]
+
+        assignments, staged, prepared, _ = self.db.get_assignment_state()
+
+        self.assertEqual([ASSIGNED], assignments)
+        self.assertEqual([ASSIGNED[::-1]], prepared)
+
+    def test_store_status_failed_units(self):
+        self.db.store_status({
+            'flotilla-a.service': {'active_state': 'active',
+                                   'sub_state': 'running'},
+            'flotilla-b.service': {'active_state': 'failed',
+                                   'sub_state': 'failed'},
+            'flotilla-c.service': {'active_state': 'activating',
+                                   'sub_state': 'auto-restart'}
+        })
+
+        data = self.status.put_item.call_args[1]['data']
+        self.assertEqual(2, data['failed_units'])
+        self.assertNotIn('deploy_time', data)
+
+    def test_store_status_deploy_time(self):
+        self.db.set_deploy_time(12.3456)
+
+        self.db.store_status({})
+
+        data = self.status.put_item.call_args[1]['data']
+        self.assertEqual(Decimal('12.346'), data['deploy_time'])
+
+    def test_store_status_prepared(self):
+        self.db.set_prepared([ASSIGNED])
+
+        self.db.store_status({})
+
+        data = self.status.put_item.call_args[1]['data']
+        self.assertEqual([ASSIGNED], data['prepared'])
+
+    def test_store_status_expires(self):
+        self.db.store_status({})
+
+        data = self.status.put_item.call_args[1]['data']
+        self.assertTrue(data['expires'] > time.time())
+
+    def test_get_assignments_refresh_expiry(self):
+        assignment = self.assignment(expires=Decimal(int(time.time()) + 60))
+
+        self.db.get_assignments()
+
+        assignment.partial_save.assert_called_with()
+        self.assertTrue(assignment['expires'] > time.time() + 60)
+
+    def test_get_assignments_refresh_expiry_recent(self):
+        assignment = self.assignment(expires=int(time.time()) + 3500)
+
+        self.db.get_assignments()
+
+        assignment.partial_save.assert_not_called()
+
+    def test_get_assignments_refresh_expiry_missing(self):
+        # Assignments stored before expiry get one:
+        assignment = self.assignment()
+
+        self.db.get_assignments()
+
+        assignment.partial_save.assert_called_with()
+        self.assertTrue(assignment['expires'] > time.time())
+
+    def test_get_assignments_refresh_expiry_changed(self):
+        assignment = self.assignment(expires=Decimal(int(time.time()) + 60))
+        assignment.partial_save.side_effect = ConditionalCheckFailedException(
+                400, 'Bad Request')
+
+        self.assertEqual([ASSIGNED], self.db.get_assignments())
+
+    def test_get_assignments_global_shards(self):
+        self.db = FlotillaAgentDynamo(self.instance_id, self.service,
+                                      self.status, self.assignments,
+                                      self.revisions, self.units, self.kms,
+                                      global_shards=4)
+
+        self.db.get_assignments()
+
+        self.assignments.batch_get.assert_called_with([
+            {'instance_id': self.instance_id},
+            {'instance_id': 'global_3'}
+        ])
+
     def test_get_assignments_global(self):
         self.assignments.batch_get.return_value = [
             {'assignment': ASSIGNED},
@@ -72,6 +222,16 @@ class TestFlotillaAgentDynamo(unittest.TestCase):
 
         self.assertEqual(2, len(assignment))
 
+    def assignment(self, **kwargs):
+        data = {'instance_id': self.instance_id, 'assignment': ASSIGNED}
+        data.update(kwargs)
+        assignment = MagicMock(spec=Item)
+        assignment.get.side_effect = data.get
+        assignment.__getitem__.side_effect = data.__getitem__
+        assignment.__setitem__.side_effect = data.__setitem__
+        self.assignments.batch_get.return_value = [assignment]
+        return assignment
+
     def test_get_units(self):
         units = self.db.get_units([ASSIGNED])
         self.assertEqual(3, len(units))
@@ -1,5 +1,5 @@
 import unittest
-from mock import MagicMock
+from mock import MagicMock, patch
 import os
 import shutil
 import tempfile
@@ -126,6 +126,36 @@ class TestSystemdUnits(unittest.TestCase):
         self.systemd.set_units([self.flotilla_unit])
         # Exception not thrown
 
+    @patch('subprocess.check_call')
+    def test_set_units_staged(self, check_call):
+        flotilla_unit = FlotillaDockerService('redis.service', 'redis:latest')
+        flotilla_unit.rev_hash = 'rev1'
+
+        self.systemd.set_units([flotilla_unit], staged=['rev1'])
+
+        unit_path = '%s/%s' % (self.unit_dir, flotilla_unit.full_name)
+        self.assertTrue(os.path.isfile(unit_path))
+        self.loaded_unit.start.assert_not_called()
+        check_call.assert_called_with(['/usr/bin/docker', 'pull',
+                                       'redis:latest'])
+
+    @patch('subprocess.check_call')
+    def test_set_units_staged_stops(self, check_call):
+        self.loaded_unit.properties.ActiveState = 'active'
+        self.flotilla_unit.rev_hash = 'rev1'
+
+        self.systemd.set_units([self.flotilla_unit], staged=['rev1'])
+
+        self.loaded_unit.stop.assert_called_with('replace')
+
+    @patch('subprocess.check_call')
+    def test_set_units_staged_pull_failure(self, check_call):
+        check_call.side_effect = OSError('no docker')
+        self.flotilla_unit.rev_hash = 'rev1'
+
+        self.systemd.set_units([self.flotilla_unit], staged=['rev1'])
+        # Exception not thrown
+
     def test_set_units_already_started(self):
         self.loaded_unit.properties.ActiveState = 'active'
 
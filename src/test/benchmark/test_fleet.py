@@ -0,0 +1,11 @@
+import unittest
+from benchmark import fleet
+
+
+class TestFleet(unittest.TestCase):
+    def test_run_repeat(self):
+        rows = fleet.run(repeat=2, scenarios=((3, 20),))
+
+        self.assertEqual(['3/20 boot', '3/20 churn', '3/20 recover',
+                          '3/20 steady'], [row[0] for row in rows])
+        self.assertEqual(20, rows[0][5])
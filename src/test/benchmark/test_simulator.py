@@ -0,0 +1,48 @@
+import unittest
+from benchmark.simulator import FleetSimulator
+
+
+class TestFleetSimulator(unittest.TestCase):
+    def setUp(self):
+        self.simulator = FleetSimulator(services=3, agents=20, seed=1)
+
+    def test_bootstrap(self):
+        results = self.simulator.run_until_converged()
+
+        self.assertTrue(results[-1].converged)
+        self.assertEqual(20, sum(r.reassigned for r in results))
+        self.assertTrue(results[0].scheduler_write > 0)
+
+    def test_churn(self):
+        self.simulator.run_until_converged()
+
+        results = self.simulator.run(25, kill_rate=0.1, weight_changes=1)
+        results += self.simulator.run_until_converged()
+
+        self.assertTrue(results[-1].converged)
+        self.assertTrue(sum(r.moved for r in results) > 0)
+        self.assertTrue(sum(r.expired for r in results) > 0)
+        # Expired agents are left to the tables, not the reaper:
+        self.assertEqual(0, sum(r.reaped for r in results))
+
+    def test_incremental(self):
+        simulator = FleetSimulator(services=3, agents=20, seed=1,
+                                   incremental=True)
+        simulator.run_until_converged()
+
+        result = simulator.tick()
+
+        self.assertTrue(result.converged)
+        self.assertEqual(0, result.scheduler_read)
+
+    def test_assignment_expiry(self):
+        self.simulator.run_until_converged()
+        dead = self.simulator.kill()
+
+        # Live agents keep their assignment alive, the dead one's expires:
+        self.simulator.run(250)
+
+        assignments = self.simulator.tables['assignments']
+        self.assertFalse(assignments.has_item(instance_id=dead.instance_id))
+        self.assertTrue(all(agent.assigned
+                            for agent in self.simulator.agents))
@@ -11,6 +11,7 @@ ELB = 'elb-1234'
 
 class TestAgent(unittest.TestCase):
     @patch('flotilla.cli.agent.get_queue')
+    @patch('flotilla.cli.agent.get_availability_zone')
     @patch('flotilla.cli.agent.get_instance_id')
     @patch('flotilla.cli.agent.DynamoDbTables')
     @patch('flotilla.cli.agent.Manager')
@@ -20,7 +21,8 @@ class TestAgent(unittest.TestCase):
     @patch('boto.kms.connect_to_region')
     @patch('boto3.resource')
     def test_start_agent_no_elb(self, resource, kms, dynamo, elb, repeat,
-                                manager, tables, get_instance_id, get_queue):
+                                manager, tables, get_instance_id, get_zone,
+                                get_queue):
         get_queue.return_value = None
         get_instance_id.return_value = 'i-123456'
 
@@ -32,6 +34,7 @@ class TestAgent(unittest.TestCase):
 
         self.assertEquals(2, repeat.call_count)
 
+    @patch('flotilla.cli.agent.get_availability_zone')
     @patch('flotilla.cli.agent.get_instance_id')
     @patch('flotilla.cli.agent.DynamoDbTables')
     @patch('flotilla.cli.agent.FlotillaAgentDynamo')
@@ -42,7 +45,7 @@ class TestAgent(unittest.TestCase):
     @patch('boto.kms.connect_to_region')
     @patch('boto3.resource')
     def test_start_agent_elb(self, resource, kms, dynamo, elb, repeat, manager,
-                             agent_db, tables, get_instance_id):
+                             agent_db, tables, get_instance_id, get_zone):
         get_instance_id.return_value = 'i-123456'
 
         start_agent(ENVIRONMENT, SERVICE, REGION, ELB, 0.1, 0.1)
@@ -50,6 +53,7 @@ class TestAgent(unittest.TestCase):
         elb.assert_called_with(REGION)
 
     @patch('flotilla.cli.agent.get_queue')
+    @patch('flotilla.cli.agent.get_availability_zone')
     @patch('flotilla.cli.agent.get_instance_id')
     @patch('flotilla.cli.agent.DynamoDbTables')
     @patch('flotilla.cli.agent.FlotillaAgentDynamo')
@@ -61,7 +65,7 @@ class TestAgent(unittest.TestCase):
     @patch('boto3.resource')
     def test_start_agent_messaging(self, resource, kms, dynamo, elb, repeat,
                                    manager, agent_db, tables, get_instance_id,
-                                   get_queue):
+                                   get_zone, get_queue):
         get_instance_id.return_value = 'i-123456'
         get_queue.return_value = MagicMock()
 
@@ -1,11 +1,12 @@
 import unittest
-from mock import MagicMock, patch
+from mock import MagicMock, patch, ANY
 
 from io import BytesIO
 from tarfile import TarFile, TarInfo
 
+import click
 from flotilla.cli.revision import add_revision, files_from_tar, parse_env, \
-    get_units
+    get_units, set_global_revision, validate_steps
 
 ENVIRONMENT = 'test'
 REGIONS = ('us-east-1',)
@@ -117,6 +118,51 @@ BAZ=bing''')
 
         self.assertEquals(kms.call_count, len(REGIONS))
 
+    @patch('flotilla.cli.revision.FlotillaClientDynamo')
+    @patch('flotilla.cli.revision.DynamoDbTables')
+    @patch('boto.dynamodb2.connect_to_region')
+    @patch('boto.kms.connect_to_region')
+    def test_add_revision_requests(self, kms, dynamo, tables, client):
+        mock_input = self.generate_tar({'test.service': 'test'})
+
+        add_revision(ENVIRONMENT, REGIONS, SERVICE, LABEL, mock_input,
+                     cpu=500, memory=256)
+
+        revision = client.return_value.add_revision.call_args[0][1]
+        self.assertEquals(500, revision.cpu)
+        self.assertEquals(256, revision.memory)
+
+    @patch('flotilla.cli.revision.FlotillaClientDynamo')
+    @patch('flotilla.cli.revision.DynamoDbTables')
+    @patch('boto.dynamodb2.connect_to_region')
+    @patch('boto.kms.connect_to_region')
+    def test_add_revision_steps(self, kms, dynamo, tables, client):
+        mock_input = self.generate_tar({'test.service': 'test'})
+
+        add_revision(ENVIRONMENT, REGIONS, SERVICE, LABEL, mock_input,
+                     steps=[10, 100], bake=60)
+
+        client.return_value.add_revision.assert_called_with(
+                SERVICE, ANY, [10, 100], 60)
+
+    def test_validate_steps(self):
+        self.assertEqual([5, 25, 100], validate_steps(None, None, '5,25,100'))
+        self.assertIsNone(validate_steps(None, None, None))
+        for invalid in ('x', '50,25', '0,100', '10,101', '10,10'):
+            self.assertRaises(click.BadParameter, validate_steps, None, None,
+                              invalid)
+
+    @patch('flotilla.cli.revision.FlotillaClientDynamo')
+    @patch('flotilla.cli.revision.DynamoDbTables')
+    @patch('boto.dynamodb2.connect_to_region')
+    def test_set_global_revision(self, dynamo, tables, client):
+        mock_input = self.generate_tar({'test.service': 'test'})
+
+        set_global_revision(ENVIRONMENT, REGIONS, LABEL, mock_input, 32, True)
+
+        client.return_value.set_global.assert_called_with(ANY, shards=32,
+                                                          staged=True)
+
     @staticmethod
     def generate_tar(entries):
         tar_buf = BytesIO()
@@ -3,7 +3,10 @@ from mock import patch, MagicMock
 
 from botocore.exceptions import ClientError
 
-from flotilla.cli.scheduler import start_scheduler
+from flotilla.cli.scheduler import format_health, format_traces, \
+    start_scheduler, stop_scheduler
+from flotilla.scheduler import FlotillaScheduler
+from flotilla.thread import RepeatingFunc
 
 REGIONS = ['us-east-1']
 ENVIRONMENT = 'develop'
@@ -22,7 +25,36 @@ class TestScheduler(unittest.TestCase):
 
         start_scheduler(ENVIRONMENT, DOMAIN, REGIONS, 0.1, 0.1, 0.1)
 
-        self.assertEquals(4, repeat.call_count)
+        self.assertEquals(8, repeat.call_count)
+
+    @patch('flotilla.cli.scheduler.get_instance_id')
+    @patch('flotilla.cli.scheduler.DynamoDbTables')
+    @patch('flotilla.cli.scheduler.RepeatingFunc')
+    @patch('flotilla.cli.scheduler.FlotillaScheduler')
+    @patch('boto.dynamodb2.connect_to_region')
+    @patch('boto3.resource')
+    def test_start_scheduler_lease(self, sqs, dynamo, scheduler, repeat,
+                                   tables, get_instance_id):
+        get_instance_id.return_value = 'i-123456'
+
+        funcs, schedulers = start_scheduler(ENVIRONMENT, DOMAIN, REGIONS, 15,
+                                            15, 15, lease_ttl=5,
+                                            standby_interval=0.25)
+
+        self.assertEqual(5, scheduler.call_args[1]['lock_ttl'])
+        self.assertEqual(0, scheduler.call_args[1]['target_tolerance'])
+        repeat.assert_any_call('scheduler-lock-us-east-1',
+                               scheduler.return_value.lock, 0.25)
+        self.assertEqual([scheduler.return_value], schedulers)
+
+    def test_stop_scheduler(self):
+        func = MagicMock(spec=RepeatingFunc)
+        scheduler = MagicMock(spec=FlotillaScheduler)
+
+        stop_scheduler([func], [scheduler])
+
+        func.stop.assert_called_with()
+        scheduler.release.assert_called_with()
 
     @patch('flotilla.cli.scheduler.get_instance_id')
     @patch('flotilla.cli.scheduler.DynamoDbTables')
@@ -34,9 +66,39 @@ class TestScheduler(unittest.TestCase):
         get_instance_id.return_value = 'i-123456'
 
         start_scheduler(ENVIRONMENT, DOMAIN, ['us-east-1', 'us-west-2'], 0.1,
-                        0.1, 0.1)
+                        0.1, 0.1, region_workers=False)
 
-        self.assertEquals(8, repeat.call_count)
+        self.assertEquals(16, repeat.call_count)
+
+    @patch('flotilla.cli.scheduler.get_instance_id')
+    @patch('flotilla.cli.scheduler.RegionSupervisor')
+    @patch('flotilla.cli.scheduler.RegionWorker')
+    @patch('flotilla.cli.scheduler.RepeatingFunc')
+    def test_start_scheduler_region_workers(self, repeat, worker, supervisor,
+                                            get_instance_id):
+        funcs, schedulers = start_scheduler(
+                ENVIRONMENT, DOMAIN, ['us-east-1', 'us-west-2'], 0.1, 0.1,
+                0.1)
+
+        self.assertEqual(2, worker.call_count)
+        repeat.assert_not_called()
+        supervisor.return_value.start.assert_called_with()
+        self.assertEqual([supervisor.return_value], funcs)
+        self.assertEqual([], schedulers)
+
+    @patch('flotilla.cli.scheduler.get_instance_id')
+    @patch('flotilla.cli.scheduler.DynamoDbTables')
+    @patch('flotilla.cli.scheduler.RepeatingFunc')
+    @patch('boto.dynamodb2.connect_to_region')
+    @patch('boto3.resource')
+    def test_start_scheduler_yield_to_scheduler(self, sqs, dynamo, repeat,
+                                                tables, get_instance_id):
+        start_scheduler(ENVIRONMENT, DOMAIN, REGIONS, 0.1, 0.1, 0.1)
+
+        provisioner_call = repeat.call_args_list[2]
+        self.assertEqual('provisioner-us-east-1', provisioner_call[0][0])
+        self.assertEqual(repeat.return_value,
+                         provisioner_call[1]['yield_to'])
 
     @patch('flotilla.cli.scheduler.get_instance_id')
     @patch('flotilla.cli.scheduler.DynamoDbTables')
@@ -51,4 +113,68 @@ class TestScheduler(unittest.TestCase):
 
         start_scheduler(ENVIRONMENT, DOMAIN, REGIONS, 0.1, 0.1, 0.1)
 
-        self.assertEquals(3, repeat.call_count)
+        self.assertEquals(7, repeat.call_count)
+
+    @patch('flotilla.cli.scheduler.get_instance_id')
+    @patch('flotilla.cli.scheduler.DynamoDbTables')
+    @patch('flotilla.cli.scheduler.RepeatingFunc')
+    @patch('flotilla.cli.scheduler.FlotillaScheduler')
+    @patch('boto.dynamodb2.connect_to_region')
+    @patch('boto3.resource')
+    def test_start_scheduler_segments(self, sqs, dynamo, scheduler, repeat,
+                                      tables, get_instance_id):
+        get_instance_id.return_value = 'i-123456'
+
+        start_scheduler(ENVIRONMENT, DOMAIN, REGIONS, 0.1, 0.1, 0.1,
+                        segments=4)
+
+        segments = scheduler.call_args[1]['segments']
+        self.assertEqual(4, segments.total_segments)
+
+    @patch('flotilla.cli.scheduler.get_instance_id')
+    @patch('flotilla.cli.scheduler.DynamoDbTables')
+    @patch('flotilla.cli.scheduler.RepeatingFunc')
+    @patch('flotilla.cli.scheduler.TraceServer')
+    @patch('boto.dynamodb2.connect_to_region')
+    @patch('boto3.resource')
+    def test_start_scheduler_traces(self, sqs, dynamo, trace_server, repeat,
+                                    tables, get_instance_id):
+        funcs, schedulers = start_scheduler(ENVIRONMENT, DOMAIN, REGIONS, 0.1,
+                                            0.1, 0.1, trace_port=7701)
+
+        self.assertEqual(({'us-east-1': schedulers[0].traces}, 7701),
+                         trace_server.call_args[0])
+        trace_server.return_value.start.assert_called_with()
+        self.assertIn(trace_server.return_value, funcs)
+
+    def test_format_traces(self):
+        traces = {'us-east-1': [{
+            'kind': 'full', 'duration': 1.5, 'skipped': 3,
+            'phases': {'scan': 0.5},
+            'services': [{
+                'service': 'test', 'duration': 1.0, 'instances': 2,
+                'targets': {'rev1': 2}, 'phases': {'write': 0.25},
+                'moves': [{'instance_id': 'i-1', 'from': None, 'to': 'rev1',
+                           'reason': 'unassigned'}],
+                'deferred': []
+            }]
+        }]}
+
+        lines = list(format_traces(traces))
+
+        self.assertEqual(3, len(lines))
+        self.assertIn('scan=0.500s', lines[0])
+        self.assertIn('i-1: None -> rev1 (unassigned)', lines[2])
+
+    def test_format_health(self):
+        health = {'us-east-1': {
+            'healthy': False, 'pid': 123, 'reported': 1.5,
+            'loops': {'scheduler-us-east-1': {'lag': 2.0, 'age': 3.0,
+                                              'interval': 15}}
+        }}
+
+        lines = list(format_health(health))
+
+        self.assertEqual(['us-east-1 UNHEALTHY (pid 123, reported 1.5s ago)',
+                          '  scheduler-us-east-1: lag 2.000s, ran 3.0s ago'],
+                         lines)
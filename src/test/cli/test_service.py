@@ -3,7 +3,7 @@ from mock import patch
 from click import BadParameter
 
 from flotilla.cli.service import configure_service, get_updates, \
-    validate_health_check
+    validate_health_check, validate_max_unavailable
 
 ENVIRONMENT = 'develop'
 REGIONS = ('us-east-1', 'us-west-2')
@@ -33,6 +33,27 @@ class TestService(unittest.TestCase):
                               COREOS_CHANNEL, COREOS_VERSION, None, None)
         self.assertEquals(len(updates), 10)
 
+    def test_get_updates_max_unavailable(self):
+        updates = get_updates(None, None, None, None, None, None, None, None,
+                              None, None, (), (), '25%')
+        self.assertEquals(updates, {'max_unavailable': '25%'})
+
+    def test_get_updates_standby(self):
+        updates = get_updates(None, None, None, None, None, None, None, None,
+                              None, None, (), (), standby=0)
+        self.assertEquals(updates, {'standby': 0})
+
+    def test_get_updates_two_phase(self):
+        updates = get_updates(None, None, None, None, None, None, None, None,
+                              None, None, (), (), two_phase=True)
+        self.assertEquals(updates, {'two_phase': True})
+
+    def test_get_updates_placement_packed(self):
+        updates = get_updates(None, None, None, None, None, None, None, None,
+                              None, None, (), (), placement='packed')
+        self.assertEquals(updates, {'placement': 'packed',
+                                    'provision': False})
+
     def test_get_updates_public_ports(self):
         updates = get_updates(None, None, None, None, None, None, None, None,
                               None, None, ('80-http', '9200-http'), None)
@@ -89,6 +110,20 @@ class TestService(unittest.TestCase):
         health_check = validate_health_check(None, None, None)
         self.assertEquals(None, health_check)
 
+    def test_validate_max_unavailable_count(self):
+        self.assertEquals(2, validate_max_unavailable(None, None, '2'))
+
+    def test_validate_max_unavailable_percent(self):
+        self.assertEquals('25%', validate_max_unavailable(None, None, '25%'))
+
+    def test_validate_max_unavailable_invalid(self):
+        for value in ('0', 'all', '%'):
+            self.assertRaises(BadParameter, validate_max_unavailable, None,
+                              None, value)
+
+    def test_validate_max_unavailable_empty(self):
+        self.assertEquals(None, validate_max_unavailable(None, None, None))
+
     def assert_invalid_health_check(self, check):
         self.assertRaises(BadParameter, validate_health_check, None, None,
                           check)
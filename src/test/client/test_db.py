@@ -57,6 +57,29 @@ class TestFlotillaClientDynamo(unittest.TestCase):
         self.units.batch_write.assert_called_with()
         self.revisions.new_item.assert_called_with(ANY)
 
+    def test_add_revision_steps(self):
+        self.db.add_revision(SERVICE_NAME, self.revision, steps=[10, 100],
+                             bake=60)
+
+        self.service_item.__setitem__.assert_any_call(self.rev_hash, 0)
+        delivery = [c[0][1] for c in self.service_item.__setitem__.call_args_list
+                    if c[0][0] == 'delivery'][0]
+        self.assertEqual([10, 100], delivery['steps'])
+        self.assertEqual(60, delivery['bake'])
+        self.assertEqual(-1, delivery['step'])
+        self.assertEqual('ramping', delivery['state'])
+
+    def test_add_revision_requests(self):
+        self.revision.cpu = 500
+        self.revision.memory = 256
+        rev_item = MagicMock(spec=Item)
+        self.revisions.new_item.return_value = rev_item
+
+        self.db.add_revision(SERVICE_NAME, self.revision)
+
+        rev_item.__setitem__.assert_any_call('cpu', 500)
+        rev_item.__setitem__.assert_any_call('memory', 256)
+
     def test_add_revision_existing(self):
         self.revisions.has_item.return_value = True
 
@@ -178,6 +201,50 @@ class TestFlotillaClientDynamo(unittest.TestCase):
         self.revisions.new_item.assert_called_with(ANY)
         self.assignments.batch_write.assert_called_with()
 
+    def test_set_global_shards(self):
+        batch = self.assignments.batch_write.return_value.__enter__ \
+            .return_value
+
+        self.db.set_global(self.revision, shards=4)
+
+        self.assertEqual(4, batch.put_item.call_count)
+
+    def test_set_global_staged(self):
+        self.assignments.get_item.side_effect = ItemNotFound()
+
+        self.db.set_global(self.revision, shards=4, staged=True)
+
+        self.assignments.batch_write.assert_not_called()
+        rollout = self.assignments.put_item.call_args[1]['data']
+        self.assertEqual('global_rollout', rollout['instance_id'])
+        self.assertEqual(self.rev_hash, rollout['assignment'])
+        self.assertEqual(0, rollout['shard'])
+        self.assertEqual(4, rollout['shards'])
+        self.assertEqual('rolling', rollout['state'])
+
+    def test_set_global_staged_resume(self):
+        rollout = MagicMock(spec=Item)
+        rollout.__getitem__.side_effect = {
+            'assignment': self.rev_hash, 'shard': 3}.__getitem__
+        self.assignments.get_item.return_value = rollout
+
+        self.db.set_global(self.revision, staged=True)
+
+        rollout.__setitem__.assert_any_call('state', 'rolling')
+        rollout.partial_save.assert_called_with()
+        self.assignments.put_item.assert_not_called()
+
+    def test_set_global_staged_replace(self):
+        rollout = MagicMock(spec=Item)
+        rollout.__getitem__.side_effect = {
+            'assignment': 'other', 'shard': 3}.__getitem__
+        self.assignments.get_item.return_value = rollout
+
+        self.db.set_global(self.revision, staged=True)
+
+        rollout.partial_save.assert_not_called()
+        self.assignments.put_item.assert_called_with(data=ANY, overwrite=True)
+
     def test_encrypt_environment(self):
         self.kms.generate_data_key.return_value = {
             'Plaintext': '0000000000000000',
@@ -31,6 +31,30 @@ class TestDynamoDbLocks(unittest.TestCase):
         self.locks.release_lock(LOCK_NAME)
         self.lock_item.delete.assert_called_with()
 
+    def test_get_state(self):
+        self.lock_data['state'] = '{"reconcile_time": 1}'
+
+        state = self.locks.get_state(LOCK_NAME)
+
+        self.assertEqual({'reconcile_time': 1}, state)
+        self.lock_table.get_item.assert_called_with(
+                lock_name=LOCK_NAME + '-state', consistent=True)
+
+    def test_get_state_not_found(self):
+        self.lock_table.get_item.side_effect = ItemNotFound()
+
+        self.assertEqual({}, self.locks.get_state(LOCK_NAME))
+
+    def test_set_state(self):
+        self.locks.set_state(LOCK_NAME, {'reconcile_time': 1})
+
+        self.lock_table.put_item.assert_called_with({
+            'lock_name': LOCK_NAME + '-state',
+            'owner': INSTANCE_ID,
+            'state': '{"reconcile_time": 1}',
+            'update_time': ANY
+        }, overwrite=True)
+
     def test_release_lock_not_found(self):
         self.lock_table.get_item.side_effect = ItemNotFound()
         self.locks.release_lock(LOCK_NAME)
@@ -87,6 +111,11 @@ class TestDynamoDbLocks(unittest.TestCase):
         owner, acquire_time = self.locks.get_owner(LOCK_NAME)
         self.assertEquals(owner, INSTANCE_ID)
 
+    def test_get_owner_eventually_consistent(self):
+        self.locks.get_owner(LOCK_NAME, consistent=False)
+        self.lock_table.get_item.assert_called_with(lock_name=LOCK_NAME,
+                                                    consistent=False)
+
     def test_get_owner_not_found(self):
         self.lock_table.get_item.side_effect = ItemNotFound()
         owner, acquire_time = self.locks.get_owner(LOCK_NAME)
@@ -0,0 +1,226 @@
+import unittest
+from mock import MagicMock, ANY
+from boto.dynamodb2.exceptions import ConditionalCheckFailedException, \
+    ItemNotFound
+from boto.dynamodb2.fields import HashKey, RangeKey
+from flotilla.db import DynamoDbLocks
+from flotilla.db.memory import MemoryTable
+
+SERVICE = 'test'
+INSTANCE_ID = 'i-123456'
+
+
+class TestMemoryTable(unittest.TestCase):
+    def setUp(self):
+        self.stream = MagicMock()
+        self.table = MemoryTable('status', [HashKey('service'),
+                                            RangeKey('instance_id')],
+                                 stream=self.stream)
+
+    def test_get_item_not_found(self):
+        self.assertRaises(ItemNotFound, self.table.get_item,
+                          service=SERVICE, instance_id=INSTANCE_ID)
+
+    def test_put_item(self):
+        self.table.put_item(data=self.status())
+
+        item = self.table.get_item(service=SERVICE, instance_id=INSTANCE_ID)
+        self.assertEqual(1, item['status_time'])
+        self.assertTrue(self.table.has_item(service=SERVICE,
+                                            instance_id=INSTANCE_ID))
+
+    def test_put_item_exists(self):
+        self.table.put_item(data=self.status())
+
+        self.assertRaises(ConditionalCheckFailedException,
+                          self.table.put_item, data=self.status())
+
+    def test_put_item_overwrite(self):
+        self.table.put_item(data=self.status())
+        self.table.put_item(data=self.status(status_time=2), overwrite=True)
+
+        item = self.table.get_item(service=SERVICE, instance_id=INSTANCE_ID)
+        self.assertEqual(2, item['status_time'])
+
+    def test_item_save_conflict(self):
+        self.table.put_item(data=self.status())
+        item = self.table.get_item(service=SERVICE, instance_id=INSTANCE_ID)
+        self.table.put_item(data=self.status(status_time=2), overwrite=True)
+
+        item['status_time'] = 3
+        self.assertRaises(ConditionalCheckFailedException, item.save)
+
+    def test_item_partial_save(self):
+        self.table.put_item(data=self.status())
+        item = self.table.get_item(service=SERVICE, instance_id=INSTANCE_ID)
+
+        item['foo'] = 'bar'
+        item.partial_save()
+
+        item = self.table.get_item(service=SERVICE, instance_id=INSTANCE_ID)
+        self.assertEqual('bar', item['foo'])
+        self.assertEqual(1, item['status_time'])
+
+    def test_item_delete(self):
+        self.table.put_item(data=self.status())
+        item = self.table.get_item(service=SERVICE, instance_id=INSTANCE_ID)
+
+        item.delete()
+
+        self.assertFalse(self.table.has_item(service=SERVICE,
+                                             instance_id=INSTANCE_ID))
+
+    def test_query_2(self):
+        self.table.put_item(data=self.status())
+        self.table.put_item(data=self.status(instance_id='i-654321'))
+        self.table.put_item(data=self.status(service='other'))
+
+        items = list(self.table.query_2(service__eq=SERVICE,
+                                        attributes=('instance_id',)))
+
+        self.assertEqual(2, len(items))
+        self.assertEqual(['instance_id'], items[0].keys())
+
+    def test_query_2_filter(self):
+        self.table.put_item(data=self.status())
+        self.table.put_item(data=self.status(instance_id='i-654321',
+                                             status_time=5))
+
+        items = list(self.table.query_2(service__eq=SERVICE,
+                                        query_filter={'status_time__gt': 2}))
+
+        self.assertEqual(1, len(items))
+
+    def test_query_2_filter_or(self):
+        self.table.put_item(data=self.status())
+        self.table.put_item(data=self.status(instance_id='i-654321',
+                                             expires=5))
+        self.table.put_item(data=self.status(instance_id='i-abcdef',
+                                             expires=1))
+
+        items = list(self.table.query_2(
+                service__eq=SERVICE,
+                query_filter={'expires__gt': 2, 'expires__null': True},
+                conditional_operator='OR'))
+
+        self.assertEqual([INSTANCE_ID, 'i-654321'],
+                         [i['instance_id'] for i in items])
+
+    def test_scan_segments(self):
+        for i in range(20):
+            self.table.put_item(data=self.status(service='service-%d' % i))
+
+        segments = [set(i['service'] for i in
+                        self.table.scan(segment=s, total_segments=3))
+                    for s in range(3)]
+
+        self.assertEqual(20, sum(len(s) for s in segments))
+        self.assertEqual(20, len(segments[0] | segments[1] | segments[2]))
+
+    def test_scan_filter(self):
+        self.table.put_item(data=self.status())
+        self.table.put_item(data=self.status(instance_id='i-654321', foo=1))
+
+        items = list(self.table.scan(foo__null=False))
+
+        self.assertEqual(1, len(items))
+
+    def test_batch(self):
+        with self.table.batch_write() as batch:
+            batch.put_item(self.status())
+            batch.put_item(self.status(instance_id='i-654321'))
+        with self.table.batch_write() as batch:
+            batch.delete_item(service=SERVICE, instance_id='i-654321')
+
+        items = list(self.table.batch_get(keys=[
+            {'service': SERVICE, 'instance_id': INSTANCE_ID},
+            {'service': SERVICE, 'instance_id': 'i-654321'}]))
+        self.assertEqual(1, len(items))
+
+    def test_capacity(self):
+        self.table.put_item(data=self.status())
+        self.table.get_item(service=SERVICE, instance_id=INSTANCE_ID)
+        self.table.get_item(service=SERVICE, instance_id=INSTANCE_ID,
+                            consistent=True)
+
+        self.assertEqual(1, self.table.consumed_write)
+        self.assertEqual(1.5, self.table.consumed_read)
+        self.table.reset_capacity()
+        self.assertEqual(0, self.table.consumed_read)
+
+    def test_capacity_large_item(self):
+        self.table.put_item(data=self.status(blob='x' * 5000))
+        self.assertEqual(5, self.table.consumed_write)
+
+        self.table.get_item(service=SERVICE, instance_id=INSTANCE_ID)
+        self.assertEqual(1, self.table.consumed_read)
+
+    def test_stream(self):
+        self.table.put_item(data=self.status())
+
+        self.stream.assert_called_with('status', {
+            'service': SERVICE,
+            'instance_id': INSTANCE_ID
+        }, self.status(), 'INSERT')
+
+    def test_stream_modify(self):
+        self.table.put_item(data=self.status())
+        self.table.put_item(data=self.status(status_time=2), overwrite=True)
+
+        self.stream.assert_called_with('status', ANY, self.status(
+                status_time=2), 'MODIFY')
+
+    def test_stream_remove(self):
+        self.table.put_item(data=self.status())
+        self.table.delete_item(service=SERVICE, instance_id=INSTANCE_ID)
+
+        self.stream.assert_called_with('status', ANY, self.status(),
+                                       'REMOVE')
+
+    def test_stream_delete_missing(self):
+        self.table.delete_item(service=SERVICE, instance_id=INSTANCE_ID)
+        self.stream.assert_not_called()
+
+    def test_expire(self):
+        table = MemoryTable('status', [HashKey('service'),
+                                       RangeKey('instance_id')],
+                            stream=self.stream, ttl_attribute='expires')
+        table.put_item(data=self.status(expires=5))
+        table.put_item(data=self.status(instance_id='i-654321', expires=20))
+        table.put_item(data=self.status(instance_id='i-abcdef'))
+        table.reset_capacity()
+
+        self.assertEqual(1, table.expire(now=10))
+
+        self.assertFalse(table.has_item(service=SERVICE,
+                                        instance_id=INSTANCE_ID))
+        self.assertEqual(2, table.describe()['Table']['ItemCount'])
+        self.assertEqual(0, table.consumed_write)
+        self.stream.assert_called_with('status', ANY, self.status(expires=5),
+                                       'REMOVE')
+
+    def test_expire_disabled(self):
+        self.table.put_item(data=self.status(expires=5))
+
+        self.assertEqual(0, self.table.expire(now=10))
+
+    def test_locks(self):
+        locks_table = MemoryTable('locks', [HashKey('lock_name')])
+        locks = DynamoDbLocks(INSTANCE_ID, locks_table)
+        other_locks = DynamoDbLocks('i-654321', locks_table)
+
+        self.assertTrue(locks.try_lock('test', refresh=True))
+        self.assertTrue(locks.try_lock('test', refresh=True))
+        self.assertFalse(other_locks.try_lock('test'))
+        locks.release_lock('test')
+        self.assertTrue(other_locks.try_lock('test'))
+
+    @staticmethod
+    def status(**kwargs):
+        status = {
+            'service': SERVICE,
+            'instance_id': INSTANCE_ID,
+            'status_time': 1
+        }
+        status.update(kwargs)
+        return status
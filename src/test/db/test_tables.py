@@ -1,3 +1,4 @@
+import json
 import unittest
 from mock import MagicMock, ANY
 from boto.exception import BotoServerError
@@ -41,6 +42,60 @@ class TestDynamoDbTables(unittest.TestCase):
                 provisioned_throughput=ANY
         )
 
+    def test_setup_create_ttl(self):
+        self.dynamo.describe_table.side_effect = [
+            BotoServerError(400, 'Not Found',
+                            '<Code>ResourceNotFoundException</Code>'),
+            self.dynamo.describe_table.return_value
+        ]
+
+        self.dynamo.make_request.return_value = {
+            'TimeToLiveDescription': {'TimeToLiveStatus': 'DISABLED'}}
+
+        self.tables.setup(['status'], ttl=True)
+
+        self.dynamo.make_request.assert_called_with('UpdateTimeToLive', ANY)
+        body = json.loads(self.dynamo.make_request.call_args[0][1])
+        self.assertEqual('flotilla-status', body['TableName'])
+        self.assertEqual('expires',
+                         body['TimeToLiveSpecification']['AttributeName'])
+
+    def test_setup_existing_ttl_disabled(self):
+        self.dynamo.make_request.return_value = {
+            'TimeToLiveDescription': {'TimeToLiveStatus': 'DISABLED'}}
+
+        self.tables.setup(['status'], ttl=True)
+
+        self.dynamo.make_request.assert_any_call('DescribeTimeToLive', ANY)
+        self.dynamo.make_request.assert_called_with('UpdateTimeToLive', ANY)
+
+    def test_setup_existing_ttl_enabled(self):
+        self.dynamo.make_request.return_value = {
+            'TimeToLiveDescription': {'TimeToLiveStatus': 'ENABLED'}}
+
+        self.tables.setup(['status'], ttl=True)
+
+        self.dynamo.make_request.assert_called_once_with('DescribeTimeToLive',
+                                                         ANY)
+
+    def test_setup_ttl_denied(self):
+        self.dynamo.make_request.side_effect = BotoServerError(
+                400, 'AccessDeniedException')
+
+        self.tables.setup(['status'], ttl=True)
+
+        self.assertNotEqual(self.tables.status, None)
+
+    def test_setup_no_ttl(self):
+        self.tables.setup(['revisions'], ttl=True)
+
+        self.dynamo.make_request.assert_not_called()
+
+    def test_setup_ttl_not_requested(self):
+        self.tables.setup(['status'])
+
+        self.dynamo.make_request.assert_not_called()
+
     def test_setup_create_wait(self):
         self.dynamo.describe_table.side_effect = [
             BotoServerError(400, 'Not Found',
@@ -0,0 +1,206 @@
+import unittest
+from mock import MagicMock
+from botocore.exceptions import ClientError
+from flotilla.scheduler.changes import ServiceChanges, DynamoStreamChanges
+
+SERVICE = 'test'
+STREAM_ARN = 'arn:aws:dynamodb:us-east-1:123456:table/services/stream/1'
+
+
+class TestServiceChanges(unittest.TestCase):
+    def setUp(self):
+        self.changes = ServiceChanges()
+
+    def test_stale_until_drained(self):
+        self.assertTrue(self.changes.stale)
+        self.changes.drain()
+        self.assertFalse(self.changes.stale)
+
+    def test_record_services(self):
+        self.changes.record('services', {'service_name': SERVICE})
+        self.assertEqual({SERVICE}, self.changes.drain())
+
+    def test_record_status(self):
+        self.changes.record('status', {'service': SERVICE,
+                                       'instance_id': 'i-123456'})
+        self.assertEqual({SERVICE}, self.changes.drain())
+
+    def test_record_status_heartbeat(self):
+        self.changes.record('status', {'service': SERVICE,
+                                       'instance_id': 'i-123456'},
+                            event='MODIFY')
+        self.assertEqual(set(), self.changes.drain())
+
+    def test_record_status_removed(self):
+        self.changes.record('status', {'service': SERVICE,
+                                       'instance_id': 'i-123456'},
+                            event='REMOVE')
+        self.assertEqual({SERVICE}, self.changes.drain())
+
+    def test_record_assignments(self):
+        self.changes.record('assignments', {'instance_id': 'i-123456'},
+                            {'instance_id': 'i-123456', 'service': SERVICE})
+        self.assertEqual({SERVICE}, self.changes.drain())
+
+    def test_record_assignments_without_service(self):
+        self.changes.record('assignments', {'instance_id': 'global_0'})
+        self.assertEqual(set(), self.changes.drain())
+
+    def test_record_services_created(self):
+        self.changes.record('services', {'service_name': SERVICE},
+                            event='INSERT')
+        self.changes.record('services', {'service_name': 'other'},
+                            event='MODIFY')
+
+        self.assertEqual({SERVICE}, self.changes.created())
+        self.changes.drain()
+        self.assertEqual(set(), self.changes.created())
+
+    def test_record_assignments_removed(self):
+        self.changes.record('assignments', {'instance_id': 'i-1'},
+                            {'service': SERVICE}, 'REMOVE')
+        self.changes.record('assignments', {'instance_id': 'i-2'},
+                            {'service': SERVICE}, 'MODIFY')
+
+        self.assertEqual({'i-1'}, self.changes.drain_removed())
+        self.assertEqual(set(), self.changes.drain_removed())
+
+    def test_drain_resets(self):
+        self.changes.service_changed(SERVICE)
+        self.changes.drain()
+        self.assertEqual(set(), self.changes.drain())
+
+
+class TestDynamoStreamChanges(unittest.TestCase):
+    def setUp(self):
+        self.streams = MagicMock()
+        self.streams.describe_stream.return_value = {
+            'StreamDescription': {'Shards': [{'ShardId': 'shard-1'}]}
+        }
+        self.streams.get_shard_iterator.return_value = {
+            'ShardIterator': 'iterator-1'
+        }
+        self.streams.get_records.return_value = {
+            'Records': [{
+                'eventName': 'MODIFY',
+                'dynamodb': {'Keys': {'service_name': {'S': SERVICE}},
+                             'SequenceNumber': '100'}
+            }],
+            'NextShardIterator': 'iterator-2'
+        }
+        self.changes = DynamoStreamChanges(self.streams,
+                                           {'services': STREAM_ARN})
+        self.changes.drain()
+
+    def test_poll(self):
+        self.changes.poll()
+
+        self.streams.get_shard_iterator.assert_called_with(
+                StreamArn=STREAM_ARN, ShardId='shard-1',
+                ShardIteratorType='LATEST')
+        self.assertEqual({SERVICE}, self.changes.drain())
+
+    def test_poll_follows_iterator(self):
+        self.changes.poll()
+        self.changes.poll()
+
+        self.streams.get_records.assert_called_with(ShardIterator='iterator-2')
+        self.assertEqual(1, self.streams.get_shard_iterator.call_count)
+
+    def test_poll_new_shard(self):
+        self.changes.poll()
+        self.streams.describe_stream.return_value = {
+            'StreamDescription': {'Shards': [{'ShardId': 'shard-1'},
+                                             {'ShardId': 'shard-2'}]}
+        }
+
+        self.changes.poll()
+
+        self.streams.get_shard_iterator.assert_called_with(
+                StreamArn=STREAM_ARN, ShardId='shard-2',
+                ShardIteratorType='TRIM_HORIZON')
+
+    def test_poll_shard_pages(self):
+        self.streams.describe_stream.side_effect = [
+            {'StreamDescription': {'Shards': [{'ShardId': 'shard-1'}],
+                                   'LastEvaluatedShardId': 'shard-1'}},
+            {'StreamDescription': {'Shards': [{'ShardId': 'shard-2'}]}}
+        ]
+
+        self.changes.poll()
+
+        self.streams.describe_stream.assert_called_with(
+                StreamArn=STREAM_ARN, ExclusiveStartShardId='shard-1')
+        self.assertEqual({('services', 'shard-1'), ('services', 'shard-2')},
+                         set(self.changes._iterators.keys()))
+
+    def test_poll_closed_shard(self):
+        self.streams.get_records.return_value = {'Records': []}
+        self.changes.poll()
+        self.changes.poll()
+
+        self.assertEqual(1, self.streams.get_records.call_count)
+
+    def test_poll_trimmed_shard(self):
+        self.streams.get_records.return_value = {'Records': []}
+        self.changes.poll()
+        self.streams.describe_stream.return_value = {
+            'StreamDescription': {'Shards': [{'ShardId': 'shard-2'}]}
+        }
+
+        self.changes.poll()
+
+        self.assertEqual([('services', 'shard-2')],
+                         self.changes._iterators.keys())
+
+    def test_poll_error(self):
+        self.streams.get_records.side_effect = ClientError(
+                {'Error': {'Code': 'ExpiredIteratorException'}}, 'GetRecords')
+
+        self.changes.poll()
+
+        self.assertTrue(self.changes.stale)
+
+    def test_checkpoint(self):
+        self.changes.poll()
+
+        self.assertEqual({'services shard-1': '100'},
+                         self.changes.checkpoint())
+
+    def test_checkpoint_closed_shard_dropped(self):
+        self.changes.restore({'services shard-0': '50'})
+        self.changes.poll()
+
+        self.assertEqual({'services shard-1': '100'},
+                         self.changes.checkpoint())
+
+    def test_restore(self):
+        self.assertTrue(self.changes.restore({'services shard-1': '100'}))
+        self.assertFalse(self.changes.stale)
+
+        self.changes.poll()
+
+        self.streams.get_shard_iterator.assert_called_with(
+                StreamArn=STREAM_ARN, ShardId='shard-1',
+                ShardIteratorType='AFTER_SEQUENCE_NUMBER',
+                SequenceNumber='100')
+
+    def test_restore_new_shard(self):
+        self.changes.restore({})
+
+        self.changes.poll()
+
+        self.streams.get_shard_iterator.assert_called_with(
+                StreamArn=STREAM_ARN, ShardId='shard-1',
+                ShardIteratorType='TRIM_HORIZON')
+
+    def test_restore_trimmed(self):
+        self.changes.restore({'services shard-1': '100'})
+        self.streams.get_shard_iterator.side_effect = ClientError(
+                {'Error': {'Code': 'TrimmedDataAccessException'}},
+                'GetShardIterator')
+
+        self.changes.poll()
+
+        self.assertTrue(self.changes.stale)
+        self.assertEqual({}, self.changes.checkpoint())
@@ -277,6 +277,41 @@ class TestFlotillaCloudFormation(unittest.TestCase):
         self.assertTrue(template.find('ap-northeast-1') != 1)
         self.assertTrue(template.find('us-east-1') != 1)
 
+    def scheduler_dynamo_actions(self, table):
+        template = json.loads(self.cf._template('scheduler'))
+        policy = [p for p in template['Resources']['Role']['Properties'][
+            'Policies'] if p['PolicyName'] == 'FlotillaDynamo'][0]
+        actions = set()
+        for statement in policy['PolicyDocument']['Statement']:
+            if statement['Resource']['Fn::Join'][1][-1] == '-' + table:
+                actions.update(statement['Action'])
+        return actions
+
+    def scheduler_policy_actions(self, name):
+        template = json.loads(self.cf._template('scheduler'))
+        policy = [p for p in template['Resources']['Role']['Properties'][
+            'Policies'] if p['PolicyName'] == name][0]
+        actions = set()
+        for statement in policy['PolicyDocument']['Statement']:
+            actions.update(statement['Action'])
+        return actions
+
+    def test_scheduler_delivery_health(self):
+        # Deliveries ramp on load balancer health:
+        self.assertIn('elasticloadbalancing:DescribeInstanceHealth',
+                      self.scheduler_policy_actions('FlotillaCloudFormation'))
+
+    def test_scheduler_assignment_generations(self):
+        # Generations are read, then conditionally incremented:
+        actions = self.scheduler_dynamo_actions('assignments')
+        self.assertIn('dynamodb:GetItem', actions)
+        self.assertIn('dynamodb:UpdateItem', actions)
+
+    def test_scheduler_assignment_updates(self):
+        # Assignments are written as conditional partial updates:
+        self.assertIn('dynamodb:UpdateItem',
+                      self.scheduler_dynamo_actions('assignments'))
+
     def test_schedulers_every(self):
         self.mock_client()
         self.cf._stack = MagicMock()
@@ -1,9 +1,14 @@
 import unittest
 from mock import MagicMock, ANY
 import time
+from flotilla.model import EXPIRES
 from flotilla.scheduler.db import FlotillaSchedulerDynamo, INSTANCE_EXPIRY
 from boto.dynamodb2.table import Table, BatchTable
-from boto.dynamodb2.exceptions import ItemNotFound
+from boto.dynamodb2.exceptions import ConditionalCheckFailedException, \
+    ItemNotFound
+from boto.dynamodb2.items import Item
+from flotilla.db.memory import MemoryTable
+from flotilla.db.tables import SCHEMAS
 
 SERVICE = 'test'
 INSTANCE_ID = 'i-123456'
@@ -19,9 +24,11 @@ class TestFlotillaSchedulerDynamo(unittest.TestCase):
         self.stacks = MagicMock(spec=Table)
         self.status = MagicMock(spec=Table)
 
+        self.revisions = MagicMock(spec=Table)
+
         self.db = FlotillaSchedulerDynamo(self.assignments, self.regions,
                                           self.services, self.stacks,
-                                          self.status)
+                                          self.status, self.revisions)
 
     def test_get_all_revision_weights_empty(self):
         weights = self.db.get_all_revision_weights()
@@ -69,6 +76,38 @@ class TestFlotillaSchedulerDynamo(unittest.TestCase):
         weights = self.db.get_all_revision_weights()
         self.assertEqual(1, len(weights[SERVICE]))
 
+    def test_services_segments(self):
+        self.services.scan.side_effect = [[{'service_name': SERVICE}],
+                                          [{'service_name': 'done'}]]
+        self.db.set_segments([1, 3], 4)
+
+        services = [s for s in self.db.services()]
+
+        self.assertEqual([{'service_name': SERVICE}, {'service_name': 'done'}],
+                         services)
+        self.services.scan.assert_any_call(segment=1, total_segments=4,
+                                           attributes=None)
+        self.services.scan.assert_any_call(segment=3, total_segments=4,
+                                           attributes=None)
+        self.assertFalse(self.db.primary)
+
+    def test_owns_service(self):
+        self.assertTrue(self.db.owns_service(SERVICE))
+
+    def test_owns_service_segments(self):
+        self.services.scan.return_value = [{'service_name': SERVICE}]
+        self.db.set_segments([0], 2)
+        self.db.services()
+
+        self.assertTrue(self.db.owns_service(SERVICE))
+        self.assertFalse(self.db.owns_service('done'))
+
+    def test_owns_service_segments_unscanned(self):
+        self.db.set_segments([0], 2)
+
+        self.assertFalse(self.db.owns_service(SERVICE))
+        self.services.scan.assert_not_called()
+
     def test_get_service_revisions(self):
         self.services.get_item.return_value = {
             'service_name': SERVICE,
@@ -91,14 +130,48 @@ class TestFlotillaSchedulerDynamo(unittest.TestCase):
         self.assignments.put_item.assert_called_with(data=ANY, overwrite=True)
 
     def test_set_assignments(self):
-        mock_batch = MagicMock(spec=BatchTable)
-        self.assignments.batch_write.return_value = mock_batch
+        assignments = [self.assignment(), self.assignment()]
+
+        conflicts = self.db.set_assignments(assignments)
+
+        self.assertEqual([], conflicts)
+        for assignment in assignments:
+            assignment.partial_save.assert_called_with()
+        self.assignments.batch_write.assert_not_called()
 
-        self.db.set_assignments([
-            {'instance_id': INSTANCE_ID},
-            {'instance_id': INSTANCE_ID}
-        ])
-        mock_batch.put_item.call_count = 2
+    def test_set_assignments_conflict(self):
+        assignment = self.assignment()
+        assignment.partial_save.side_effect = ConditionalCheckFailedException(
+                400, 'Bad Request')
+
+        conflicts = self.db.set_assignments([assignment, self.assignment()])
+
+        self.assertEqual([INSTANCE_ID], conflicts)
+
+    def test_set_assignments_no_expiry(self):
+        # Left to the agent, once it is seen refreshing its assignment:
+        assignment = Item(self.assignments, data={'instance_id': INSTANCE_ID})
+
+        self.db.set_assignments([assignment])
+
+        self.assertNotIn('expires', assignment)
+
+    def test_set_assignments_expires_kept(self):
+        assignment = Item(self.assignments, data={'instance_id': INSTANCE_ID,
+                                                  'expires': 1})
+
+        self.db.set_assignments([assignment])
+
+        self.assertEqual(1, assignment['expires'])
+
+    @staticmethod
+    def assignment():
+        assignment = MagicMock(spec=Item)
+        data = {'instance_id': INSTANCE_ID}
+        assignment.get.side_effect = data.get
+        assignment.__getitem__.side_effect = data.__getitem__
+        assignment.__setitem__.side_effect = data.__setitem__
+        return assignment
 
     def test_get_instance_assignments_empty(self):
         assignments = self.db.get_instance_assignments(SERVICE)
@@ -125,6 +198,193 @@ class TestFlotillaSchedulerDynamo(unittest.TestCase):
         assignments = self.db.get_instance_assignments(SERVICE)
         self.assertEqual(1, len(assignments[None]))
 
+    def test_get_instance_assignments_live(self):
+        self.assignments.batch_get.return_value = [{
+            'instance_id': INSTANCE_ID,
+            'assignment': REVISION
+        }]
+
+        assignments = self.db.get_instance_assignments(SERVICE, [INSTANCE_ID])
+
+        self.assertEqual(1, len(assignments[REVISION]))
+        self.status.query_2.assert_not_called()
+
+    def test_get_live_instances(self):
+        self.status.query_2.return_value = [{
+            'instance_id': INSTANCE_ID,
+            'status_time': time.time()
+        }]
+
+        live_instances = self.db.get_live_instances(SERVICE)
+
+        self.assertEqual([INSTANCE_ID], live_instances)
+        self.assignments.batch_get.assert_not_called()
+
+    def test_get_live_instances_unexpired(self):
+        self.db.get_live_instances(SERVICE)
+
+        kwargs = self.status.query_2.call_args[1]
+        self.assertEqual(['expires__gt', 'expires__null'],
+                         sorted(kwargs['query_filter'].keys()))
+        self.assertEqual('OR', kwargs['conditional_operator'])
+
+    def test_get_standby(self):
+        self.services.get_item.return_value = {'service_name': SERVICE,
+                                               'standby': 2}
+
+        self.db.get_revision_weights(SERVICE)
+
+        self.assertEqual(2, self.db.get_standby(SERVICE))
+        self.assertEqual(0, self.db.get_standby('other'))
+
+    def test_get_instance_zones(self):
+        self.status.query_2.return_value = [{
+            'instance_id': INSTANCE_ID,
+            'status_time': time.time(),
+            'availability_zone': 'us-east-1a'
+        }, {
+            'instance_id': 'i-unknown',
+            'status_time': time.time()
+        }]
+        live_instances = self.db.get_live_instances(SERVICE)
+
+        zones = self.db.get_instance_zones(live_instances)
+
+        self.assertEqual({INSTANCE_ID: 'us-east-1a'}, zones)
+
+    def test_get_instance_health(self):
+        self.status.query_2.return_value = [{
+            'instance_id': INSTANCE_ID,
+            'status_time': time.time(),
+            'failed_units': 1,
+            'deploy_time': 12.5
+        }, {
+            'instance_id': 'i-unknown',
+            'status_time': time.time()
+        }]
+        live_instances = self.db.get_live_instances(SERVICE)
+
+        health = self.db.get_instance_health(live_instances)
+
+        self.assertEqual({INSTANCE_ID: (1, 12.5), 'i-unknown': (0, 0)},
+                         health)
+
+    def test_get_deliveries(self):
+        ramping = {'service_name': SERVICE, 'delivery': {'state': 'ramping'}}
+        self.services.scan.return_value = [
+            ramping,
+            {'service_name': 'done', 'delivery': {'state': 'complete'}},
+            {'service_name': 'other'}
+        ]
+        self.db.get_all_revision_weights()
+        self.services.get_item.return_value = ramping
+        self.services.scan.reset_mock()
+
+        self.assertEqual([ramping], self.db.get_deliveries())
+        self.services.get_item.assert_called_once_with(service_name=SERVICE)
+        self.services.scan.assert_not_called()
+
+    def test_get_delivering(self):
+        self.services.get_item.return_value = {
+            'service_name': SERVICE,
+            'delivery': {'state': 'ramping', 'revision': REVISION}}
+        self.db.get_revision_weights(SERVICE)
+
+        self.assertEqual(REVISION, self.db.get_delivering(SERVICE))
+        self.assertIsNone(self.db.get_delivering('done'))
+
+    def test_get_deliveries_complete(self):
+        self.services.get_item.return_value = {
+            'service_name': SERVICE, 'delivery': {'state': 'ramping'}}
+        self.db.get_revision_weights(SERVICE)
+        self.services.get_item.return_value = {
+            'service_name': SERVICE, 'delivery': {'state': 'complete'}}
+
+        self.assertEqual([], self.db.get_deliveries())
+        self.assertEqual([], self.db.get_deliveries())
+        self.assertEqual(2, self.services.get_item.call_count)
+
+    def test_get_ramping(self):
+        self.services.get_item.return_value = {
+            'service_name': SERVICE,
+            'delivery': {'state': 'ramping', 'revision': REVISION}}
+        self.db.get_revision_weights(SERVICE)
+
+        self.assertEqual({SERVICE: REVISION}, self.db.get_ramping())
+
+    def test_restore_ramping(self):
+        self.services.get_item.return_value = {
+            'service_name': SERVICE,
+            'delivery': {'state': 'ramping', 'revision': REVISION}}
+
+        self.db.restore_ramping({SERVICE: REVISION})
+
+        self.assertEqual(REVISION, self.db.get_delivering(SERVICE))
+        self.assertEqual([self.services.get_item.return_value],
+                         self.db.get_deliveries())
+
+    def test_restore_ramping_complete(self):
+        self.services.get_item.return_value = {
+            'service_name': SERVICE, 'delivery': {'state': 'complete'}}
+
+        self.db.restore_ramping({SERVICE: REVISION})
+
+        self.assertEqual([], self.db.get_deliveries())
+        self.assertIsNone(self.db.get_delivering(SERVICE))
+
+    def test_get_deliveries_not_owned(self):
+        self.services.get_item.return_value = {
+            'service_name': SERVICE, 'delivery': {'state': 'ramping'}}
+        self.db.get_revision_weights(SERVICE)
+        self.db.set_segments([1], 2)
+
+        self.assertEqual([], self.db.get_deliveries())
+        self.assertEqual(1, self.services.get_item.call_count)
+
+    def test_set_delivery_changed(self):
+        service_item = MagicMock(spec=Item)
+        service_item.partial_save.side_effect = \
+            ConditionalCheckFailedException(400, 'changed')
+
+        self.assertFalse(self.db.set_delivery(service_item))
+
+    def test_get_two_phase(self):
+        self.services.get_item.return_value = {'service_name': SERVICE,
+                                               'two_phase': True}
+        self.db.get_revision_weights(SERVICE)
+        self.assertTrue(self.db.get_two_phase(SERVICE))
+
+        self.services.get_item.return_value = {'service_name': SERVICE}
+        self.db.get_revision_weights(SERVICE)
+        self.assertFalse(self.db.get_two_phase(SERVICE))
+
+    def test_get_prepared(self):
+        self.status.query_2.return_value = [{
+            'instance_id': INSTANCE_ID,
+            'status_time': time.time(),
+            'prepared': ['rev1']
+        }]
+        live_instances = self.db.get_live_instances(SERVICE)
+        self.assertEqual({INSTANCE_ID: frozenset(['rev1'])},
+                         self.db.get_prepared(live_instances))
+
+        del self.status.query_2.return_value[0]['prepared']
+        self.db.get_live_instances(SERVICE)
+        self.assertEqual({}, self.db.get_prepared(live_instances))
+
+    def test_get_instance_zones_dead(self):
+        self.status.query_2.return_value = [{
+            'instance_id': INSTANCE_ID,
+            'status_time': time.time(),
+            'availability_zone': 'us-east-1a'
+        }]
+        self.db.get_live_instances(SERVICE)
+        self.status.query_2.return_value[0]['status_time'] = 0
+
+        self.db.get_live_instances(SERVICE)
+
+        self.assertEqual({}, self.db.get_instance_zones([INSTANCE_ID]))
+
     def test_get_instance_assignments_garbage_collection(self):
         self.status.query_2.return_value = [{
             'instance_id': INSTANCE_ID,
@@ -134,8 +394,281 @@ class TestFlotillaSchedulerDynamo(unittest.TestCase):
         assignments = self.db.get_instance_assignments(SERVICE)
 
         self.assertEqual(0, len(assignments))
-        self.status.batch_write.assert_called_with()
-        self.assignments.batch_write.assert_called_with()
+        self.status.batch_write.assert_not_called()
+        self.assertEqual([(SERVICE, INSTANCE_ID)],
+                         self.db.get_dead_instances())
+
+    def test_get_dead_instances_limit(self):
+        self.status.query_2.return_value = [{
+            'instance_id': instance_id,
+            'status_time': 0
+        } for instance_id in ('i-1', 'i-2', 'i-3')]
+        self.db.get_live_instances(SERVICE)
+
+        self.assertEqual([(SERVICE, 'i-1'), (SERVICE, 'i-2')],
+                         self.db.get_dead_instances(2))
+
+    def test_delete_instances(self):
+        self.status.query_2.return_value = [{
+            'instance_id': INSTANCE_ID,
+            'status_time': 0
+        }]
+        self.db.get_live_instances(SERVICE)
+        self.status.delete_item.return_value = True
+        assignment_batch = MagicMock(spec=BatchTable)
+        self.assignments.batch_write.return_value.__enter__.return_value = \
+            assignment_batch
+
+        deleted = self.db.delete_instances([(SERVICE, INSTANCE_ID)])
+
+        self.assertEqual(1, deleted)
+        self.status.delete_item.assert_called_with(
+                expected=ANY, conditional_operator='OR', service=SERVICE,
+                instance_id=INSTANCE_ID)
+        assignment_batch.delete_item.assert_called_with(
+                instance_id=INSTANCE_ID)
+        self.assertEqual([], self.db.get_dead_instances())
+
+    def test_delete_instances_reported(self):
+        self.status.delete_item.return_value = False
+
+        deleted = self.db.delete_instances([(SERVICE, INSTANCE_ID)])
+
+        self.assertEqual(0, deleted)
+        self.assignments.batch_write.assert_not_called()
+
+    def test_delete_instances_empty(self):
+        self.db.delete_instances([])
+
+        self.status.delete_item.assert_not_called()
+
+    def test_dead_instance_live_again(self):
+        self.status.query_2.return_value = [{
+            'instance_id': INSTANCE_ID,
+            'status_time': 0
+        }]
+        self.db.get_live_instances(SERVICE)
+        self.status.query_2.return_value[0]['status_time'] = time.time()
+
+        self.db.get_live_instances(SERVICE)
+
+        self.assertEqual([], self.db.get_dead_instances())
+
+    def test_clear_dead_instances(self):
+        self.status.query_2.return_value = [{
+            'instance_id': INSTANCE_ID,
+            'status_time': 0
+        }]
+        self.db.get_live_instances(SERVICE)
+
+        self.db.clear_dead_instances()
+
+        self.assertEqual([], self.db.get_dead_instances())
+
+    def test_get_packed_services(self):
+        self.services.scan.return_value = [{
+            'service_name': SERVICE,
+            'placement': 'packed',
+            REVISION: 2,
+            REVISION.replace('a', 'b'): 0
+        }]
+
+        packed = self.db.get_packed_services()
+
+        self.assertEqual({SERVICE: {REVISION: 2}}, packed)
+        self.services.scan.assert_called_with(placement__eq='packed')
+
+    def test_get_packed_services_cached(self):
+        self.services.scan.return_value = [{
+            'service_name': SERVICE,
+            'placement': 'packed',
+            REVISION: 2
+        }]
+        self.db.get_packed_services()
+        self.services.get_item.return_value = {
+            'service_name': SERVICE,
+            'placement': 'packed',
+            REVISION: 3
+        }
+        self.db.get_revision_weights(SERVICE)
+
+        packed = self.db.get_packed_services()
+
+        self.assertEqual({SERVICE: {REVISION: 3}}, packed)
+        self.services.scan.assert_called_once_with(placement__eq='packed')
+
+    def test_get_instance_capacity(self):
+        self.status.query_2.return_value = [{
+            'instance_id': INSTANCE_ID,
+            'status_time': time.time(),
+            'cpu': 2000,
+            'memory': 3840
+        }, {
+            'instance_id': 'i-nocapacity',
+            'status_time': time.time()
+        }, {
+            'instance_id': 'i-expired',
+            'status_time': time.time() - (INSTANCE_EXPIRY + 1),
+            'cpu': 2000
+        }]
+        self.db.get_live_instances(SERVICE)
+
+        capacity = self.db.get_instance_capacity()
+
+        self.assertEqual({INSTANCE_ID: (2000, 3840)}, capacity)
+        self.status.scan.assert_not_called()
+
+    def test_get_instance_capacity_gone(self):
+        self.status.query_2.return_value = [{
+            'instance_id': INSTANCE_ID,
+            'status_time': time.time(),
+            'cpu': 2000
+        }]
+        self.db.get_live_instances(SERVICE)
+        self.status.query_2.return_value = []
+        self.db.get_live_instances(SERVICE)
+
+        self.assertEqual({}, self.db.get_instance_capacity())
+
+    def test_get_assignment_items(self):
+        assignment = {'instance_id': INSTANCE_ID, 'assignment': REVISION}
+        self.assignments.batch_get.return_value = [assignment]
+
+        assignments = self.db.get_assignment_items([INSTANCE_ID])
+
+        self.assertEqual({INSTANCE_ID: assignment}, assignments)
+
+    def test_get_assignment_items_empty(self):
+        self.assertEqual({}, self.db.get_assignment_items([]))
+        self.assignments.batch_get.assert_not_called()
+
+    def test_get_revision_requests(self):
+        self.revisions.batch_get.return_value = [
+            {'rev_hash': REVISION, 'cpu': 500},
+        ]
+
+        requests = self.db.get_revision_requests([REVISION])
+
+        self.assertEqual({REVISION: (500, 0)}, requests)
+
+    def test_get_revision_requests_empty(self):
+        self.assertEqual({}, self.db.get_revision_requests(set()))
+        self.revisions.batch_get.assert_not_called()
+
+    def test_set_packed(self):
+        assignment = MagicMock(spec=Item)
+        conflict = MagicMock(spec=Item)
+        conflict.partial_save.side_effect = ConditionalCheckFailedException(
+                400, 'Bad Request')
+
+        stored = self.db.set_packed([assignment, conflict])
+
+        self.assertEqual(1, stored)
+        assignment.partial_save.assert_called_with()
+
+    def test_get_global_rollout(self):
+        rollout = self.db.get_global_rollout()
+
+        self.assertEqual(self.assignments.get_item.return_value, rollout)
+        self.assignments.get_item.assert_called_with(
+                instance_id='global_rollout', consistent=True)
+
+    def test_get_global_rollout_none(self):
+        self.assignments.get_item.side_effect = ItemNotFound()
+
+        self.assertEqual(None, self.db.get_global_rollout())
+
+    def test_set_global_rollout_conflict(self):
+        rollout = MagicMock(spec=Item)
+        rollout.partial_save.side_effect = ConditionalCheckFailedException(
+                400, 'Bad Request')
+
+        self.assertFalse(self.db.set_global_rollout(rollout))
+
+    def test_set_global_assignment(self):
+        self.db.set_global_assignment(3, REVISION)
+
+        self.assignments.put_item.assert_called_with(data={
+            'instance_id': 'global_3',
+            'assignment': REVISION
+        }, overwrite=True)
+
+    def test_get_global_pending(self):
+        unit = 'global-%s.service' % REVISION
+        self.status.scan.return_value = [{
+            'service': SERVICE,
+            'instance_id': 'i-0',
+            'status_time': time.time(),
+            unit: {'active_state': 'active'}
+        }, {
+            'service': SERVICE,
+            'instance_id': 'i-2',
+            'status_time': time.time(),
+            unit: {'active_state': 'activating'}
+        }, {
+            'service': SERVICE,
+            'instance_id': 'i-3',
+            'status_time': time.time()
+        }, {
+            'service': SERVICE,
+            'instance_id': 'i-5',
+            'status_time': time.time() - (INSTANCE_EXPIRY + 1)
+        }]
+
+        pending = self.db.get_global_pending(REVISION, 0, 1)
+
+        self.assertEqual(set(['i-2', 'i-3']), pending)
+
+    def test_get_global_pending_cached(self):
+        unit = 'global-%s.service' % REVISION
+        self.status.scan.return_value = [{
+            'service': SERVICE,
+            'instance_id': 'i-%d' % i,
+            'status_time': time.time()
+        } for i in range(3)]
+        self.db.get_global_pending(REVISION, 0, 1)
+        self.status.batch_get.return_value = [{
+            'service': SERVICE,
+            'instance_id': 'i-0',
+            'status_time': time.time(),
+            unit: {'active_state': 'active'}
+        }, {
+            'service': SERVICE,
+            'instance_id': 'i-1',
+            'status_time': time.time()
+        }, {
+            'service': SERVICE,
+            'instance_id': 'i-2',
+            'status_time': time.time(),
+            EXPIRES: int(time.time()) - 1
+        }]
+
+        pending = self.db.get_global_pending(REVISION, 0, 1)
+
+        self.assertEqual(set(['i-1']), pending)
+        self.assertEqual(1, self.status.scan.call_count)
+        self.assertEqual(3, len(self.status.batch_get.call_args[1]['keys']))
+
+    def test_get_global_pending_next_shard(self):
+        self.status.scan.return_value = []
+        self.db.get_global_pending(REVISION, 0, 2)
+
+        self.assertEqual(set(), self.db.get_global_pending(REVISION, 0, 2))
+        self.db.get_global_pending(REVISION, 1, 2)
+
+        self.assertEqual(2, self.status.scan.call_count)
+        self.status.batch_get.assert_not_called()
+
+    def test_get_global_pending_other_shard(self):
+        self.status.scan.return_value = [{
+            'service': SERVICE,
+            'instance_id': 'i-%d' % i,
+            'status_time': time.time()
+        } for i in range(10)]
+
+        pending = self.db.get_global_pending(REVISION, 1, 2)
+
+        self.assertTrue(0 < len(pending) < 10)
 
     def test_get_stacks_empty(self):
         stacks = self.db.get_stacks()
@@ -155,6 +688,16 @@ class TestFlotillaSchedulerDynamo(unittest.TestCase):
         self.db.set_stacks([])
         self.stacks.batch_write.assert_not_called()
 
+    def test_set_service_outputs(self):
+        service = MagicMock(spec=Item)
+        conflict = MagicMock(spec=Item)
+        conflict.partial_save.side_effect = ConditionalCheckFailedException(
+                400, 'Bad Request')
+
+        self.db.set_service_outputs([conflict, service])
+
+        service.partial_save.assert_called_with()
+
     def test_set_services(self):
         self.db.set_services([{'service_name': 'foo'}])
         self.services.batch_write.assert_called_with()
@@ -170,6 +713,29 @@ class TestFlotillaSchedulerDynamo(unittest.TestCase):
         region_params = self.db.get_region_params('us-east-1')
         self.assertEqual(region_params['az1'], 'us-east-1e')
 
+    def test_get_deploying_instances(self):
+        rev2 = REVISION.replace('a', 'b')
+        self.status.query_2.return_value = [{
+            'instance_id': 'i-running',
+            'test-%s.service' % REVISION: {'active_state': 'active'}
+        }, {
+            'instance_id': 'i-starting',
+            'test-%s.service' % REVISION: {'active_state': 'activating'}
+        }, {
+            'instance_id': 'i-stale',
+            'test-%s.service' % rev2: {'active_state': 'active'}
+        }, {
+            'instance_id': 'i-unassigned'
+        }]
+
+        deploying = self.db.get_deploying_instances(SERVICE, {
+            'i-running': REVISION,
+            'i-starting': REVISION,
+            'i-stale': REVISION
+        })
+
+        self.assertEqual(set(['i-starting', 'i-stale']), deploying)
+
     def test_get_service_status(self):
         self.status.query_2.return_value = [{
             'instance_id': 'i-goodinstance',
@@ -192,3 +758,434 @@ class TestFlotillaSchedulerDynamo(unittest.TestCase):
                                                               REVISION,
                                                               INSTANCE_ID)}
         self.assertEqual(len(status), 2)
+
+
+class TestAssignmentCache(unittest.TestCase):
+    def setUp(self):
+        self.tables = {name: MemoryTable(name, SCHEMAS[name])
+                       for name in ('assignments', 'regions', 'services',
+                                    'stacks', 'status')}
+        self.assignments = self.tables['assignments']
+        self.assignments.put_item(data={
+            'instance_id': INSTANCE_ID,
+            'assignment': REVISION
+        })
+        self.db = self.scheduler_db()
+
+    def scheduler_db(self):
+        return FlotillaSchedulerDynamo(
+                self.tables['assignments'], self.tables['regions'],
+                self.tables['services'], self.tables['stacks'],
+                self.tables['status'])
+
+    def load(self, db, live_instances=(INSTANCE_ID, 'i-new')):
+        self.assignments.reset_capacity()
+        return db.get_instance_assignments(SERVICE, list(live_instances))
+
+    def test_cold(self):
+        assignments = self.load(self.db)
+
+        self.assertEqual([INSTANCE_ID], [a['instance_id']
+                                         for a in assignments[REVISION]])
+        self.assertEqual(['i-new'], [a['instance_id']
+                                     for a in assignments[None]])
+        self.assertEqual(1.5, self.assignments.consumed_read)
+
+    def test_cached(self):
+        self.load(self.db)
+
+        assignments = self.load(self.db)
+
+        self.assertEqual(1, len(assignments[REVISION]))
+        # Only the generation is read:
+        self.assertEqual(1, self.assignments.consumed_read)
+
+    def test_cached_generation_loaded(self):
+        self.load(self.db)
+        generation = self.db.get_generation(SERVICE)
+        self.assignments.reset_capacity()
+
+        self.db.get_instance_assignments(SERVICE, [INSTANCE_ID, 'i-new'],
+                                         generation)
+
+        self.assertEqual(0, self.assignments.consumed_read)
+
+    def test_generation_other_write(self):
+        self.load(self.db)
+        generation = self.db.get_generation(SERVICE)
+        other_db = self.scheduler_db()
+        assignments = self.load(other_db)
+        other_db.set_assignments(assignments[None])
+
+        self.assertNotEqual(generation, self.db.get_generation(SERVICE))
+
+    def test_cached_new_instance(self):
+        self.load(self.db)
+        self.assignments.put_item(data={
+            'instance_id': 'i-newer',
+            'assignment': REVISION
+        })
+
+        assignments = self.load(self.db, (INSTANCE_ID, 'i-new', 'i-newer'))
+
+        self.assertEqual(2, len(assignments[REVISION]))
+        self.assertEqual(1.5, self.assignments.consumed_read)
+
+    def test_cached_own_write(self):
+        assignments = self.load(self.db)
+        new_instance = assignments[None][0]
+        new_instance['assignment'] = REVISION
+        self.db.set_assignments([new_instance])
+
+        assignments = self.load(self.db)
+
+        self.assertEqual(2, len(assignments[REVISION]))
+        self.assertEqual(1, self.assignments.consumed_read)
+
+    def test_cached_copies(self):
+        assignments = self.load(self.db)
+        assignments[REVISION][0]['assignment'] = 'other'
+
+        assignments = self.load(self.db)
+
+        self.assertEqual(1, len(assignments[REVISION]))
+
+    def test_other_write(self):
+        self.load(self.db)
+        other_db = self.scheduler_db()
+        assignments = self.load(other_db)
+        assignments[REVISION][0]['assignment'] = 'other'
+        other_db.set_assignments(assignments[REVISION])
+
+        assignments = self.load(self.db)
+
+        self.assertEqual(1, len(assignments['other']))
+        self.assertEqual(1.5, self.assignments.consumed_read)
+
+    def test_concurrent_write(self):
+        assignments = self.load(self.db)
+        other_db = self.scheduler_db()
+        other_assignments = self.load(other_db)
+        other_assignments[REVISION][0]['assignment'] = 'other'
+        other_db.set_assignments(other_assignments[REVISION])
+        assignments[REVISION][0]['assignment'] = 'another'
+        conflicts = self.db.set_assignments(assignments[REVISION])
+
+        assignments = self.load(self.db)
+
+        self.assertEqual([INSTANCE_ID], conflicts)
+        self.assertEqual(1, len(assignments['other']))
+
+        # Written by both, reloaded:
+        self.assertEqual(1.5, self.assignments.consumed_read)
+
+    def test_unchanged_attributes(self):
+        assignments = self.load(self.db)
+        # Another attribute, changed concurrently:
+        item = self.assignments.get_item(instance_id=INSTANCE_ID)
+        item['packed'] = ['packed1']
+        item.partial_save()
+        assignments[REVISION][0]['assignment'] = 'other'
+
+        conflicts = self.db.set_assignments(assignments[REVISION])
+
+        item = self.assignments.get_item(instance_id=INSTANCE_ID)
+        self.assertEqual([], conflicts)
+        self.assertEqual('other', item['assignment'])
+        self.assertEqual(['packed1'], item['packed'])
+
+    def test_new_instance_conflict(self):
+        assignments = self.load(self.db)
+        self.assignments.put_item(data={
+            'instance_id': 'i-new',
+            'assignment': 'other'
+        })
+        assignments[None][0]['assignment'] = REVISION
+
+        conflicts = self.db.set_assignments(assignments[None])
+
+        self.assertEqual(['i-new'], conflicts)
+        item = self.assignments.get_item(instance_id='i-new')
+        self.assertEqual('other', item['assignment'])
+
+    def test_packed_items_cached(self):
+        self.load(self.db)
+        self.assignments.reset_capacity()
+
+        items = self.db.get_assignment_items([INSTANCE_ID, 'i-new'])
+
+        self.assertEqual([INSTANCE_ID], items.keys())
+        self.assertEqual(REVISION, items[INSTANCE_ID]['assignment'])
+        self.assertEqual(0, self.assignments.consumed_read)
+
+    def test_packed_items_other_write(self):
+        self.load(self.db)
+        other_db = self.scheduler_db()
+        assignment = other_db.get_assignment_items([INSTANCE_ID])[INSTANCE_ID]
+        assignment['packed'] = ['packed1']
+        other_db.set_packed([assignment])
+        assignment = self.db.get_assignment_items([INSTANCE_ID])[INSTANCE_ID]
+        assignment['packed'] = ['packed2']
+
+        self.assertEqual(0, self.db.set_packed([assignment]))
+        # Conflicts are loaded again:
+        assignment = self.db.get_assignment_items([INSTANCE_ID])[INSTANCE_ID]
+        self.assertEqual(['packed1'], assignment['packed'])
+
+    def test_packed(self):
+        self.load(self.db)
+        assignment = self.db.get_assignment_items([INSTANCE_ID])[INSTANCE_ID]
+        assignment['packed'] = ['packed1']
+        self.db.set_packed([assignment])
+
+        assignments = self.load(self.db)
+
+        self.assertEqual(['packed1'], assignments[REVISION][0]['packed'])
+        self.assertEqual(1, self.assignments.consumed_read)
+
+
+class TestServiceSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tables = {name: MemoryTable(name, SCHEMAS[name])
+                       for name in ('assignments', 'regions', 'services',
+                                    'stacks', 'status')}
+        self.services = self.tables['services']
+        self.services.put_item(data={
+            'service_name': SERVICE,
+            'instance_type': 't2.micro',
+            REVISION: 1
+        })
+        self.db = FlotillaSchedulerDynamo(
+                self.tables['assignments'], self.tables['regions'],
+                self.services, self.tables['stacks'], self.tables['status'],
+                snapshot_ttl=60)
+
+    def test_shared(self):
+        self.db.get_all_revision_weights()
+        self.services.reset_capacity()
+
+        services = self.db.services(attributes=('service_name',
+                                                'instance_type'),
+                                    shared=True)
+
+        self.assertEqual(0, self.services.consumed_read)
+        self.assertEqual({'service_name': SERVICE,
+                          'instance_type': 't2.micro'}, dict(services[0]))
+
+    def test_shared_copies(self):
+        self.db.get_all_revision_weights()
+
+        self.db.services(shared=True)[0][REVISION] = 2
+
+        self.assertEqual(1, self.db.services(shared=True)[0][REVISION])
+
+    def test_shared_stale(self):
+        self.db.get_all_revision_weights()
+        self.db._snapshot = (time.time() - 61, self.db._snapshot[1])
+        self.services.reset_capacity()
+
+        self.db.services(shared=True)
+
+        self.assertEqual(0.5, self.services.consumed_read)
+
+    def test_shared_refreshed(self):
+        self.db.get_all_revision_weights()
+        self.db._snapshot = (time.time() - 61, self.db._snapshot[1])
+        self.db.refresh_snapshot()
+        self.services.reset_capacity()
+
+        self.db.services(shared=True)
+
+        self.assertEqual(0, self.services.consumed_read)
+
+    def test_refresh_without_scan(self):
+        self.db.refresh_snapshot()
+
+        self.db.services(shared=True)
+
+        self.assertEqual(0.5, self.services.consumed_read)
+
+    def test_shared_patched(self):
+        self.db.get_all_revision_weights()
+        self.services.put_item(data={
+            'service_name': SERVICE,
+            'instance_type': 't2.small',
+            REVISION: 1
+        }, overwrite=True)
+        self.services.put_item(data={
+            'service_name': 'new-service',
+            REVISION: 1
+        })
+
+        self.db.get_revision_weights(SERVICE)
+        self.db.get_revision_weights('new-service')
+        services = {service['service_name']: service
+                    for service in self.db.services(shared=True)}
+
+        self.assertEqual('t2.small', services[SERVICE]['instance_type'])
+        self.assertIn('new-service', services)
+
+    def test_shared_deleted(self):
+        self.db.get_all_revision_weights()
+        self.services.delete_item(service_name=SERVICE)
+
+        self.db.get_revision_weights(SERVICE)
+
+        self.assertEqual([], self.db.services(shared=True))
+
+    def test_projected_not_shared(self):
+        self.db.services(attributes=('service_name',))
+        self.services.reset_capacity()
+
+        services = self.db.services(shared=True)
+
+        self.assertEqual(0.5, self.services.consumed_read)
+        self.assertEqual(1, services[0][REVISION])
+
+    def test_output_partial(self):
+        self.db.get_all_revision_weights()
+        service = self.db.services(attributes=('service_name', 'cf_outputs'),
+                                   shared=True)[0]
+        service['cf_outputs'] = {'Elb': 'elb'}
+
+        self.db.set_service_outputs([service])
+
+        stored = self.services.get_item(service_name=SERVICE)
+        self.assertEqual({'Elb': 'elb'}, stored['cf_outputs'])
+        self.assertEqual(1, stored[REVISION])
+
+
+class TestReaping(unittest.TestCase):
+    def setUp(self):
+        self.tables = {name: MemoryTable(name, SCHEMAS[name])
+                       for name in ('assignments', 'regions', 'services',
+                                    'stacks', 'status')}
+        self.status = self.tables['status']
+        self.assignments = self.tables['assignments']
+        self.db = FlotillaSchedulerDynamo(
+                self.assignments, self.tables['regions'],
+                self.tables['services'], self.tables['stacks'], self.status)
+        for instance_id in (INSTANCE_ID, 'i-revived'):
+            self.status.put_item(data={
+                'service': SERVICE,
+                'instance_id': instance_id,
+                'status_time': 0
+            })
+            self.assignments.put_item(data={
+                'instance_id': instance_id,
+                'assignment': REVISION
+            })
+        self.db.get_live_instances(SERVICE)
+
+    def test_delete_revived(self):
+        self.status.put_item(data={
+            'service': SERVICE,
+            'instance_id': 'i-revived',
+            'status_time': time.time()
+        }, overwrite=True)
+
+        deleted = self.db.delete_instances(self.db.get_dead_instances())
+
+        self.assertEqual(1, deleted)
+        self.assertFalse(self.status.has_item(service=SERVICE,
+                                              instance_id=INSTANCE_ID))
+        self.assertFalse(self.assignments.has_item(instance_id=INSTANCE_ID))
+        self.assertTrue(self.status.has_item(service=SERVICE,
+                                             instance_id='i-revived'))
+        self.assertTrue(self.assignments.has_item(instance_id='i-revived'))
+
+    def test_delete_gone(self):
+        self.status.delete_item(service=SERVICE, instance_id=INSTANCE_ID)
+
+        self.db.delete_instances(self.db.get_dead_instances())
+
+        self.assertFalse(self.assignments.has_item(instance_id=INSTANCE_ID))
+
+
+class TestExpiry(unittest.TestCase):
+    def setUp(self):
+        self.tables = {name: MemoryTable(name, SCHEMAS[name],
+                                         ttl_attribute='expires')
+                       for name in ('assignments', 'regions', 'services',
+                                    'stacks', 'status')}
+        self.status = self.tables['status']
+        self.db = FlotillaSchedulerDynamo(
+                self.tables['assignments'], self.tables['regions'],
+                self.tables['services'], self.tables['stacks'], self.status)
+
+    def store_status(self, instance_id, expires):
+        self.status.put_item(data={
+            'service': SERVICE,
+            'instance_id': instance_id,
+            'status_time': expires - INSTANCE_EXPIRY,
+            'availability_zone': 'us-east-1a',
+            'expires': expires
+        }, overwrite=True)
+
+    def test_expired_filtered(self):
+        now = int(time.time())
+        self.store_status(INSTANCE_ID, now + INSTANCE_EXPIRY)
+        self.store_status('i-expired', now - 1)
+
+        live_instances = self.db.get_live_instances(SERVICE)
+
+        self.assertEqual([INSTANCE_ID], live_instances)
+        # Left to DynamoDB, not the reaper:
+        self.assertEqual([], self.db.get_dead_instances())
+
+    def test_expired_forgotten(self):
+        now = int(time.time())
+        self.store_status(INSTANCE_ID, now + INSTANCE_EXPIRY)
+        self.db.get_instance_assignments(SERVICE)
+
+        self.store_status(INSTANCE_ID, now - 1)
+        self.status.expire()
+        assignments = self.db.get_instance_assignments(SERVICE)
+
+        self.assertEqual({}, assignments)
+        self.assertEqual({}, self.db.get_instance_zones([INSTANCE_ID]))
+        self.assertEqual({}, self.db._assignment_cache[SERVICE][1])
+
+    def test_set_assignments_not_expired(self):
+        self.db.set_assignments([Item(self.tables['assignments'], data={
+            'instance_id': INSTANCE_ID,
+            'assignment': REVISION
+        })])
+
+        self.assertEqual(0, self.tables['assignments'].expire(
+                now=time.time() + 2 * 3600))
+
+    def test_expired_assignment_reloaded(self):
+        now = int(time.time())
+        self.store_status(INSTANCE_ID, now + INSTANCE_EXPIRY)
+        self.tables['assignments'].put_item(data={
+            'instance_id': INSTANCE_ID,
+            'service': SERVICE,
+            'assignment': REVISION,
+            'expires': now - 1
+        })
+        self.db.get_instance_assignments(SERVICE)
+        self.tables['assignments'].expire()
+
+        self.db.forget_assignments([INSTANCE_ID])
+        assignments = self.db.get_instance_assignments(SERVICE)
+
+        self.assertEqual([INSTANCE_ID], [a['instance_id']
+                                         for a in assignments[None]])
+
+    def test_clear_assignments(self):
+        now = int(time.time())
+        self.store_status(INSTANCE_ID, now + INSTANCE_EXPIRY)
+        self.tables['assignments'].put_item(data={
+            'instance_id': INSTANCE_ID,
+            'service': SERVICE,
+            'assignment': REVISION,
+            'expires': now - 1
+        })
+        self.db.get_instance_assignments(SERVICE)
+        self.tables['assignments'].expire()
+
+        self.db.clear_assignments()
+        assignments = self.db.get_instance_assignments(SERVICE)
+
+        self.assertEqual([], assignments[REVISION])
@@ -0,0 +1,195 @@
+import time
+import unittest
+from decimal import Decimal
+from mock import MagicMock
+from flotilla.scheduler.db import FlotillaSchedulerDynamo
+from flotilla.scheduler.delivery import FlotillaDelivery, step_weights, \
+    DELIVERY_COMPLETE, DELIVERY_RAMPING, DELIVERY_ROLLED_BACK
+from flotilla.scheduler.scheduler import FlotillaScheduler
+
+SERVICE = 'test'
+REVISION = 'a' * 64
+BASELINE = 'b' * 64
+UNIT = 'flotilla-test-%s.service' % REVISION
+
+
+class TestFlotillaDelivery(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = MagicMock(spec=FlotillaScheduler)
+        self.scheduler.active = True
+        self.db = MagicMock(spec=FlotillaSchedulerDynamo)
+        self.db.primary = True
+        self.delivery = {
+            'revision': REVISION,
+            'steps': [10, 50, 100],
+            'bake': 60,
+            'step': 0,
+            'step_time': time.time(),
+            'healthy_since': 0,
+            'baseline': {BASELINE: 2},
+            'state': DELIVERY_RAMPING
+        }
+        self.service_item = {
+            'service_name': SERVICE,
+            'delivery': self.delivery,
+            REVISION: 10,
+            BASELINE: 90
+        }
+        self.db.get_deliveries.return_value = [self.service_item]
+        self.db.get_service_status.return_value = [
+            ('i-1', {UNIT: {'active_state': 'active', 'sub_state': 'running'}})
+        ]
+        self.elb = MagicMock()
+        self.controller = FlotillaDelivery(self.scheduler, self.db, self.elb)
+
+    def test_step_weights(self):
+        weights = step_weights(REVISION, 25, {BASELINE: 2, 'c' * 64: 1})
+
+        self.assertEqual({REVISION: 25, BASELINE: 50, 'c' * 64: 25}, weights)
+
+    def test_step_weights_full(self):
+        weights = step_weights(REVISION, 100, {BASELINE: 2})
+
+        self.assertEqual({REVISION: 100, BASELINE: 0}, weights)
+
+    def test_advance_not_active(self):
+        self.scheduler.active = False
+
+        self.controller.advance()
+
+        self.db.get_deliveries.assert_not_called()
+
+    def test_advance_not_primary(self):
+        # Every scheduler advances the deliveries of services it owns:
+        self.db.primary = False
+
+        self.controller.advance()
+
+        self.db.get_deliveries.assert_called_with()
+
+    def test_advance_start(self):
+        self.delivery['step'] = -1
+        del self.delivery['baseline']
+        self.service_item[BASELINE] = 2
+
+        self.controller.advance()
+
+        self.assertEqual({BASELINE: 2}, self.delivery['baseline'])
+        self.assertEqual(0, self.delivery['step'])
+        self.assertEqual(10, self.service_item[REVISION])
+        self.assertEqual(90, self.service_item[BASELINE])
+        self.db.set_delivery.assert_called_with(self.service_item)
+
+    def test_advance_healthy(self):
+        self.controller.advance()
+
+        self.assertTrue(self.delivery['healthy_since'])
+        self.assertEqual(0, self.delivery['step'])
+
+    def test_advance_baking(self):
+        self.delivery['healthy_since'] = time.time() - 30
+
+        self.controller.advance()
+
+        self.assertEqual(0, self.delivery['step'])
+        self.db.set_delivery.assert_not_called()
+
+    def test_advance_baked(self):
+        self.delivery['healthy_since'] = time.time() - 61
+
+        self.controller.advance()
+
+        self.assertEqual(1, self.delivery['step'])
+        self.assertEqual(50, self.service_item[REVISION])
+        self.assertEqual(50, self.service_item[BASELINE])
+        self.assertEqual(0, self.delivery['healthy_since'])
+
+    def test_advance_baked_loaded(self):
+        self.delivery['step'] = Decimal(0)
+        self.delivery['bake'] = Decimal(60)
+        self.delivery['healthy_since'] = Decimal(int(time.time()) - 61)
+        self.delivery['baseline'] = {BASELINE: Decimal(2)}
+
+        self.controller.advance()
+
+        self.assertEqual(1, self.delivery['step'])
+        self.assertEqual(50, self.service_item[BASELINE])
+
+    def test_advance_complete(self):
+        self.delivery['step'] = 2
+        self.delivery['healthy_since'] = time.time() - 61
+
+        self.controller.advance()
+
+        self.assertEqual(DELIVERY_COMPLETE, self.delivery['state'])
+
+    def test_advance_pending(self):
+        self.delivery['healthy_since'] = time.time() - 30
+        self.db.get_service_status.return_value = [
+            ('i-1', {UNIT: {'active_state': 'activating',
+                            'sub_state': 'start-pre'}})
+        ]
+
+        self.controller.advance()
+
+        self.assertEqual(0, self.delivery['healthy_since'])
+        self.assertEqual(DELIVERY_RAMPING, self.delivery['state'])
+
+    def test_advance_pending_timeout(self):
+        self.delivery['step_time'] = time.time() - 181
+        self.db.get_service_status.return_value = []
+
+        self.controller.advance()
+
+        self.assertEqual(DELIVERY_ROLLED_BACK, self.delivery['state'])
+
+    def test_advance_failed_unit(self):
+        self.db.get_service_status.return_value = [
+            ('i-1', {UNIT: {'active_state': 'activating',
+                            'sub_state': 'auto-restart'}})
+        ]
+
+        self.controller.advance()
+
+        self.assertEqual(DELIVERY_ROLLED_BACK, self.delivery['state'])
+        self.assertEqual(-10, self.service_item[REVISION])
+        self.assertEqual(2, self.service_item[BASELINE])
+
+    def test_advance_disabled(self):
+        self.service_item[REVISION] = -10
+
+        self.controller.advance()
+
+        self.assertEqual(DELIVERY_ROLLED_BACK, self.delivery['state'])
+        self.db.get_service_status.assert_not_called()
+
+    def test_advance_elb_out_of_service(self):
+        self.service_item['cf_outputs'] = {'Elb': 'test-elb'}
+        self.elb.describe_instance_health.return_value = {
+            'InstanceStates': [{'InstanceId': 'i-1',
+                                'State': 'OutOfService'}]
+        }
+
+        self.controller.advance()
+
+        self.elb.describe_instance_health.assert_called_with(
+                LoadBalancerName='test-elb', Instances=[{'InstanceId': 'i-1'}])
+        self.assertFalse(self.delivery['healthy_since'])
+
+    def test_advance_elb_in_service(self):
+        self.service_item['cf_outputs'] = {'Elb': 'test-elb'}
+        self.elb.describe_instance_health.return_value = {
+            'InstanceStates': [{'InstanceId': 'i-1', 'State': 'InService'}]
+        }
+
+        self.controller.advance()
+
+        self.assertTrue(self.delivery['healthy_since'])
+
+    def test_advance_error_isolated(self):
+        broken = {'service_name': 'broken', 'delivery': {}}
+        self.db.get_deliveries.return_value = [broken, self.service_item]
+
+        self.controller.advance()
+
+        self.assertTrue(self.delivery['healthy_since'])
@@ -1,10 +1,11 @@
 import unittest
-from mock import MagicMock
+from mock import MagicMock, patch
 import json
 
 from flotilla.scheduler.doctor import ServiceDoctor
 from flotilla.scheduler.messaging import FlotillaSchedulerMessaging, \
     MESSAGE_RESCHEDULE, MESSAGE_SERVICE_FAILURE
+from flotilla.scheduler.rollout import FlotillaGlobalRollout
 
 from flotilla.scheduler.scheduler import FlotillaScheduler
 
@@ -17,6 +18,7 @@ class TestFlotillaSchedulerMessaging(unittest.TestCase):
         self.message = MagicMock()
         self.queue.receive_messages.return_value = [self.message]
         self.scheduler = MagicMock(spec=FlotillaScheduler)
+        self.scheduler.active = True
         self.doctor = MagicMock(spec=ServiceDoctor)
 
         self.messaging = FlotillaSchedulerMessaging(self.queue, self.scheduler,
@@ -29,6 +31,15 @@ class TestFlotillaSchedulerMessaging(unittest.TestCase):
 
         self.message.delete.assert_not_called()
 
+    @patch('time.sleep')
+    def test_receive_not_active(self, sleep):
+        self.scheduler.active = False
+
+        self.messaging.receive()
+
+        self.queue.receive_messages.assert_not_called()
+        sleep.assert_called_with(1)
+
     def test_receive_invalid(self):
         self.message.body = 'not_json'
 
@@ -47,6 +58,17 @@ class TestFlotillaSchedulerMessaging(unittest.TestCase):
         self.scheduler.schedule_service.assert_called_with(SERVICE)
         self.message.delete.assert_called_with()
 
+    def test_receive_service_reschedule_not_owned(self):
+        self.scheduler.schedule_service.return_value = False
+        self.message.body = json.dumps({
+            'type': MESSAGE_RESCHEDULE,
+            'service': SERVICE
+        })
+
+        self.messaging.receive()
+
+        self.message.delete.assert_called_with()
+
     def test_receive_service_did_not_start(self):
         self.message.body = json.dumps({
             'type': MESSAGE_SERVICE_FAILURE,
@@ -61,6 +83,21 @@ class TestFlotillaSchedulerMessaging(unittest.TestCase):
         self.doctor.failed_revision(SERVICE, 'abcdef', 'i-123456')
         self.message.delete.assert_called_with()
 
+    def test_receive_service_did_not_start_rollout(self):
+        rollout = MagicMock(spec=FlotillaGlobalRollout)
+        self.messaging = FlotillaSchedulerMessaging(self.queue, self.scheduler,
+                                                    self.doctor, rollout)
+        self.message.body = json.dumps({
+            'type': MESSAGE_SERVICE_FAILURE,
+            'service': SERVICE,
+            'revision': 'abcdef',
+            'instance': 'i-123456',
+        })
+
+        self.messaging.receive()
+
+        rollout.failed_revision.assert_called_with('abcdef', 'i-123456')
+
     def test_receive_unknown_type(self):
         self.message.body = json.dumps({
             'type': 'NotImplemented'
@@ -0,0 +1,177 @@
+import unittest
+from mock import MagicMock
+from boto.dynamodb2.items import Item
+from boto.dynamodb2.table import Table
+from flotilla.scheduler.db import FlotillaSchedulerDynamo
+from flotilla.scheduler.packer import FlotillaPacker, pack
+from flotilla.scheduler.scheduler import FlotillaScheduler
+
+REVISION = 'rev1'
+REVISION2 = 'rev2'
+PACKED = 'packed1'
+PACKED2 = 'packed2'
+
+
+class TestPack(unittest.TestCase):
+    def test_pack_first_fit(self):
+        hosts = {'i-1': (1000, 1024), 'i-2': (1000, 1024)}
+
+        packed, unplaced = pack(hosts, {PACKED: 1, PACKED2: 1},
+                                {PACKED: (500, 512), PACKED2: (500, 512)})
+
+        self.assertEqual(0, unplaced)
+        self.assertEqual(set([PACKED, PACKED2]), packed['i-1'])
+
+    def test_pack_decreasing(self):
+        hosts = {'i-1': (1000, 1024), 'i-2': (600, 1024)}
+
+        packed, unplaced = pack(hosts, {PACKED: 1, PACKED2: 1},
+                                {PACKED: (400, 0), PACKED2: (900, 0)})
+
+        # The largest replica is placed first, the smaller one still fits:
+        self.assertEqual(0, unplaced)
+        self.assertEqual(set([PACKED2]), packed['i-1'])
+        self.assertEqual(set([PACKED]), packed['i-2'])
+
+    def test_pack_spread_replicas(self):
+        hosts = {'i-1': (1000, 1024), 'i-2': (1000, 1024)}
+
+        packed, unplaced = pack(hosts, {PACKED: 3}, {PACKED: (100, 100)})
+
+        self.assertEqual(1, unplaced)
+        self.assertEqual(set([PACKED]), packed['i-1'])
+        self.assertEqual(set([PACKED]), packed['i-2'])
+
+    def test_pack_unplaced(self):
+        packed, unplaced = pack({'i-1': (100, 100)}, {PACKED: 1},
+                                {PACKED: (200, 0)})
+
+        self.assertEqual(1, unplaced)
+        self.assertFalse(packed['i-1'])
+
+    def test_pack_no_request(self):
+        packed, unplaced = pack({'i-1': (0, 0)}, {PACKED: 1}, {})
+
+        self.assertEqual(0, unplaced)
+        self.assertEqual(set([PACKED]), packed['i-1'])
+
+    def test_pack_keeps_current(self):
+        hosts = {'i-1': (1000, 1024), 'i-2': (1000, 1024)}
+
+        packed, _ = pack(hosts, {PACKED: 1}, {PACKED: (100, 100)},
+                         {'i-2': set([PACKED])})
+
+        self.assertFalse(packed['i-1'])
+        self.assertEqual(set([PACKED]), packed['i-2'])
+
+    def test_pack_current_removed(self):
+        hosts = {'i-1': (1000, 1024)}
+
+        packed, _ = pack(hosts, {}, {}, {'i-1': set([PACKED]),
+                                         'i-gone': set([PACKED])})
+
+        self.assertFalse(packed['i-1'])
+
+    def test_pack_current_no_longer_fits(self):
+        hosts = {'i-1': (100, 1024), 'i-2': (1000, 1024)}
+
+        packed, _ = pack(hosts, {PACKED: 1}, {PACKED: (500, 0)},
+                         {'i-1': set([PACKED])})
+
+        self.assertFalse(packed['i-1'])
+        self.assertEqual(set([PACKED]), packed['i-2'])
+
+
+class TestFlotillaPacker(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = MagicMock(spec=FlotillaScheduler)
+        self.scheduler.active = True
+        self.db = MagicMock(spec=FlotillaSchedulerDynamo)
+        self.db.primary = True
+        self.db.get_packed_services.return_value = {
+            'packed-service': {PACKED: 1}}
+        self.db.get_instance_capacity.return_value = {'i-1': (1000, 1024)}
+        assignments = MagicMock(spec=Table)
+        assignments._dynamizer = MagicMock()
+        self.assignment = Item(assignments, data={
+            'instance_id': 'i-1', 'assignment': REVISION}, loaded=True)
+        self.db.get_assignment_items.return_value = {'i-1': self.assignment}
+        self.db.get_revision_requests.return_value = {
+            REVISION: (500, 512), PACKED: (500, 512)}
+        self.packer = FlotillaPacker(self.scheduler, self.db)
+
+    def test_pack_not_active(self):
+        self.scheduler.active = False
+
+        self.packer.pack()
+
+        self.db.get_packed_services.assert_not_called()
+
+    def test_pack_not_primary(self):
+        self.db.primary = False
+
+        self.packer.pack()
+
+        self.db.get_packed_services.assert_not_called()
+
+    def test_pack_no_packed_services(self):
+        self.db.get_packed_services.return_value = {}
+
+        self.packer.pack()
+
+        self.db.get_instance_capacity.assert_not_called()
+
+    def test_pack(self):
+        self.packer.pack()
+
+        self.db.get_revision_requests.assert_called_with(
+            set([REVISION, PACKED]))
+        self.db.set_packed.assert_called_with([self.assignment])
+        self.assertEqual([PACKED], self.assignment['packed'])
+        self.assertEqual(1, self.packer.stats['packed'])
+
+    def test_pack_host_full(self):
+        self.db.get_revision_requests.return_value = {
+            REVISION: (800, 512), PACKED: (500, 512)}
+
+        self.packer.pack()
+
+        self.db.set_packed.assert_not_called()
+        self.assertEqual(1, self.packer.stats['unplaced'])
+
+    def test_pack_unchanged(self):
+        self.assignment['packed'] = [PACKED]
+
+        self.packer.pack()
+
+        self.db.set_packed.assert_not_called()
+
+    def test_pack_removed(self):
+        self.assignment['packed'] = [PACKED2]
+
+        self.packer.pack()
+
+        self.db.set_packed.assert_called_with([self.assignment])
+        self.assertEqual([PACKED], self.assignment['packed'])
+
+    def test_pack_staged(self):
+        self.assignment['staged'] = True
+        self.assignment['packed'] = [PACKED]
+
+        self.packer.pack()
+
+        self.db.set_packed.assert_called_with([self.assignment])
+        self.assertNotIn('packed', self.assignment)
+        self.assertEqual(1, self.packer.stats['unplaced'])
+
+    def test_pack_cleared(self):
+        self.db.get_packed_services.return_value = {
+            'packed-service': {PACKED2: 1}}
+        self.db.get_revision_requests.return_value = {
+            REVISION: (500, 512), PACKED2: (800, 512)}
+        self.assignment['packed'] = [PACKED]
+
+        self.packer.pack()
+
+        self.db.set_packed.assert_called_with([self.assignment])
+        self.assertNotIn('packed', self.assignment)
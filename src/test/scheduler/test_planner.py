@@ -0,0 +1,435 @@
+import unittest
+from collections import defaultdict
+from flotilla.scheduler.planner import AssignmentPlanner, health_rank, \
+    hold_targets, rendezvous, rollout_limit, spread
+
+SERVICE = 'test'
+REVISION = 'rev1'
+REVISION2 = 'rev2'
+REVISION3 = 'rev3'
+
+
+class TestAssignmentPlanner(unittest.TestCase):
+    def setUp(self):
+        self.planner = AssignmentPlanner()
+        self.assignments = defaultdict(list)
+
+    def test_rendezvous_stable(self):
+        self.assertEqual(rendezvous('i-1', REVISION),
+                         rendezvous('i-1', REVISION))
+        self.assertNotEqual(rendezvous('i-1', REVISION),
+                            rendezvous('i-1', REVISION2))
+
+    def test_plan_unassigned(self):
+        self.add_instances(None, 3)
+
+        plan = self.planner.plan(SERVICE, self.assignments, {REVISION: 3})
+
+        self.assertEqual(3, len(plan.reassigned))
+        self.assertEqual(0, plan.churn)
+        for assignment in plan.reassigned:
+            self.assertEqual(REVISION, assignment['assignment'])
+            self.assertEqual(SERVICE, assignment['service'])
+
+    def test_plan_balanced(self):
+        self.add_instances(REVISION, 2)
+        self.add_instances(REVISION2, 2)
+
+        plan = self.planner.plan(SERVICE, self.assignments,
+                                 {REVISION: 2, REVISION2: 2})
+
+        self.assertEqual(0, len(plan.reassigned))
+
+    def test_plan_minimal(self):
+        self.add_instances(REVISION, 10)
+
+        plan = self.planner.plan(SERVICE, self.assignments,
+                                 {REVISION: 7, REVISION2: 3})
+
+        self.assertEqual(3, len(plan.reassigned))
+        self.assertEqual(3, plan.churn)
+
+    def test_plan_removed_revision(self):
+        self.add_instances(REVISION, 2)
+
+        plan = self.planner.plan(SERVICE, self.assignments, {REVISION2: 2})
+
+        self.assertEqual(2, plan.churn)
+        self.assertEqual([('i-%s-0' % REVISION, REVISION, REVISION2),
+                          ('i-%s-1' % REVISION, REVISION, REVISION2)],
+                         sorted(plan.moves))
+
+    def test_plan_stable(self):
+        self.add_instances(REVISION, 10)
+        plan = self.planner.plan(SERVICE, self.assignments,
+                                 {REVISION: 9, REVISION2: 1})
+        moved = plan.moves[0][0]
+
+        # Weight flaps back and forth, the same instance moves:
+        reassigned = self.reassign(plan)
+        plan = self.planner.plan(SERVICE, reassigned, {REVISION: 10})
+        reassigned = self.reassign(plan)
+        plan = self.planner.plan(SERVICE, reassigned,
+                                 {REVISION: 9, REVISION2: 1})
+        self.assertEqual([(moved, REVISION, REVISION2)], plan.moves)
+
+    def test_plan_deterministic(self):
+        self.add_instances(REVISION, 10)
+        first = self.planner.plan(SERVICE, self.assignments,
+                                  {REVISION: 5, REVISION2: 5})
+        self.assignments = defaultdict(list)
+        self.add_instances(REVISION, 10)
+        self.assignments[REVISION].reverse()
+
+        second = self.planner.plan(SERVICE, self.assignments,
+                                   {REVISION: 5, REVISION2: 5})
+
+        self.assertEqual(sorted(first.moves), sorted(second.moves))
+
+    def add_staged(self, rev, count):
+        for i in range(count):
+            self.assignments[rev].append({
+                'instance_id': 'i-%s-staged-%d' % (rev, i),
+                'assignment': rev,
+                'staged': True
+            })
+
+    def add_instances(self, rev, count):
+        for i in range(count):
+            self.assignments[rev].append({
+                'instance_id': 'i-%s-%d' % (rev, i),
+                'assignment': rev
+            })
+
+    def all_assignments(self):
+        return [a for assignments in self.assignments.values()
+                for a in assignments]
+
+    def reassign(self, plan):
+        moved = set(m[0] for m in plan.moves)
+        reassigned = defaultdict(list)
+        for rev, assignments in self.assignments.items():
+            for assignment in assignments:
+                if assignment['instance_id'] not in moved:
+                    reassigned[rev].append(assignment)
+        for assignment in plan.reassigned:
+            reassigned[assignment['assignment']].append(assignment)
+        self.assignments = reassigned
+        return reassigned
+
+    def test_plan_limit(self):
+        self.add_instances(REVISION, 4)
+        self.add_instances(None, 1)
+        plan = self.planner.plan(SERVICE, self.assignments, {REVISION2: 5})
+
+        deferred = plan.limit(2)
+
+        self.assertEqual(2, deferred)
+        self.assertEqual(3, len(plan.reassigned))
+        self.assertEqual(2, plan.churn)
+        for move in plan.deferred:
+            self.assertEqual(REVISION, move[1])
+        kept = set(a['instance_id'] for a in plan.reassigned)
+        for assignments in self.assignments.values():
+            for assignment in assignments:
+                if assignment['instance_id'] not in kept:
+                    self.assertEqual(REVISION, assignment['assignment'])
+
+    def test_plan_limit_unavailable_free(self):
+        self.add_instances(REVISION, 2)
+        plan = self.planner.plan(SERVICE, self.assignments, {REVISION2: 2})
+
+        deferred = plan.limit(0, unavailable=['i-%s-0' % REVISION])
+
+        self.assertEqual(1, deferred)
+        self.assertEqual(1, len(plan.reassigned))
+
+    def test_plan_prepare(self):
+        self.add_instances(REVISION, 2)
+        self.add_instances(None, 1)
+        plan = self.planner.plan(SERVICE, self.assignments, {REVISION2: 3})
+
+        preparing = plan.prepare(self.all_assignments(), {})
+
+        # The unassigned instance moves, serving instances prepare:
+        self.assertEqual(2, preparing)
+        self.assertEqual(0, plan.churn)
+        self.assertEqual(['i-None-0'], [m[0] for m in plan.moves])
+        self.assertEqual(2, len(plan.prepared))
+        for assignment in plan.prepared:
+            self.assertEqual(REVISION, assignment['assignment'])
+            self.assertEqual(REVISION2, assignment['prepared'])
+
+    def test_plan_prepare_unchanged(self):
+        self.add_instances(REVISION, 1)
+        self.assignments[REVISION][0]['prepared'] = REVISION2
+        plan = self.planner.plan(SERVICE, self.assignments, {REVISION2: 1})
+
+        preparing = plan.prepare(self.all_assignments(), {})
+
+        self.assertEqual(1, preparing)
+        self.assertEqual([], plan.prepared)
+        self.assertEqual([], plan.reassigned)
+
+    def test_plan_prepare_acknowledged(self):
+        self.add_instances(REVISION, 1)
+        assignment = self.assignments[REVISION][0]
+        assignment['prepared'] = REVISION2
+        plan = self.planner.plan(SERVICE, self.assignments, {REVISION2: 1})
+
+        preparing = plan.prepare(self.all_assignments(),
+                                 {assignment['instance_id']: set([REVISION2])})
+
+        self.assertEqual(0, preparing)
+        self.assertEqual(1, plan.churn)
+        self.assertEqual([assignment], plan.reassigned)
+        self.assertEqual(REVISION2, assignment['assignment'])
+        self.assertNotIn('prepared', assignment)
+
+    def test_plan_prepare_cleared(self):
+        self.add_instances(REVISION, 1)
+        assignment = self.assignments[REVISION][0]
+        assignment['prepared'] = REVISION2
+        plan = self.planner.plan(SERVICE, self.assignments, {REVISION: 1})
+
+        plan.prepare(self.all_assignments(), {})
+
+        self.assertEqual([assignment], plan.prepared)
+        self.assertNotIn('prepared', assignment)
+
+    def test_plan_zones_spread(self):
+        self.add_instances(None, 6)
+        zones = {'i-None-%d' % i: 'zone-%d' % (i % 3) for i in range(6)}
+
+        plan = self.planner.plan(SERVICE, self.assignments,
+                                 {REVISION: 3, REVISION2: 3}, zones)
+
+        self.assertEqual({'zone-0': 1, 'zone-1': 1, 'zone-2': 1},
+                         plan.zones[REVISION])
+        self.assertEqual({'zone-0': 1, 'zone-1': 1, 'zone-2': 1},
+                         plan.zones[REVISION2])
+
+    def test_plan_zones_release(self):
+        self.add_instances(REVISION, 4)
+        zones = {'i-%s-%d' % (REVISION, i): 'zone-%d' % min(i, 1)
+                 for i in range(4)}
+
+        plan = self.planner.plan(SERVICE, self.assignments,
+                                 {REVISION: 2, REVISION2: 2}, zones)
+
+        # Released from the crowded zone, spread for the new revision:
+        self.assertEqual({'zone-0': 1, 'zone-1': 1}, plan.zones[REVISION])
+        self.assertEqual({'zone-1': 2}, plan.zones[REVISION2])
+
+    def test_plan_zones_unknown(self):
+        self.add_instances(None, 2)
+
+        plan = self.planner.plan(SERVICE, self.assignments, {REVISION: 2})
+
+        self.assertEqual({}, plan.zones)
+
+    def test_plan_standby_fill(self):
+        self.add_instances(None, 4)
+
+        plan = self.planner.plan(SERVICE, self.assignments,
+                                 {REVISION: 1, REVISION2: 2}, standby=1)
+
+        staged = [a for a in plan.reassigned if a.get('staged')]
+        self.assertEqual(1, len(staged))
+        self.assertEqual(REVISION2, staged[0]['assignment'])
+        self.assertEqual(1, plan.staged)
+
+    def test_plan_standby_promote(self):
+        self.add_instances(REVISION, 1)
+        self.add_staged(REVISION, 2)
+
+        plan = self.planner.plan(SERVICE, self.assignments, {REVISION: 2},
+                                 standby=1)
+
+        self.assertEqual(1, plan.promoted)
+        self.assertEqual(0, plan.churn)
+        self.assertEqual(1, len(plan.reassigned))
+        self.assertNotIn('staged', plan.reassigned[0])
+        self.assertEqual(REVISION, plan.reassigned[0]['assignment'])
+
+    def test_plan_standby_promote_before_unassigned(self):
+        self.add_staged(REVISION, 1)
+        self.add_instances(None, 1)
+
+        plan = self.planner.plan(SERVICE, self.assignments, {REVISION: 1},
+                                 standby=1)
+
+        # The staged instance serves, the new instance is staged:
+        self.assertEqual(1, plan.promoted)
+        self.assertEqual(1, plan.staged)
+        self.assertTrue(self.assignments[None][0]['staged'])
+
+    def test_plan_standby_restage(self):
+        self.add_instances(REVISION2, 1)
+        self.add_staged(REVISION, 1)
+
+        plan = self.planner.plan(SERVICE, self.assignments, {REVISION2: 1},
+                                 standby=1)
+
+        staged = self.assignments[REVISION][0]
+        self.assertEqual(REVISION2, staged['assignment'])
+        self.assertTrue(staged['staged'])
+        self.assertEqual(0, plan.promoted)
+
+    def test_plan_standby_removed(self):
+        self.add_instances(REVISION, 1)
+        self.add_staged(REVISION, 1)
+
+        plan = self.planner.plan(SERVICE, self.assignments, {REVISION: 2})
+
+        self.assertEqual(1, plan.promoted)
+
+    def test_plan_limit_standby_free(self):
+        self.add_staged(REVISION, 1)
+        plan = self.planner.plan(SERVICE, self.assignments, {REVISION2: 1})
+
+        self.assertEqual(0, plan.limit(0))
+        self.assertEqual(1, len(plan.reassigned))
+
+    def test_plan_limit_deferred_standby(self):
+        self.add_instances(REVISION, 2)
+        plan = self.planner.plan(SERVICE, self.assignments, {REVISION: 1},
+                                 standby=1)
+
+        plan.limit(0)
+
+        # Deferred instances keep serving:
+        for assignment in self.assignments[REVISION]:
+            self.assertEqual(REVISION, assignment['assignment'])
+            self.assertNotIn('staged', assignment)
+
+    def test_spread_without_zones(self):
+        self.add_instances(None, 5)
+        candidates = self.assignments[None]
+
+        picked = spread(candidates, 2, REVISION, lambda a: None, {None: 0})
+
+        # Without zones, the top rendezvous ranked instances:
+        ranked = sorted(candidates, reverse=True,
+                        key=lambda a: rendezvous(a['instance_id'], REVISION))
+        self.assertEqual(ranked[:2], picked)
+
+    def test_spread_rank(self):
+        self.add_instances(None, 5)
+        candidates = self.assignments[None]
+        worst = spread(candidates, 1, REVISION, lambda a: None, {None: 0})[0]
+
+        picked = spread(candidates, 4, REVISION, lambda a: None, {None: 0},
+                        rank=lambda a: a is worst)
+
+        self.assertNotIn(worst, picked)
+
+    def test_health_rank(self):
+        self.assertLess(health_rank((0, 50)), health_rank((1, 0)))
+        self.assertLess(health_rank((0, 5)), health_rank((0, 50)))
+        self.assertEqual(health_rank((0, 1)), health_rank((0, 9)))
+
+    def test_plan_health(self):
+        self.add_instances(None, 3)
+        health = {'i-None-0': (2, 0), 'i-None-1': (0, 120)}
+
+        plan = self.planner.plan(SERVICE, self.assignments, {REVISION: 1},
+                                 health=health)
+
+        # Healthy and never deployed beats slow, slow beats failing:
+        self.assertEqual(['i-None-2'], [m[0] for m in plan.moves])
+
+        plan = self.planner.plan(SERVICE, self.assignments, {REVISION: 2},
+                                 health=health)
+        self.assertEqual(set(['i-None-1', 'i-None-2']),
+                         set(m[0] for m in plan.moves))
+
+    def test_hold_targets_within_band(self):
+        held, avoided = hold_targets({REVISION: 4, REVISION2: 3},
+                                     {REVISION: 3, REVISION2: 4},
+                                     {REVISION: 1, REVISION2: 1}, 1)
+
+        self.assertEqual({REVISION: 3, REVISION2: 4}, held)
+        self.assertEqual(1, avoided)
+
+    def test_hold_targets_outside_band(self):
+        held, avoided = hold_targets({REVISION: 5, REVISION2: 5},
+                                     {REVISION: 2, REVISION2: 8},
+                                     {REVISION: 1, REVISION2: 1}, 1)
+
+        self.assertEqual({REVISION: 5, REVISION2: 5}, held)
+        self.assertEqual(0, avoided)
+
+    def test_hold_targets_skewed(self):
+        # Exact shares are 3 and 1, holding 2/2 would double REVISION2:
+        held, avoided = hold_targets({REVISION: 3, REVISION2: 1},
+                                     {REVISION: 2, REVISION2: 2},
+                                     {REVISION: 3, REVISION2: 1}, 2)
+
+        self.assertEqual({REVISION: 3, REVISION2: 1}, held)
+        self.assertEqual(0, avoided)
+
+    def test_hold_targets_wide_band(self):
+        # Exact shares are 5 and 5, both counts are within 2:
+        held, avoided = hold_targets({REVISION: 5, REVISION2: 5},
+                                     {REVISION: 3, REVISION2: 7},
+                                     {REVISION: 1, REVISION2: 1}, 2)
+
+        self.assertEqual({REVISION: 3, REVISION2: 7}, held)
+        self.assertEqual(2, avoided)
+
+    def test_hold_targets_narrow_band(self):
+        held, avoided = hold_targets({REVISION: 5, REVISION2: 5},
+                                     {REVISION: 3, REVISION2: 7},
+                                     {REVISION: 1, REVISION2: 1}, 1)
+
+        self.assertEqual({REVISION: 5, REVISION2: 5}, held)
+        self.assertEqual(0, avoided)
+
+    def test_hold_targets_no_tolerance(self):
+        held, avoided = hold_targets({REVISION: 4, REVISION2: 3},
+                                     {REVISION: 3, REVISION2: 4},
+                                     {REVISION: 1, REVISION2: 1}, 0)
+
+        self.assertEqual({REVISION: 4, REVISION2: 3}, held)
+        self.assertEqual(0, avoided)
+
+    def test_hold_targets_new_instance(self):
+        # An instance joins: it fills the furthest revision, nothing moves.
+        held, avoided = hold_targets({REVISION: 4, REVISION2: 4},
+                                     {REVISION: 4, REVISION2: 3},
+                                     {REVISION: 1, REVISION2: 1}, 1)
+
+        self.assertEqual({REVISION: 4, REVISION2: 4}, held)
+        self.assertEqual(0, avoided)
+
+    def test_hold_targets_lost_instance(self):
+        held, _ = hold_targets({REVISION: 3, REVISION2: 3, REVISION3: 1},
+                               {REVISION: 3, REVISION2: 4, REVISION3: 1},
+                               {REVISION: 3, REVISION2: 3, REVISION3: 1}, 1)
+
+        self.assertEqual({REVISION: 3, REVISION2: 3, REVISION3: 1}, held)
+
+    def test_hold_targets_new_revision(self):
+        held, _ = hold_targets({REVISION: 3, REVISION2: 1},
+                               {REVISION: 4},
+                               {REVISION: 3, REVISION2: 1}, 1)
+
+        self.assertEqual({REVISION: 3, REVISION2: 1}, held)
+
+    def test_hold_targets_unweighted(self):
+        held, _ = hold_targets({REVISION: 4, REVISION2: 0},
+                               {REVISION: 3, REVISION2: 1},
+                               {REVISION: 1, REVISION2: 0}, 1)
+
+        self.assertEqual({REVISION: 4, REVISION2: 0}, held)
+
+    def test_rollout_limit(self):
+        self.assertEqual(None, rollout_limit(None, 10))
+        self.assertEqual(2, rollout_limit(2, 10))
+        self.assertEqual(3, rollout_limit('3', 10))
+        self.assertEqual(2, rollout_limit('25%', 10))
+        self.assertEqual(1, rollout_limit('10%', 5))
+
+    def test_rollout_limit_invalid(self):
+        self.assertRaises(ValueError, rollout_limit, 'many', 10)
@@ -2,7 +2,8 @@ import unittest
 from mock import MagicMock, ANY
 from flotilla.scheduler.cloudformation import FlotillaCloudFormation
 from flotilla.scheduler.db import FlotillaSchedulerDynamo
-from flotilla.scheduler.provisioner import FlotillaProvisioner
+from flotilla.scheduler.provisioner import FlotillaProvisioner, \
+    STACK_ATTRIBUTES
 from flotilla.scheduler.scheduler import FlotillaScheduler
 
 ENVIRONMENT = 'test'
@@ -65,6 +66,33 @@ class TestFlotillaProvisioner(unittest.TestCase):
                                                        ANY, ANY)
         self.db.set_stacks.assert_called_with(ANY)
 
+    def test_provision_service_outputs(self):
+        self.mock_service()
+        self.db.get_stacks.return_value = [
+            {'region': REGION,
+             'outputs': {'VpcId': 'vpc-123456'}}
+        ]
+        self.cloudformation.service.return_value = {
+            'service': SERVICE,
+            'outputs': {'Elb': 'elb-123456'}
+        }
+
+        self.provisioner.provision()
+
+        self.db.services.assert_called_with(attributes=STACK_ATTRIBUTES,
+                                            shared=True)
+        self.assertEqual({'Elb': 'elb-123456'}, self.service['cf_outputs'])
+        self.db.set_service_outputs.assert_called_with([self.service])
+
+    def test_provision_not_primary(self):
+        self.mock_service()
+        self.db.primary = False
+
+        self.provisioner.provision()
+
+        self.cloudformation.vpc.assert_not_called()
+        self.cloudformation.service.assert_not_called()
+
     def test_provision_existing(self):
         self.mock_service()
         self.db.get_stacks.return_value = [
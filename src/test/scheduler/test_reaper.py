@@ -0,0 +1,47 @@
+import unittest
+from mock import MagicMock
+from flotilla.scheduler.db import FlotillaSchedulerDynamo
+from flotilla.scheduler.reaper import FlotillaReaper
+from flotilla.scheduler.scheduler import FlotillaScheduler
+
+DEAD = [('test', 'i-1'), ('test2', 'i-2')]
+
+
+class TestFlotillaReaper(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = MagicMock(spec=FlotillaScheduler)
+        self.scheduler.active = True
+        self.db = MagicMock(spec=FlotillaSchedulerDynamo)
+        self.db.get_dead_instances.return_value = DEAD
+        self.db.delete_instances.return_value = 2
+        self.reaper = FlotillaReaper(self.scheduler, self.db, write_units=4,
+                                     interval=5)
+
+    def test_reap_not_active(self):
+        self.scheduler.active = False
+
+        self.reaper.reap()
+
+        self.db.get_dead_instances.assert_not_called()
+
+    def test_reap(self):
+        self.reaper.reap()
+
+        self.db.get_dead_instances.assert_called_with(10)
+        self.db.delete_instances.assert_called_with(DEAD)
+        self.assertEqual(2, self.reaper.stats['reaped'])
+
+    def test_reap_none(self):
+        self.db.get_dead_instances.return_value = []
+
+        self.reaper.reap()
+
+        self.db.delete_instances.assert_not_called()
+
+    def test_reap_minimum_batch(self):
+        reaper = FlotillaReaper(self.scheduler, self.db, write_units=1,
+                                interval=1)
+
+        reaper.reap()
+
+        self.db.get_dead_instances.assert_called_with(1)
@@ -0,0 +1,149 @@
+import time
+import unittest
+from mock import MagicMock
+from flotilla.scheduler.region import RegionSupervisor, RegionWorker, \
+    local_health, loops_healthy
+from flotilla.scheduler.trace import SchedulerTraces, TRACE_FULL
+from flotilla.thread import RepeatingFunc
+
+REGION = 'us-east-1'
+SERVICE = 'test'
+
+
+def start_loops():
+    traces = SchedulerTraces()
+    with traces.record(TRACE_FULL) as trace:
+        trace.service(SERVICE)
+    schedule = MagicMock()
+    schedule.traces = traces
+    loop = RepeatingFunc('loop', MagicMock(), 0.01)
+    loop.start()
+    return [loop], [schedule]
+
+
+def stop_loops(funcs, schedulers):
+    for func in funcs:
+        func.stop()
+
+
+class TestLoopsHealthy(unittest.TestCase):
+    def test_loops_healthy(self):
+        self.assertTrue(loops_healthy({'loop': {'interval': 15, 'age': 30,
+                                                'lag': 0}}))
+
+    def test_loops_healthy_stale(self):
+        self.assertFalse(loops_healthy({'loop': {'interval': 15, 'age': 60,
+                                                 'lag': 0}}))
+
+    def test_local_health(self):
+        loop = RepeatingFunc('loop', MagicMock(), 15)
+
+        health = local_health({REGION: [loop]})
+
+        self.assertTrue(health[REGION]['healthy'])
+        self.assertEqual(['loop'], health[REGION]['loops'].keys())
+
+
+class TestRegionWorker(unittest.TestCase):
+    def setUp(self):
+        self.worker = RegionWorker(REGION, start_loops, stop_loops,
+                                   report_interval=0.01)
+
+    def tearDown(self):
+        if self.worker.is_alive():
+            self.worker.terminate()
+
+    def wait_for_report(self, worker):
+        for _ in range(100):
+            worker.poll()
+            if worker.loops:
+                return
+            time.sleep(0.01)
+
+    def test_report(self):
+        self.worker.start()
+
+        self.wait_for_report(self.worker)
+
+        self.assertEqual(['loop'], self.worker.loops.keys())
+        traces = self.worker.traces.recent()
+        self.assertEqual(1, len(traces))
+        self.assertEqual(SERVICE, traces[0]['services'][0]['service'])
+        self.assertTrue(self.worker.health()['healthy'])
+
+    def test_terminate(self):
+        self.worker.start()
+        self.wait_for_report(self.worker)
+
+        self.worker.terminate()
+        self.worker.join()
+
+        self.assertEqual(0, self.worker.exitcode)
+
+    def test_stop(self):
+        self.worker.start()
+
+        self.worker.stop()
+
+        self.assertFalse(self.worker.is_alive())
+        self.assertEqual(0, self.worker.exitcode)
+
+    def test_stale_not_started(self):
+        self.assertTrue(self.worker.stale)
+
+    def test_restart(self):
+        self.worker.start()
+        self.worker.terminate()
+        self.worker.join()
+
+        restarted = self.worker.restart()
+        try:
+            self.assertTrue(restarted.is_alive())
+            self.assertEqual(self.worker.traces, restarted.traces)
+        finally:
+            restarted.stop()
+
+
+class TestRegionSupervisor(unittest.TestCase):
+    def setUp(self):
+        self.worker = MagicMock(spec=RegionWorker)
+        self.worker.region = REGION
+        self.worker.traces = SchedulerTraces()
+        self.worker.stale = False
+        self.supervisor = RegionSupervisor([self.worker])
+
+    def test_check(self):
+        self.supervisor.check()
+
+        self.worker.poll.assert_called_with()
+        self.worker.restart.assert_not_called()
+
+    def test_check_stale(self):
+        self.worker.stale = True
+
+        self.supervisor.check()
+
+        self.assertEqual(self.worker.restart.return_value,
+                         self.supervisor.workers[REGION])
+
+    def test_check_stopped(self):
+        self.supervisor.stop()
+        self.worker.stale = True
+
+        self.supervisor.check()
+
+        self.worker.restart.assert_not_called()
+
+    def test_traces(self):
+        self.assertEqual({REGION: self.worker.traces}, self.supervisor.traces)
+
+    def test_health(self):
+        self.worker.health.return_value = {'healthy': True}
+
+        self.assertEqual({REGION: {'healthy': True}},
+                         self.supervisor.health())
+
+    def test_stop(self):
+        self.supervisor.stop()
+
+        self.worker.stop.assert_called_with()
@@ -0,0 +1,106 @@
+import unittest
+from mock import MagicMock
+from flotilla.scheduler.db import FlotillaSchedulerDynamo
+from flotilla.scheduler.rollout import FlotillaGlobalRollout, \
+    ROLLOUT_COMPLETE, ROLLOUT_PAUSED, ROLLOUT_ROLLING
+from flotilla.scheduler.scheduler import FlotillaScheduler
+
+REVISION = 'rev1'
+
+
+class TestFlotillaGlobalRollout(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = MagicMock(spec=FlotillaScheduler)
+        self.scheduler.active = True
+        self.db = MagicMock(spec=FlotillaSchedulerDynamo)
+        self.db.primary = True
+        self.db.get_global_pending.return_value = set()
+        self.rollout_item = {
+            'assignment': REVISION,
+            'shard': 0,
+            'shards': 4,
+            'state': ROLLOUT_ROLLING
+        }
+        self.db.get_global_rollout.return_value = self.rollout_item
+        self.rollout = FlotillaGlobalRollout(self.scheduler, self.db)
+
+    def test_advance_not_active(self):
+        self.scheduler.active = False
+
+        self.rollout.advance()
+
+        self.db.get_global_rollout.assert_not_called()
+
+    def test_advance_not_primary(self):
+        self.db.primary = False
+
+        self.rollout.advance()
+
+        self.db.get_global_rollout.assert_not_called()
+
+    def test_advance_no_rollout(self):
+        self.db.get_global_rollout.return_value = None
+
+        self.rollout.advance()
+
+        self.db.set_global_assignment.assert_not_called()
+
+    def test_advance_first_shard(self):
+        self.rollout.advance()
+
+        self.db.get_global_pending.assert_not_called()
+        self.db.set_global_assignment.assert_called_with(0, REVISION)
+        self.assertEqual(1, self.rollout_item['shard'])
+        self.db.set_global_rollout.assert_called_with(self.rollout_item)
+
+    def test_advance_next_shard(self):
+        self.rollout_item['shard'] = 2
+
+        self.rollout.advance()
+
+        self.db.get_global_pending.assert_called_with(REVISION, 1, 4)
+        self.db.set_global_assignment.assert_called_with(2, REVISION)
+        self.assertEqual(3, self.rollout_item['shard'])
+
+    def test_advance_waiting(self):
+        self.rollout_item['shard'] = 2
+        self.db.get_global_pending.return_value = set(['i-1'])
+
+        self.rollout.advance()
+
+        self.db.set_global_assignment.assert_not_called()
+        self.db.set_global_rollout.assert_not_called()
+
+    def test_advance_complete(self):
+        self.rollout_item['shard'] = 4
+
+        self.rollout.advance()
+
+        self.db.set_global_assignment.assert_not_called()
+        self.assertEqual(ROLLOUT_COMPLETE, self.rollout_item['state'])
+
+    def test_advance_paused(self):
+        self.rollout_item['state'] = ROLLOUT_PAUSED
+
+        self.rollout.advance()
+
+        self.db.set_global_assignment.assert_not_called()
+
+    def test_failed_revision(self):
+        self.rollout.failed_revision(REVISION, 'i-1')
+
+        self.assertEqual(ROLLOUT_PAUSED, self.rollout_item['state'])
+        self.db.set_global_rollout.assert_called_with(self.rollout_item)
+
+    def test_failed_revision_other(self):
+        self.rollout.failed_revision('rev2', 'i-1')
+
+        self.assertEqual(ROLLOUT_ROLLING, self.rollout_item['state'])
+        self.db.set_global_rollout.assert_not_called()
+
+    def test_failed_revision_no_rollout(self):
+        self.db.get_global_rollout.return_value = None
+
+        self.rollout.failed_revision(REVISION, 'i-1')
+
+        self.db.set_global_rollout.assert_not_called()
@@ -1,8 +1,14 @@
 import unittest
 from mock import MagicMock, ANY
+import threading
+import time
 from collections import defaultdict
 from boto.dynamodb2.items import Item
 from flotilla.db import DynamoDbLocks
+from flotilla.scheduler.changes import ServiceChanges
+from flotilla.scheduler.segments import SchedulerSegments
+from flotilla.scheduler.workers import SchedulerWorkers, PRIORITY_MESSAGE, \
+    PRIORITY_IDLE, PRIORITY_NEW_REVISION, PRIORITY_SWEEP
 from flotilla.scheduler.scheduler import FlotillaScheduler
 from flotilla.scheduler.db import FlotillaSchedulerDynamo
 
@@ -15,7 +21,17 @@ class TestFlotillaScheduler(unittest.TestCase):
     def setUp(self):
         self.db = MagicMock(spec=FlotillaSchedulerDynamo)
         self.db.get_instance_assignments.return_value = defaultdict(list)
+        self.db.get_instance_zones.return_value = {}
+        self.db.get_instance_health.return_value = {}
+        self.db.get_standby.return_value = 0
+        self.db.get_two_phase.return_value = False
+        self.db.get_delivering.return_value = None
+        self.db.get_ramping.return_value = {}
+        self.db.set_assignments.return_value = []
+        self.db.get_generation.return_value = 0
         self.locks = MagicMock(spec=DynamoDbLocks)
+        self.locks.get_state.return_value = {}
+        self.locks.get_owner.return_value = (None, None)
         self.scheduler = FlotillaScheduler(self.db, self.locks)
         self.scheduler.active = True
 
@@ -84,19 +100,194 @@ class TestFlotillaScheduler(unittest.TestCase):
         targets = self.scheduler._instance_targets({REVISION: 1, REVISION2: 1},
                                                    3)
         self.assertEqual(2, len(targets))
-        self.assertEqual(1, targets[REVISION])
-        self.assertEqual(2, targets[REVISION2])
+        self.assertEqual(2, targets[REVISION])
+        self.assertEqual(1, targets[REVISION2])
+
+    def test_instance_targets_largest_remainder(self):
+        targets = self.scheduler._instance_targets(
+                {REVISION: 1, REVISION2: 2, 'rev3': 4}, 10)
+        # Exact shares: 1.43, 2.86, 5.71
+        self.assertEqual({REVISION: 1, REVISION2: 3, 'rev3': 6}, targets)
+
+    def test_instance_targets_tie_weight(self):
+        targets = self.scheduler._instance_targets(
+                {REVISION: 1, REVISION2: 3}, 2)
+        # Exact shares: 0.5, 1.5
+        self.assertEqual({REVISION: 0, REVISION2: 2}, targets)
+
+    def test_instance_targets_many(self):
+        revisions = {'rev%03d' % i: i % 7 + 1 for i in range(100)}
+
+        targets = self.scheduler._instance_targets(revisions, 10000)
+
+        self.assertEqual(10000, sum(targets.values()))
+        total_weight = sum(revisions.values())
+        for rev, weight in revisions.items():
+            share = float(weight) * 10000 / total_weight
+            self.assertTrue(abs(targets[rev] - share) < 1)
+
+    def test_instance_targets_zero_weight(self):
+        targets = self.scheduler._instance_targets({REVISION: 0}, 3)
+        self.assertEqual({REVISION: 0}, targets)
 
     def test_lock_acquire(self):
         self.scheduler.active = False
         self.locks.try_lock.return_value = True
         self.scheduler.lock()
         self.assertTrue(self.scheduler.active)
+        # Scheduling is left to the loop thread:
+        self.db.get_all_revision_weights.assert_not_called()
 
     def test_lock_release(self):
         self.locks.try_lock.return_value = False
         self.scheduler.lock()
         self.assertFalse(self.scheduler.active)
+        self.db.clear_dead_instances.assert_called_with()
+
+    def test_lock_renew_interval(self):
+        self.locks.try_lock.return_value = True
+        self.scheduler.lock()
+        self.locks.try_lock.reset_mock()
+
+        self.scheduler.lock()
+
+        self.locks.try_lock.assert_not_called()
+
+    def test_lock_standby_leased(self):
+        self.scheduler.active = False
+        self.locks.get_owner.return_value = ('i-leader', time.time())
+
+        self.scheduler.lock()
+
+        self.locks.get_owner.assert_called_with('scheduler', consistent=False)
+        self.locks.try_lock.assert_not_called()
+        self.assertFalse(self.scheduler.active)
+
+    def test_lock_standby_expired(self):
+        self.scheduler.active = False
+        self.locks.get_owner.return_value = ('i-leader', time.time() - 31)
+        self.locks.try_lock.return_value = True
+
+        self.scheduler.lock()
+
+        self.assertTrue(self.scheduler.active)
+
+    def test_lock_acquire_restore(self):
+        self.scheduler.active = False
+        self.scheduler._changes = MagicMock(spec=ServiceChanges)
+        self.scheduler._changes.stale = False
+        self.scheduler._changes.restore.return_value = True
+        self.scheduler._changes.drain.return_value = set()
+        self.locks.try_lock.return_value = True
+        self.locks.get_state.return_value = {
+            'reconcile_time': time.time(),
+            'rollouts': [SERVICE],
+            'changes': {'services shard-1': '100'}
+        }
+        self.db.owns_service.return_value = True
+        self.db.get_revision_weights.return_value = {}
+
+        self.scheduler.lock()
+        self.scheduler.loop()
+
+        self.scheduler._changes.restore.assert_called_with(
+                {'services shard-1': '100'})
+        # Resumed incrementally, with the rollout of the previous leader:
+        self.db.get_all_revision_weights.assert_not_called()
+        self.db.get_revision_weights.assert_called_with(SERVICE)
+
+    def test_lock_acquire_restore_deliveries(self):
+        self.scheduler.active = False
+        self.locks.try_lock.return_value = True
+        self.locks.get_state.return_value = {
+            'deliveries': {SERVICE: REVISION}
+        }
+
+        self.scheduler.lock()
+
+        self.db.restore_ramping.assert_called_with({SERVICE: REVISION})
+
+    def test_lock_acquire_restore_failed(self):
+        self.scheduler.active = False
+        self.scheduler._changes = MagicMock(spec=ServiceChanges)
+        self.scheduler._changes.stale = False
+        self.scheduler._changes.restore.return_value = False
+        self.locks.try_lock.return_value = True
+        self.locks.get_state.return_value = {
+            'reconcile_time': time.time(),
+            'changes': {'services shard-1': '100'}
+        }
+
+        self.scheduler.lock()
+        self.scheduler.loop()
+
+        self.db.get_all_revision_weights.assert_called_with()
+
+    def test_loop_saves_state(self):
+        self.scheduler._changes = ServiceChanges()
+        self.scheduler._rollouts.add(SERVICE)
+
+        self.scheduler.loop()
+
+        state = self.locks.set_state.call_args[0][1]
+        self.assertEqual(self.scheduler._reconcile_time,
+                         state['reconcile_time'])
+        self.assertEqual([SERVICE], state['rollouts'])
+
+    def test_loop_saves_state_deliveries(self):
+        self.scheduler._changes = ServiceChanges()
+        self.db.get_ramping.return_value = {SERVICE: REVISION}
+
+        self.scheduler.loop()
+
+        state = self.locks.set_state.call_args[0][1]
+        self.assertEqual({SERVICE: REVISION}, state['deliveries'])
+
+    def test_loop_no_changes_no_state(self):
+        self.scheduler.loop()
+
+        self.locks.set_state.assert_not_called()
+
+    def test_loop_saves_state_unchanged(self):
+        self.scheduler._changes = ServiceChanges()
+        self.scheduler.loop()
+        self.locks.set_state.reset_mock()
+
+        self.scheduler.loop()
+
+        self.locks.set_state.assert_not_called()
+
+    def test_release(self):
+        self.scheduler._changes = ServiceChanges()
+        self.scheduler.release()
+
+        self.assertFalse(self.scheduler.active)
+        self.locks.set_state.assert_called_with('scheduler', ANY)
+        self.locks.release_lock.assert_called_with('scheduler')
+
+    def test_release_not_active(self):
+        self.scheduler.active = False
+
+        self.scheduler.release()
+
+        self.locks.release_lock.assert_not_called()
+
+    def test_lock_after_release(self):
+        self.scheduler.release()
+
+        self.scheduler.lock()
+
+        self.locks.try_lock.assert_not_called()
+        self.assertFalse(self.scheduler.active)
+
+    def test_release_segments(self):
+        self.mock_segments([1, 3])
+        self.scheduler.lock()
+
+        self.scheduler.release()
+
+        self.scheduler._segments.release.assert_called_with()
+        self.locks.release_lock.assert_not_called()
 
     def test_schedule_service_not_active(self):
         self.scheduler.active = False
@@ -114,3 +305,668 @@ class TestFlotillaScheduler(unittest.TestCase):
         self.scheduler.schedule_service(SERVICE)
 
         self.scheduler._schedule_service.assert_called_with(SERVICE, weights)
+
+    def test_schedule_service_not_owned(self):
+        self.db.owns_service.return_value = False
+
+        scheduled = self.scheduler.schedule_service(SERVICE)
+
+        self.assertFalse(scheduled)
+        self.db.get_revision_weights.assert_not_called()
+
+    def test_loop_changes_first_pass_full(self):
+        self.scheduler._changes = ServiceChanges()
+
+        self.scheduler.loop()
+
+        self.db.get_all_revision_weights.assert_called_with()
+
+    def test_loop_changes_first_pass_opens_feed(self):
+        self.scheduler._changes = MagicMock(spec=ServiceChanges)
+        self.scheduler._changes.stale = True
+        calls = []
+        self.scheduler._changes.poll.side_effect = \
+            lambda: calls.append('poll')
+        self.db.get_all_revision_weights.side_effect = \
+            lambda: calls.append('scan') or {}
+
+        self.scheduler.loop()
+
+        # Changes written during the scan must not fall between the two:
+        self.assertEqual(['poll', 'scan'], calls)
+
+    def test_loop_changes(self):
+        self.scheduler._changes = ServiceChanges()
+        self.scheduler.loop()
+        self.db.get_all_revision_weights.reset_mock()
+        self.scheduler._changes.service_changed(SERVICE)
+        self.db.get_revision_weights.return_value = {REVISION: 1}
+
+        self.scheduler.loop()
+
+        self.db.get_all_revision_weights.assert_not_called()
+        self.db.get_revision_weights.assert_called_with(SERVICE)
+        self.db.get_instance_assignments.assert_called_with(SERVICE, ANY, 0)
+        self.db.refresh_snapshot.assert_called_with()
+
+    def test_loop_changes_clean(self):
+        self.scheduler._changes = ServiceChanges()
+        self.scheduler.loop()
+        self.db.get_all_revision_weights.reset_mock()
+
+        self.scheduler.loop()
+
+        self.db.get_all_revision_weights.assert_not_called()
+        self.db.get_revision_weights.assert_not_called()
+
+    def test_loop_changes_reconcile(self):
+        self.scheduler._changes = ServiceChanges()
+        self.scheduler.loop()
+        self.db.get_all_revision_weights.reset_mock()
+        self.scheduler._reconcile_time -= 301
+
+        self.scheduler.loop()
+
+        self.db.get_all_revision_weights.assert_called_with()
+
+    def test_loop_changes_stale(self):
+        self.scheduler._changes = ServiceChanges()
+        self.scheduler.loop()
+        self.db.get_all_revision_weights.reset_mock()
+        self.scheduler._changes.stale = True
+
+        self.scheduler.loop()
+
+        self.db.get_all_revision_weights.assert_called_with()
+
+    def test_lock_segments(self):
+        self.scheduler.active = False
+        self.mock_segments([1, 3])
+
+        self.scheduler.lock()
+
+        self.assertTrue(self.scheduler.active)
+        self.db.set_segments.assert_called_with([1, 3], 4)
+        self.db.get_all_revision_weights.assert_not_called()
+
+    def test_lock_segments_during_pass(self):
+        self.mock_segments([1, 3])
+        self.scheduler._changes = ServiceChanges()
+        self.scheduler.loop()
+        self.scheduler._reconcile_time = time.time()
+        self.db.get_all_revision_weights.reset_mock()
+
+        # Lease renewal does not wait on a running pass:
+        with self.scheduler._FlotillaScheduler__loop:
+            self.scheduler.lock()
+        self.scheduler.loop()
+
+        self.db.set_segments.assert_called_with([1, 3], 4)
+        self.db.get_all_revision_weights.assert_called_with()
+
+    def test_lock_segments_unchanged(self):
+        self.mock_segments([1, 3])
+        self.scheduler.lock()
+        self.db.set_segments.reset_mock()
+
+        self.scheduler.lock()
+
+        self.db.set_segments.assert_not_called()
+
+    def test_lock_segments_lost(self):
+        self.mock_segments([1, 3])
+        self.scheduler.lock()
+        self.scheduler._segments.refresh.return_value = []
+
+        self.scheduler.lock()
+
+        self.assertFalse(self.scheduler.active)
+
+    def test_loop_changes_other_segment(self):
+        self.scheduler._changes = ServiceChanges()
+        self.scheduler.loop()
+        self.scheduler._changes.service_changed(SERVICE)
+        self.db.owns_service.return_value = False
+
+        self.scheduler.loop()
+
+        self.db.get_revision_weights.assert_not_called()
+
+    def test_loop_changes_created_other_segment(self):
+        self.mock_segments([1, 3])
+        self.scheduler._changes = ServiceChanges()
+        self.scheduler.loop()
+        self.scheduler._reconcile_time = time.time()
+        self.db.get_all_revision_weights.reset_mock()
+        self.scheduler._changes.record('services', {'service_name': SERVICE},
+                                       event='INSERT')
+        self.db.owns_service.return_value = False
+
+        self.scheduler.loop()
+
+        # Not yet seen by a scan, the owned segments are scanned again:
+        self.db.get_all_revision_weights.assert_called_with()
+
+    def test_loop_changes_created_owned(self):
+        self.mock_segments([1, 3])
+        self.scheduler._changes = ServiceChanges()
+        self.scheduler.loop()
+        self.scheduler._reconcile_time = time.time()
+        self.db.get_all_revision_weights.reset_mock()
+        self.scheduler._changes.record('services', {'service_name': SERVICE},
+                                       event='INSERT')
+        self.db.owns_service.return_value = True
+        self.db.get_revision_weights.return_value = {}
+
+        self.scheduler.loop()
+
+        self.db.get_all_revision_weights.assert_not_called()
+        self.db.get_revision_weights.assert_called_with(SERVICE)
+
+    def mock_segments(self, segments):
+        self.scheduler._segments = MagicMock(spec=SchedulerSegments)
+        self.scheduler._segments.total_segments = 4
+        self.scheduler._segments.refresh.return_value = segments
+
+    def test_loop_workers(self):
+        self.scheduler._workers = SchedulerWorkers(threads=2)
+        self.db.get_all_revision_weights.return_value = {
+            SERVICE: {REVISION: 1}, 'test2': {REVISION2: 1}}
+        self.db.get_live_instances.return_value = ['i-1']
+        # Workers must not share assignments:
+        self.db.get_instance_assignments.side_effect = lambda *args: {
+            None: [{'instance_id': 'i-1'}]}
+
+        self.scheduler.loop()
+
+        self.db.get_instance_assignments.assert_any_call(SERVICE, ANY, 0)
+        self.db.get_instance_assignments.assert_any_call('test2', ANY, 0)
+
+    def test_schedule_service_workers(self):
+        self.scheduler._workers = MagicMock(spec=SchedulerWorkers)
+
+        self.scheduler.schedule_service(SERVICE)
+
+        self.scheduler._workers.submit.assert_called_with(
+            PRIORITY_MESSAGE, self.scheduler._schedule_current, SERVICE)
+        self.db.get_revision_weights.assert_not_called()
+
+    def test_schedule_service_locked(self):
+        self.scheduler._service_lock(SERVICE).acquire()
+        self.scheduler._schedule_service = MagicMock()
+        scheduled = threading.Thread(target=self.scheduler.schedule_service,
+                                     args=('test2',))
+        scheduled.start()
+        scheduled.join(1)
+
+        # Other services are not blocked:
+        self.scheduler._schedule_service.assert_called_with('test2', ANY)
+        self.assertNotEqual(self.scheduler._service_lock(SERVICE),
+                            self.scheduler._service_lock('test2'))
+
+    def test_schedule_service_churn(self):
+        for rev in (REVISION, REVISION2):
+            self.db.get_instance_assignments.return_value[rev].append(
+                {'instance_id': 'i-%s' % rev, 'assignment': rev})
+
+        plan = self.scheduler._schedule_service(SERVICE, {REVISION: 1})
+
+        self.assertEqual(1, plan.churn)
+        self.assertEqual(1, self.scheduler.stats['churn'])
+        self.assertEqual(1, self.scheduler.stats['reassigned'])
+
+    def test_schedule_service_trace(self):
+        for rev in (REVISION, REVISION2):
+            self.db.get_instance_assignments.return_value[rev].append(
+                {'instance_id': 'i-%s' % rev, 'assignment': rev})
+
+        self.scheduler._schedule_service(SERVICE, {REVISION: 1})
+
+        trace = self.scheduler.traces.recent()[0]
+        self.assertEqual('message', trace['kind'])
+        service = trace['services'][0]
+        self.assertEqual(2, service['instances'])
+        self.assertEqual({REVISION: 2}, service['targets'])
+        self.assertEqual([{'instance_id': 'i-rev2', 'from': REVISION2,
+                           'to': REVISION, 'reason': 'rebalanced'}],
+                         service['moves'])
+        self.assertIn('write', service['phases'])
+
+    def test_loop_trace(self):
+        self.db.get_all_revision_weights.return_value = {SERVICE: {REVISION: 1}}
+        self.db.get_live_instances.return_value = ['i-1']
+        self.db.get_instance_assignments.return_value[None].append(
+            {'instance_id': 'i-1'})
+        self.scheduler.loop()
+        self.db.get_instance_assignments.return_value = {
+            REVISION: [{'instance_id': 'i-1', 'assignment': REVISION}]}
+
+        for _ in range(2):
+            self.scheduler.loop()
+
+        traces = self.scheduler.traces.recent()
+        self.assertEqual(3, len(traces))
+        self.assertEqual('full', traces[0]['kind'])
+        self.assertIn('scan', traces[0]['phases'])
+        # Unchanged since the pass after the write:
+        self.assertEqual(1, traces[0]['skipped'])
+        self.assertEqual([], traces[0]['services'])
+        self.assertEqual([], traces[1]['services'][0]['moves'])
+        moves = traces[2]['services'][0]['moves']
+        self.assertEqual('unassigned', moves[0]['reason'])
+
+    def test_schedule_service_conflict_retry(self):
+        self.db.get_instance_assignments.side_effect = lambda *args: {
+            None: [{'instance_id': 'i-1'}]}
+        self.db.set_assignments.side_effect = [['i-1'], []]
+
+        self.scheduler._schedule_service(SERVICE, {REVISION: 1})
+
+        self.assertEqual(2, self.db.set_assignments.call_count)
+        self.assertEqual(1, self.scheduler.stats['conflicts'])
+        self.assertNotIn(SERVICE, self.scheduler._rollouts)
+
+    def test_schedule_service_conflict_again(self):
+        self.db.get_instance_assignments.side_effect = lambda *args: {
+            None: [{'instance_id': 'i-1'}]}
+        self.db.set_assignments.return_value = ['i-1']
+
+        self.scheduler._schedule_service(SERVICE, {REVISION: 1})
+
+        self.assertEqual(2, self.db.set_assignments.call_count)
+        self.assertEqual(2, self.scheduler.stats['conflicts'])
+        self.assertIn(SERVICE, self.scheduler._rollouts)
+        self.assertNotIn(SERVICE, self.scheduler._fingerprints)
+
+    def test_schedule_service_two_phase(self):
+        self.db.get_two_phase.return_value = True
+        self.db.get_prepared.return_value = {}
+        assignment = {'instance_id': 'i-1', 'assignment': REVISION2}
+        self.db.get_instance_assignments.return_value[REVISION2].append(
+            assignment)
+
+        plan = self.scheduler._schedule_service(SERVICE, {REVISION: 1})
+
+        self.assertEqual(1, len(plan.preparing))
+        self.assertEqual(REVISION2, assignment['assignment'])
+        self.assertEqual(REVISION, assignment['prepared'])
+        self.db.set_assignments.assert_called_with([assignment])
+        self.assertIn(SERVICE, self.scheduler._rollouts)
+        self.assertNotIn(SERVICE, self.scheduler._fingerprints)
+
+    def test_schedule_service_two_phase_commit(self):
+        self.db.get_two_phase.return_value = True
+        self.db.get_prepared.return_value = {'i-1': frozenset([REVISION])}
+        assignment = {'instance_id': 'i-1', 'assignment': REVISION2,
+                      'prepared': REVISION}
+        self.db.get_instance_assignments.return_value[REVISION2].append(
+            assignment)
+
+        plan = self.scheduler._schedule_service(SERVICE, {REVISION: 1})
+
+        self.assertEqual([], plan.preparing)
+        self.assertEqual(REVISION, assignment['assignment'])
+        self.assertNotIn('prepared', assignment)
+        self.db.set_assignments.assert_called_with([assignment])
+
+    def test_schedule_service_target_tolerance(self):
+        self.scheduler._target_tolerance = 1
+        for i in range(7):
+            rev = REVISION if i < 3 else REVISION2
+            self.db.get_instance_assignments.return_value[rev].append(
+                {'instance_id': 'i-%d' % i, 'assignment': rev})
+
+        plan = self.scheduler._schedule_service(SERVICE, {REVISION: 1,
+                                                          REVISION2: 1})
+
+        self.assertEqual(0, plan.churn)
+        self.assertEqual(1, self.scheduler.stats['churn_avoided'])
+
+    def test_schedule_service_no_target_tolerance(self):
+        for i in range(7):
+            rev = REVISION if i < 3 else REVISION2
+            self.db.get_instance_assignments.return_value[rev].append(
+                {'instance_id': 'i-%d' % i, 'assignment': rev})
+
+        plan = self.scheduler._schedule_service(SERVICE, {REVISION: 1,
+                                                          REVISION2: 1})
+
+        self.assertEqual(1, plan.churn)
+
+    def test_schedule_service_delivery_small_step(self):
+        # 5% of 10 instances rounds to none, the delivery still gets one:
+        self.add_assigned(REVISION, 10)
+        self.db.get_delivering.return_value = REVISION2
+
+        plan = self.scheduler._schedule_service(SERVICE, {REVISION: 95,
+                                                          REVISION2: 5})
+
+        self.assertEqual(1, plan.churn)
+        self.assertEqual([REVISION2], [a['assignment']
+                                       for a in plan.reassigned])
+
+    def test_schedule_service_delivery_disabled(self):
+        self.add_assigned(REVISION, 10)
+        self.db.get_delivering.return_value = REVISION2
+
+        plan = self.scheduler._schedule_service(SERVICE, {REVISION: 1,
+                                                          REVISION2: -1})
+
+        self.assertEqual(0, plan.churn)
+
+    def test_schedule_service_standby(self):
+        self.add_assigned(None, 3)
+        self.db.get_standby.return_value = 1
+
+        plan = self.scheduler._schedule_service(SERVICE, {REVISION: 1})
+
+        staged = [a for a in plan.reassigned if a.get('staged')]
+        self.assertEqual(1, len(staged))
+        self.assertEqual(3, len(plan.reassigned))
+        self.assertEqual(1, self.scheduler.stats['staged'])
+
+    def test_schedule_service_standby_keeps_serving(self):
+        self.add_assigned(None, 1)
+        self.db.get_standby.return_value = 2
+
+        plan = self.scheduler._schedule_service(SERVICE, {REVISION: 1})
+
+        self.assertEqual(0, plan.staged)
+        self.assertEqual(1, len(plan.reassigned))
+
+    def test_schedule_service_rollout_staged_free(self):
+        self.db.get_service.return_value = {'max_unavailable': 1}
+        self.db.get_deploying_instances.return_value = set()
+        self.db.get_instance_assignments.return_value[REVISION] = [
+            {'instance_id': 'i-%d' % i, 'assignment': REVISION,
+             'staged': True} for i in range(2)]
+        self.db.get_standby.return_value = 0
+
+        plan = self.scheduler._schedule_service(SERVICE, {REVISION2: 1})
+
+        self.assertEqual(0, len(plan.deferred))
+
+    def test_schedule_service_zones(self):
+        self.add_assigned(None, 4)
+        self.db.get_instance_zones.return_value = {
+            'i-0': 'zone-a', 'i-1': 'zone-a', 'i-2': 'zone-a',
+            'i-3': 'zone-b'}
+
+        self.scheduler._schedule_service(SERVICE, {REVISION: 1,
+                                                   REVISION2: 1})
+
+        self.assertEqual({
+            REVISION: {'zone-a': 1, 'zone-b': 1},
+            REVISION2: {'zone-a': 2}
+        }, self.scheduler.zones[SERVICE])
+        self.assertEqual(1, self.scheduler.stats['zone_skewed'])
+
+    def test_schedule_service_fingerprint_hit(self):
+        self.db.get_live_instances.return_value = ['i-1']
+        self.db.get_instance_assignments.return_value[REVISION].append(
+            {'instance_id': 'i-1', 'assignment': REVISION})
+        self.scheduler._schedule_service(SERVICE, {REVISION: 1})
+        self.db.get_instance_assignments.reset_mock()
+
+        self.scheduler._schedule_service(SERVICE, {REVISION: 1})
+
+        self.db.get_instance_assignments.assert_not_called()
+        self.assertEqual(1, self.scheduler.stats['fingerprint_hits'])
+        self.assertEqual(1, self.scheduler.stats['fingerprint_misses'])
+
+    def test_schedule_service_fingerprint_weights(self):
+        self.db.get_live_instances.return_value = ['i-1']
+        self.scheduler._schedule_service(SERVICE, {REVISION: 1})
+
+        self.scheduler._schedule_service(SERVICE, {REVISION: 2})
+
+        self.assertEqual(2, self.scheduler.stats['fingerprint_misses'])
+
+    def test_schedule_service_fingerprint_instances(self):
+        self.db.get_live_instances.return_value = ['i-1']
+        self.scheduler._schedule_service(SERVICE, {REVISION: 1})
+        self.db.get_live_instances.return_value = ['i-1', 'i-2']
+
+        self.scheduler._schedule_service(SERVICE, {REVISION: 1})
+
+        self.assertEqual(2, self.scheduler.stats['fingerprint_misses'])
+
+    def test_schedule_service_fingerprint_written(self):
+        self.db.get_live_instances.return_value = ['i-1']
+        self.db.get_instance_assignments.return_value[None].append(
+            {'instance_id': 'i-1'})
+        self.db.get_generation.side_effect = [0, 1]
+        self.scheduler._schedule_service(SERVICE, {REVISION: 1})
+
+        # Written assignments are verified on the next pass:
+        self.scheduler._schedule_service(SERVICE, {REVISION: 1})
+
+        self.assertEqual(2, self.scheduler.stats['fingerprint_misses'])
+
+    def test_schedule_service_fingerprint_other_writer(self):
+        self.db.get_live_instances.return_value = ['i-1']
+        self.db.get_instance_assignments.return_value[REVISION].append(
+            {'instance_id': 'i-1', 'assignment': REVISION})
+        self.scheduler._schedule_service(SERVICE, {REVISION: 1})
+        self.db.get_generation.return_value = 1
+
+        self.scheduler._schedule_service(SERVICE, {REVISION: 1})
+
+        self.assertEqual(2, self.scheduler.stats['fingerprint_misses'])
+
+    def test_loop_fingerprint_hit(self):
+        self.db.get_all_revision_weights.return_value = {SERVICE: {REVISION: 1}}
+        self.db.get_live_instances.return_value = ['i-1']
+        self.db.get_instance_assignments.return_value[REVISION].append(
+            {'instance_id': 'i-1', 'assignment': REVISION})
+        self.scheduler.loop()
+        self.assertEqual(1, self.db.get_instance_assignments.call_count)
+        self.db.get_instance_assignments.reset_mock()
+
+        self.scheduler.loop()
+
+        # Skipped services never load assignments:
+        self.db.get_instance_assignments.assert_not_called()
+        self.assertEqual(1, self.scheduler.stats['fingerprint_hits'])
+        self.assertEqual(1, self.scheduler.stats['fingerprint_misses'])
+
+    def test_loop_fingerprint_expiry(self):
+        self.db.get_all_revision_weights.return_value = {SERVICE: {REVISION: 1}}
+        self.scheduler.loop()
+        self.scheduler._fingerprint_time -= 301
+
+        self.scheduler.loop()
+
+        self.assertEqual(2, self.scheduler.stats['fingerprint_misses'])
+        self.db.clear_assignments.assert_called_with()
+
+    def test_loop_changes_removed_assignments(self):
+        self.scheduler._changes = ServiceChanges()
+        self.scheduler.loop()
+        self.scheduler._changes.record('assignments', {'instance_id': 'i-1'},
+                                       {'service': SERVICE}, 'REMOVE')
+        self.db.owns_service.return_value = True
+        self.db.get_revision_weights.return_value = {}
+
+        self.scheduler.loop()
+
+        self.db.forget_assignments.assert_called_with({'i-1'})
+
+    def test_classify_idle(self):
+        self.add_assigned(REVISION, 1)
+        self.db.get_instance_assignments.return_value[None].append(
+            {'instance_id': 'i-2'})
+        self.db.get_live_instances.return_value = ['i-0', 'i-2']
+
+        self.assertEqual(PRIORITY_IDLE, self.classify({REVISION: 1}))
+
+    def test_classify_idle_new_scheduler(self):
+        # Instances placed by a previous scheduler are not idle:
+        self.add_assigned(REVISION, 2)
+        self.db.get_live_instances.return_value = ['i-0', 'i-1']
+
+        self.assertEqual(PRIORITY_SWEEP, self.classify({REVISION: 1}))
+
+    def test_classify_idle_unweighted(self):
+        self.db.get_instance_assignments.return_value[None].append(
+            {'instance_id': 'i-1'})
+        self.db.get_live_instances.return_value = ['i-1']
+
+        self.assertEqual(PRIORITY_SWEEP, self.classify({REVISION: 0}))
+
+    def test_classify_new_revision(self):
+        self.add_assigned(REVISION, 1)
+        self.db.get_live_instances.return_value = ['i-0']
+
+        self.assertEqual(PRIORITY_NEW_REVISION,
+                         self.classify({REVISION: 1, REVISION2: 1}))
+
+    def test_classify_no_instances(self):
+        self.db.get_live_instances.return_value = []
+
+        self.assertEqual(PRIORITY_SWEEP, self.classify({REVISION: 1}))
+        self.db.get_instance_assignments.assert_not_called()
+
+    def test_classify_routine(self):
+        self.add_assigned(REVISION, 2)
+        self.db.get_live_instances.return_value = ['i-0', 'i-1']
+
+        self.assertEqual(PRIORITY_SWEEP, self.classify({REVISION: 2}))
+
+    def test_classify_fingerprint_hit(self):
+        self.add_assigned(REVISION, 1)
+        self.db.get_live_instances.return_value = ['i-0']
+        self.scheduler._schedule_service(SERVICE, {REVISION: 1})
+        self.db.get_instance_assignments.reset_mock()
+        classified = []
+
+        self.scheduler._classify(SERVICE, {REVISION: 1}, classified)
+
+        self.assertEqual([], classified)
+        self.db.get_instance_assignments.assert_not_called()
+        self.assertEqual(1, self.scheduler.stats['fingerprint_hits'])
+
+    def test_classify_passes_assignments(self):
+        self.add_assigned(REVISION, 1)
+        self.db.get_live_instances.return_value = ['i-0']
+        classified = []
+        self.scheduler._classify(SERVICE, {REVISION: 1}, classified)
+
+        self.scheduler._schedule_locked(*classified[0][1])
+
+        self.assertEqual(1, self.db.get_instance_assignments.call_count)
+        self.assertEqual(1, self.scheduler.stats['fingerprint_misses'])
+
+    def test_classify_loads_revisions(self):
+        self.db.get_revision_weights.return_value = {}
+        classified = []
+
+        self.scheduler._classify(SERVICE, None, classified)
+
+        self.db.get_revision_weights.assert_called_with(SERVICE)
+        self.db.get_live_instances.assert_not_called()
+        self.assertEqual([], classified)
+
+    def classify(self, revisions):
+        classified = []
+        self.scheduler._classify(SERVICE, revisions, classified)
+        self.assertEqual(1, len(classified))
+        return classified[0][0]
+
+    def test_loop_urgency_order(self):
+        self.db.get_all_revision_weights.return_value = {
+            'routine': {REVISION: 1},
+            'new': {REVISION: 1, REVISION2: 1},
+            'idle': {REVISION: 1}
+        }
+        self.db.get_live_instances.return_value = ['i-1']
+        self.db.get_instance_assignments.side_effect = \
+            lambda s, *args: {None if s == 'idle' else REVISION: [
+                {'instance_id': 'i-1'}]}
+        self.scheduler._schedule_service = MagicMock()
+
+        self.scheduler.loop()
+
+        scheduled = [c[0][0] for c in
+                     self.scheduler._schedule_service.call_args_list]
+        self.assertEqual(['idle', 'new', 'routine'], scheduled)
+        self.assertEqual(1, self.scheduler.stats['urgent_idle'])
+        self.assertEqual(1, self.scheduler.stats['urgent_new_revision'])
+
+    def test_loop_urgency_live_instances(self):
+        self.db.get_all_revision_weights.return_value = {SERVICE: {REVISION: 1}}
+        self.db.get_live_instances.return_value = ['i-1']
+
+        self.scheduler.loop()
+
+        self.db.get_live_instances.assert_called_once_with(SERVICE)
+        self.db.get_generation.assert_called_once_with(SERVICE)
+        self.db.get_instance_assignments.assert_called_with(SERVICE, ['i-1'],
+                                                          0)
+
+    def test_schedule_service_rollout_unlimited(self):
+        self.add_assigned(REVISION, 4)
+        self.db.get_service.return_value = {'service_name': SERVICE}
+
+        plan = self.scheduler._schedule_service(SERVICE, {REVISION2: 1})
+
+        self.assertEqual(4, len(plan.reassigned))
+        self.db.get_deploying_instances.assert_not_called()
+
+    def test_schedule_service_rollout_wave(self):
+        self.add_assigned(REVISION, 4)
+        self.db.get_service.return_value = {'max_unavailable': '50%'}
+        self.db.get_deploying_instances.return_value = set()
+
+        plan = self.scheduler._schedule_service(SERVICE, {REVISION2: 1})
+
+        self.assertEqual(2, len(plan.reassigned))
+        self.assertEqual(2, len(plan.deferred))
+        self.assertEqual(2, self.scheduler.stats['deferred'])
+        self.assertIn(SERVICE, self.scheduler._rollouts)
+        self.db.get_deploying_instances.assert_called_with(SERVICE, {
+            'i-0': REVISION, 'i-1': REVISION, 'i-2': REVISION,
+            'i-3': REVISION})
+
+    def test_schedule_service_rollout_deploying(self):
+        self.add_assigned(REVISION, 4)
+        self.db.get_service.return_value = {'max_unavailable': 1}
+        self.db.get_deploying_instances.return_value = set(['i-9'])
+
+        plan = self.scheduler._schedule_service(SERVICE, {REVISION2: 1})
+
+        self.assertEqual(0, len(plan.reassigned))
+        self.assertEqual(4, len(plan.deferred))
+        self.assertNotIn(SERVICE, self.scheduler._fingerprints)
+
+    def test_schedule_service_rollout_invalid(self):
+        self.add_assigned(REVISION, 2)
+        self.db.get_service.return_value = {'max_unavailable': 'many'}
+
+        plan = self.scheduler._schedule_service(SERVICE, {REVISION2: 1})
+
+        self.assertEqual(2, len(plan.reassigned))
+
+    def test_schedule_service_rollout_complete(self):
+        self.scheduler._rollouts.add(SERVICE)
+        self.db.get_instance_assignments.return_value[REVISION].append(
+            {'instance_id': 'i-1', 'assignment': REVISION})
+
+        self.scheduler._schedule_service(SERVICE, {REVISION: 1})
+
+        self.assertNotIn(SERVICE, self.scheduler._rollouts)
+
+    def test_loop_changes_rollouts(self):
+        self.scheduler._changes = ServiceChanges()
+        self.scheduler.loop()
+        self.scheduler._rollouts.add(SERVICE)
+        self.db.get_revision_weights.return_value = {REVISION: 1}
+
+        self.scheduler.loop()
+
+        self.db.get_revision_weights.assert_called_with(SERVICE)
+
+    def add_assigned(self, rev, count):
+        for i in range(count):
+            self.db.get_instance_assignments.return_value[rev].append(
+                {'instance_id': 'i-%d' % i, 'assignment': rev})
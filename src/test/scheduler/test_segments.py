@@ -0,0 +1,103 @@
+import unittest
+from mock import MagicMock
+import time
+from flotilla.db import DynamoDbLocks
+from flotilla.scheduler.segments import SchedulerSegments, MEMBER_LOCK, \
+    SEGMENT_LOCK
+
+
+class TestSchedulerSegments(unittest.TestCase):
+    def setUp(self):
+        self.locks = MagicMock(spec=DynamoDbLocks)
+        self.locks.try_lock.return_value = True
+        self.locks.get_owner.return_value = (None, None)
+        self.segments = SchedulerSegments(self.locks, 4, ttl=45)
+
+    def test_refresh_alone(self):
+        segments = self.segments.refresh()
+
+        self.assertEqual([0, 1, 2, 3], segments)
+        self.locks.try_lock.assert_any_call(MEMBER_LOCK % 0, ttl=45)
+
+    def test_refresh_shared(self):
+        self.locks.get_owner.side_effect = self.live_members(0, 1)
+        self.locks.try_lock.side_effect = self.free_slots(2, 3)
+
+        segments = self.segments.refresh()
+
+        # Third of three members:
+        self.assertEqual([2], segments)
+
+    def test_refresh_rebalance_join(self):
+        self.segments.refresh()
+        self.locks.get_owner.side_effect = self.live_members(1)
+
+        segments = self.segments.refresh()
+
+        self.assertEqual([0, 2], segments)
+        self.locks.release_lock.assert_any_call(SEGMENT_LOCK % 1)
+        self.locks.release_lock.assert_any_call(SEGMENT_LOCK % 3)
+
+    def test_refresh_rebalance_death(self):
+        self.locks.get_owner.side_effect = self.live_members(1)
+        self.assertEqual([0, 2], self.segments.refresh())
+        self.locks.get_owner.side_effect = None
+        self.locks.get_owner.return_value = ('i-dead', time.time() - 46)
+
+        segments = self.segments.refresh()
+
+        self.assertEqual([0, 1, 2, 3], segments)
+
+    def test_refresh_segment_not_released(self):
+        self.locks.try_lock.side_effect = lambda name, **kwargs: \
+            name != SEGMENT_LOCK % 3
+
+        segments = self.segments.refresh()
+
+        self.assertEqual([0, 1, 2], segments)
+
+    def test_refresh_no_slot(self):
+        self.locks.try_lock.return_value = False
+
+        segments = self.segments.refresh()
+
+        self.assertEqual([], segments)
+
+    def test_refresh_lost_slot(self):
+        self.segments.refresh()
+        self.locks.try_lock.return_value = False
+
+        segments = self.segments.refresh()
+
+        self.assertEqual([], segments)
+        self.locks.release_lock.assert_any_call(SEGMENT_LOCK % 0)
+
+    def test_release(self):
+        self.segments.refresh()
+
+        self.segments.release()
+
+        self.assertEqual([], self.segments.segments)
+        self.locks.release_lock.assert_any_call(SEGMENT_LOCK % 3)
+        self.locks.release_lock.assert_any_call(MEMBER_LOCK % 0)
+
+    @staticmethod
+    def live_members(*members):
+        live = [MEMBER_LOCK % member for member in members]
+
+        def get_owner(name):
+            if name in live:
+                return 'i-other', time.time()
+            return None, None
+
+        return get_owner
+
+    @staticmethod
+    def free_slots(*members):
+        taken = [MEMBER_LOCK % member for member in range(4)
+                 if member not in members]
+
+        def try_lock(name, **kwargs):
+            return name not in taken
+
+        return try_lock
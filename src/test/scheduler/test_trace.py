@@ -0,0 +1,162 @@
+import json
+import unittest
+import urllib2
+from flotilla.scheduler.planner import AssignmentPlan
+from flotilla.scheduler.trace import SchedulerTraces, ServiceTrace, \
+    TraceServer, TRACE_FULL
+
+SERVICE = 'test'
+REVISION = 'rev1'
+REVISION2 = 'rev2'
+
+
+class TestServiceTrace(unittest.TestCase):
+    def setUp(self):
+        self.trace = ServiceTrace(SERVICE)
+
+    def test_phase(self):
+        with self.trace.phase('status'):
+            pass
+        with self.trace.phase('status'):
+            pass
+        self.trace.finish()
+
+        self.assertEqual(['status'], self.trace.phases.keys())
+        self.assertEqual(self.trace.phases['status'], self.trace.duration)
+
+    def test_planned_reasons(self):
+        plan = AssignmentPlan()
+        plan.move({'instance_id': 'i-1'}, REVISION)
+        plan.move({'instance_id': 'i-2', 'assignment': REVISION2}, REVISION)
+        plan.promote({'instance_id': 'i-3', 'assignment': REVISION,
+                      'staged': True})
+        plan.stage({'instance_id': 'i-4'}, REVISION)
+
+        self.trace.planned(plan)
+
+        self.assertEqual(['unassigned', 'rebalanced', 'promoted', 'standby'],
+                         [move[3] for move in self.trace.moves])
+
+    def test_planned_deferred(self):
+        plan = AssignmentPlan()
+        plan.move({'instance_id': 'i-1', 'assignment': REVISION2}, REVISION)
+        plan.limit(0)
+
+        self.trace.planned(plan)
+
+        self.assertEqual([], self.trace.moves)
+        self.assertEqual([('i-1', REVISION2, REVISION, 'max_unavailable')],
+                         self.trace.deferred)
+
+
+class TestSchedulerTraces(unittest.TestCase):
+    def setUp(self):
+        self.traces = SchedulerTraces(size=2)
+
+    def record(self, *services):
+        with self.traces.record(TRACE_FULL) as trace:
+            for service in services:
+                trace.service(service)
+        return trace
+
+    def test_record_bounded(self):
+        for _ in range(3):
+            self.record(SERVICE)
+
+        self.assertEqual(2, len(self.traces.recent()))
+
+    def test_record_skipped(self):
+        with self.traces.record(TRACE_FULL) as trace:
+            trace.service(SERVICE).skipped = True
+
+        recent = self.traces.recent()[0]
+        self.assertEqual(1, recent['skipped'])
+        self.assertEqual([], recent['services'])
+
+    def test_recent_newest_first(self):
+        self.record(SERVICE)
+        last = self.record(SERVICE)
+
+        self.assertEqual(last.start, self.traces.recent(limit=1)[0]['start'])
+
+    def test_recent_service(self):
+        self.record(SERVICE, 'other')
+        self.record('other')
+
+        recent = self.traces.recent(service=SERVICE)
+
+        self.assertEqual(1, len(recent))
+        self.assertEqual([SERVICE],
+                         [s['service'] for s in recent[0]['services']])
+
+    def test_recent_min_duration(self):
+        self.record(SERVICE)
+
+        self.assertEqual([], self.traces.recent(min_duration=60))
+
+    def test_since(self):
+        self.record(SERVICE)
+        recorded, traces = self.traces.since(0)
+        self.record('other')
+
+        recorded, traces = self.traces.since(recorded)
+
+        self.assertEqual(2, recorded)
+        self.assertEqual(['other'], [s['service']
+                                     for s in traces[0]['services']])
+
+    def test_since_bounded(self):
+        for _ in range(3):
+            self.record(SERVICE)
+
+        recorded, traces = self.traces.since(0)
+
+        self.assertEqual(3, recorded)
+        self.assertEqual(2, len(traces))
+
+    def test_add(self):
+        other = SchedulerTraces()
+        with other.record(TRACE_FULL) as trace:
+            trace.service(SERVICE)
+            trace.service('other')
+        _, traces = other.since(0)
+
+        self.traces.add(traces[0])
+
+        recent = self.traces.recent(service=SERVICE)
+        self.assertEqual([SERVICE], [s['service']
+                                     for s in recent[0]['services']])
+
+
+class TestTraceServer(unittest.TestCase):
+    def setUp(self):
+        self.traces = SchedulerTraces()
+        with self.traces.record(TRACE_FULL) as trace:
+            trace.service(SERVICE)
+        self.health = {'us-east-1': {'healthy': True, 'loops': {}}}
+        self.server = TraceServer({'us-east-1': self.traces}, 0,
+                                  health=lambda: self.health)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def get(self, path):
+        return urllib2.urlopen('http://127.0.0.1:%d%s' % (self.server.port,
+                                                          path))
+
+    def test_traces(self):
+        traces = json.load(self.get('/traces?service=test&limit=5'))
+
+        self.assertEqual(1, len(traces['us-east-1']))
+
+    def test_traces_invalid(self):
+        self.assertRaises(urllib2.HTTPError, self.get, '/traces?limit=x')
+
+    def test_not_found(self):
+        self.assertRaises(urllib2.HTTPError, self.get, '/')
+
+    def test_health(self):
+        health = json.load(self.get('/health'))
+
+        self.assertEqual(self.health, health)
@@ -0,0 +1,52 @@
+import unittest
+from mock import MagicMock
+import threading
+from flotilla.scheduler.workers import SchedulerWorkers, PRIORITY_MESSAGE, \
+    PRIORITY_SWEEP
+
+
+class TestSchedulerWorkers(unittest.TestCase):
+    def setUp(self):
+        self.workers = SchedulerWorkers(threads=1, queue_size=10)
+
+    def test_submit(self):
+        func = MagicMock()
+
+        done = self.workers.submit(PRIORITY_SWEEP, func, 'a', 'b')
+
+        self.assertTrue(done.wait(1))
+        func.assert_called_with('a', 'b')
+
+    def test_submit_exception(self):
+        func = MagicMock(side_effect=Exception('kaboom'))
+
+        done = self.workers.submit(PRIORITY_SWEEP, func)
+
+        self.assertTrue(done.wait(1))
+
+    def test_submit_priority(self):
+        blocked = threading.Event()
+        order = []
+        self.workers.submit(PRIORITY_SWEEP, blocked.wait, 1)
+
+        sweep = self.workers.submit(PRIORITY_SWEEP, order.append, 'sweep')
+        message = self.workers.submit(PRIORITY_MESSAGE, order.append,
+                                      'message')
+        blocked.set()
+
+        self.assertTrue(sweep.wait(1))
+        self.assertTrue(message.wait(1))
+        self.assertEqual(['message', 'sweep'], order)
+
+    def test_submit_in_order(self):
+        blocked = threading.Event()
+        order = []
+        self.workers.submit(PRIORITY_SWEEP, blocked.wait, 1)
+
+        pending = [self.workers.submit(PRIORITY_SWEEP, order.append, i)
+                   for i in range(5)]
+        blocked.set()
+
+        for done in pending:
+            self.assertTrue(done.wait(1))
+        self.assertEqual(range(5), order)
@@ -1,6 +1,6 @@
 import unittest
 from flotilla.model import FlotillaUnit, FlotillaDockerService, \
-    FlotillaServiceRevision
+    FlotillaServiceRevision, global_assignment_id, global_shard
 
 UNIT_NAME = 'test.service'
 UNIT_FILE = '''[Unit]
@@ -89,9 +89,29 @@ class TestFlotillaServiceRevision(unittest.TestCase):
         self.assertEqual(self.revision.label, REV_LABEL)
         self.assertEqual(self.revision.weight, 1)
         self.assertEqual(self.revision.units, [self.unit])
+        self.assertEqual(self.revision.cpu, None)
+        self.assertEqual(self.revision.memory, None)
 
     def test_revision_hash(self):
         self.assertEqual(self.revision.revision_hash, REV_HASH)
 
+    def test_revision_hash_requests(self):
+        self.revision.cpu = 500
+        self.revision.memory = 256
+        self.assertEqual(self.revision.revision_hash, REV_HASH)
+
     def test_repr(self):
         self.assertEqual('Revision initial (1): 1 units', str(self.revision))
+
+
+class TestGlobalShard(unittest.TestCase):
+    def test_global_shard(self):
+        self.assertEqual(7, global_shard('i-123456'))
+        self.assertEqual(global_shard('i-123456'), global_shard('i-123456'))
+
+    def test_global_shard_count(self):
+        shards = set(global_shard('i-%d' % i, 4) for i in range(100))
+        self.assertEqual(set(range(4)), shards)
+
+    def test_global_assignment_id(self):
+        self.assertEqual('global_3', global_assignment_id(3))
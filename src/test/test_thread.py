@@ -1,7 +1,7 @@
 import unittest
 from mock import MagicMock
 import time
-from flotilla.thread import RepeatingFunc
+from flotilla.thread import RepeatingFunc, loop_status
 
 
 class TestRepeatingFunc(unittest.TestCase):
@@ -42,6 +42,42 @@ class TestRepeatingFunc(unittest.TestCase):
         f.join()
         assert instant_function.call_count > 10
 
+    def test_run_lag(self):
+        f = RepeatingFunc('test', lambda: time.sleep(0.05), 0.01)
+        f.start()
+        time.sleep(0.1)
+        f.stop()
+        f.join()
+
+        status = f.status()
+        assert status['lag'] > 0.03
+        assert status['age'] < 0.1
+
+    def test_run_yield_to(self):
+        lagging = MagicMock(spec=RepeatingFunc)
+        lagging.name = 'lagging'
+        lagging.lag = 1.0
+        instant_function = MagicMock()
+        f = RepeatingFunc('test', instant_function, 0.01, yield_to=lagging)
+        f.start()
+        time.sleep(0.05)
+        lagging.lag = 0.0
+        time.sleep(0.05)
+        f.stop()
+        f.join()
+
+        assert instant_function.call_count > 1
+        assert instant_function.call_count < 8
+
+    def test_loop_status(self):
+        f = RepeatingFunc('test', MagicMock(), 15)
+
+        status = loop_status([f, MagicMock()])
+
+        self.assertEqual(['test'], status.keys())
+        self.assertEqual(0.0, status['test']['lag'])
+        self.assertEqual(15, status['test']['interval'])
+
     def run_loop(self, instant_function):
         f = RepeatingFunc('test', instant_function, 0.01)
         f.start()